@@ -8,89 +8,176 @@ lines of data from the device at a time.
 import os
 import sys
 import time
-import serial
-import struct
+import numpy
 import logging
+import threading
         
 import subprocess
 from subprocess import Popen, PIPE
 
+from wasatchcameralink import instrument
+from wasatchcameralink import pixelformat
+from wasatchcameralink.ccf import parse_ccf
+from wasatchcameralink.consolepool import quit_console
+from wasatchcameralink.protocol import read_frame, read_frame_into
+from wasatchcameralink.serialengine import SerialSession
+from wasatchcameralink.streaming import StreamingDevice
+
 log = logging.getLogger(__name__)
 
-COM_PORT = 5 # windows reported number 
+COM_PORT = 5 # default windows reported number, see Cobra com_port
+
+# Location of the grab console executable and the ccf files
+CONSOLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           "GrabConsole", "CSharp", "bin", "Debug")
+
+def decode_pixels(raw_data, pixels, lines=1, bytes_per_pixel=2,
+                  pixel_format=None, endian=pixelformat.LITTLE):
+    """ Interpret the raw buffer with the pixelformat decoder, by default
+    as little endian unsigned 16 bit values, or 8 bit values widened to
+    16 bit. With little endian 16 bit pixels the returned array is a
+    read-only view on raw_data, no per-pixel copies are made.
+    Multi-line frames are returned with shape (lines, pixels).
+    """
+    if pixel_format is None:
+        pixel_format = "mono8" if bytes_per_pixel == 1 else "mono16"
+    decoder = pixelformat.get_decoder(pixel_format)
+    data = decoder.decode(raw_data, pixels * lines, endian)
 
-class SaperaCMD(object):
+    if lines > 1:
+        data = data.reshape(lines, pixels)
+    return data
+
+class SaperaCMD(StreamingDevice):
     """ Base class that calls the sapera grab console modified
     demonstration program with the supplied parameters and returns the
     data.
     """
-    def __init__(self):
+    def __init__(self, console_pool=None):
         super(SaperaCMD, self).__init__()
         self.card = None
         self.ccf = None
         self.command = "grab"
         self.index = "0"
+        self.frame_count = None
+
+        # Frame geometry, filled in from the ccf by set_pixel_size
+        self.ccf_config = None
+        self.pixels = None
+        self.lines = 1
+        self.bytes_per_pixel = 2
+
+        # Decoder name from the ccf and the byte or bit order of the
+        # transferred pixels, see pixelformat
+        self.pixel_format = "mono16"
+        self.pixel_endian = pixelformat.LITTLE
+
+        # Treat every line of a multi-line snap as a frame of its own. A
+        # ccf crop height of K then gives K spectra per snap handshake.
+        self.line_frames = False
+        self.pending_lines = None
+        self.pending_index = 0
+
+        # Frame file written by the console in grab mode. Give each
+        # device its own file when several consoles share a directory.
+        self.raw_filename = "test.raw"
+
+        # Number of frame requests kept in flight by the stream producer
+        self.stream_depth = 4
+
+        # Argument list that starts the grab console, None for the .net
+        # application. See grabconsole.console_command for a stand-in.
+        self.console = None
+
+        # consolepool.ConsolePool that hands out pre-started consoles
+        self.console_pool = console_pool
+
+        # Stage timings and counters, see stats
+        self.instrument = instrument.Instrumentation()
 
         # Disable startupinfo if you need to see the sapera application
         # in the windowing system
-        self.startupinfo = subprocess.STARTUPINFO()
-        self.startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        self.startupinfo = None
+        if hasattr(subprocess, "STARTUPINFO"):
+            self.startupinfo = subprocess.STARTUPINFO()
+            self.startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
 
-        self.stop_sapgrab()
+        # the kill would take the pooled consoles with it
+        if self.console_pool is None:
+            self.stop_sapgrab()
 
     def stop_sapgrab(self):
         """ Kill any running instances of the sapera grab application.
         No clean, no confirmation, just kill.
         """
+        if os.name != "nt":
+            return True
+
         # > /NUL is to keep the 'sent termination...' message from printing
         # Would be nice to capture it and send it to log
         task_cmd = "taskkill /F /IM SapNETCSharpGrabConsole.exe"
         grab_kill = '''"%s 1> NUL 2> NUL"''' % task_cmd
         result = os.system(grab_kill)
-        log.info("Kill result: %s" % result)
+        log.info("Kill result: %s", result)
         return True
 
 
+    def ccf_path(self):
+        """ ccf is the name of a file shipped with the grab console, or
+        the path of any ccf file.
+        """
+        if self.ccf.endswith(".ccf"):
+            return self.ccf
+        return os.path.join(CONSOLE_DIR, "%s.ccf" % self.ccf)
+
     def set_pixel_size(self):
-        """ Process the specified ccf file, store the number of pixels.
+        """ Process the specified ccf file, store the number of pixels,
+        lines and bytes per pixel of each frame.
         """
-        path, file_name = os.path.split(__file__)
-        prefix = "%s\\GrabConsole\\CSharp\\bin\\Debug\\" % path
-        ccf_file = "%s\\%s.ccf" % (prefix, self.ccf)
+        ccf_file = self.ccf_path()
 
-        log.debug("Find ccf file: %s" % ccf_file)
+        log.debug("Find ccf file: %s", ccf_file)
         try:
-            in_file = open(ccf_file)
-            for line in in_file.readlines():
-                if "Crop Width" in line:
-                    line = line.replace("\n", "")
-                    self.pixels = int(line.split("=")[-1])
-                    log.info("pixels is [%s]" % self.pixels)
-
+            self.ccf_config = parse_ccf(ccf_file)
         except:
             log.critical("CCF proccessing" + str(ccf_file) + \
                           str(sys.exc_info()))
             return 0, "fail"
 
+        self.pixels = self.ccf_config.crop_width
+        self.lines = self.ccf_config.frame_lines
+        self.bytes_per_pixel = self.ccf_config.bytes_per_pixel
+        self.pixel_format = self.ccf_config.pixel_format
+        log.info("pixels is [%s]" % self.pixels)
+
+    def console_args(self):
+        """ Return the argument list that starts the grab console for
+        this device. A raw_filename other than test.raw is passed as a
+        fifth argument, which the shipped console exe does not read yet.
+        """
+        cmd_path = os.path.join(CONSOLE_DIR, "SapNETCSharpGrabConsole.exe")
+        ccf_file = self.ccf_path()
+
+        log.info("open %s, %s", cmd_path, ccf_file)
+
+        console = self.console or [cmd_path]
+        opts = console + [self.command, self.card, self.index, ccf_file]
+        if self.raw_filename != "test.raw":
+            opts.append(self.raw_filename)
+        return opts
+
     def setup_pipe(self):
         """ Create a pipe connection to the csharp version of the single
         line grabber on the console example from Dalsa.
         """
         log.info("Setup pipe device")
+        self.frame_count = None
+        self.pending_lines = None
+        if self.console_pool is not None:
+            self.pipe = self.console_pool.acquire(self)
+            return self.pipe is not None
 
-        # Get the location of this module on disk, use it to generate
-        # the absolute pathname to the .net application
-        path, file_name = os.path.split(__file__)
-
-        prefix = "%s\\GrabConsole\\CSharp\\bin\\Debug\\" % path
-        cmd_path = "%s\\SapNETCSharpGrabConsole.exe" % prefix
-
-        ccf_file = "%s\\%s.ccf" % (prefix, self.ccf)
-
-        log.info("open %s, %s", cmd_path, ccf_file)
-            
-        opts = [cmd_path, self.command, self.card, self.index, ccf_file]
-
+        opts = self.console_args()
         try:
             self.pipe = Popen(opts, 
                               stdin=PIPE, stdout=PIPE,
@@ -103,75 +190,306 @@ class SaperaCMD(object):
 
 
     def grab_pipe(self):
-        """ Issue a newline, get a line of data over the pipes.
+        """ Issue a newline, get a line of data over the pipes. In line
+        frame mode return the next line of the last snap, and snap only
+        when all of its lines are handed out. Raise StreamBusyError
+        while the stream producer owns the pipe.
+        """
+        self.check_pipe_owner()
+        if self.line_frames:
+            return self.grab_line()
+        return self.grab_snap()
+
+    def grab_snap(self):
+        """ Run one snap handshake, return the decoded frame.
         """
+        if self.command == "stream":
+            return self.grab_stream()
 
+        record = self.instrument.record
+        start = time.perf_counter()
         self.trigger_snap()
-        self.trigger_save()
+        self.trigger_save() # returns once the snap is done
+        stage = record(instrument.SNAP, start)
             
         self.trigger_next() # just hit enter
+        stage = record(instrument.SAVE, stage)
 
-        result, data = self.grab_data()
+        result, data = self.grab_data(self.raw_filename)
 
+        stage = time.perf_counter()
         self.trigger_repeat()
+        record(instrument.REPEAT, stage)
+        self.count_frame(result, start)
 
         return result, data
 
+    def count_frame(self, result, start):
+        """ Record the whole frame time and the frame or failure count.
+        """
+        self.instrument.record(instrument.FRAME, start)
+        self.instrument.count("frames" if result else "grab_failures")
+
+    def stats(self):
+        """ Return the stage timing summaries and counters, see
+        instrument.Instrumentation.stats.
+        """
+        return self.instrument.stats()
+
+    def grab_stream(self):
+        """ Request a single frame when the console runs in stream mode,
+        decode the binary frame record directly from the stdout pipe.
+        """
+        start = time.perf_counter()
+        try:
+            self.pipe.stdin.write(b"\n")
+            self.pipe.stdin.flush()
+            counter, payload = read_frame(self.pipe.stdout)
+            stage = self.instrument.record(instrument.SNAP, start)
+            data = self.decode(payload)
+            self.instrument.record(instrument.DECODE, stage)
+        except:
+            log.critical("Problem reading frame record " + \
+                          str(sys.exc_info()))
+            self.count_frame(0, start)
+            return 0, "fail"
+
+        self.frame_count = counter
+        self.count_frame(1, start)
+        return 1, data
+
+    def grab_lines(self):
+        """ Run one snap handshake, return every line of the snap as a
+        (lines, pixels) block.
+        """
+        result, data = self.grab_snap()
+        if not result:
+            return result, data
+        self.instrument.count("lines", self.lines)
+        return 1, data.reshape(self.lines, self.pixels)
+
+    def grab_line(self):
+        """ Return the next line not yet handed out, snap for a new block
+        of lines when there is none.
+        """
+        if self.pending_lines is None or \
+           self.pending_index >= len(self.pending_lines):
+            result, block = self.grab_lines()
+            if not result:
+                return result, block
+            self.pending_lines = block
+            self.pending_index = 0
+
+        line = self.pending_lines[self.pending_index]
+        self.pending_index += 1
+        return 1, line
+
+    def take_pending(self, out):
+        """ Copy lines of the last snap not yet handed out to the start
+        of out, return the number copied.
+        """
+        if self.pending_lines is None:
+            return 0
+        rest = self.pending_lines[self.pending_index:]
+        taken = min(len(rest), len(out))
+        out[:taken] = rest[:taken]
+        self.pending_index += taken
+        return taken
+
+    def snap_frames(self, data):
+        """ Return the frames in one decoded snap, each line is a frame
+        in line frame mode.
+        """
+        if self.line_frames:
+            return data.reshape(self.lines, self.pixels)
+        return [data]
+
+    def frame_shape(self):
+        """ Shape of one decoded frame.
+        """
+        if self.lines > 1 and not self.line_frames:
+            return (self.lines, self.pixels)
+        return (self.pixels,)
+
+    def grab_many(self, count, out=None):
+        """ Grab count frames into out, a uint16 array of shape
+        (count, pixels) that is allocated if not given. In stream mode
+        stream_depth requests are kept in flight and every payload is
+        read straight into its row of out. In line frame mode a payload
+        fills as many rows as the snap has lines. Grab mode has no
+        batched form, it runs one snap handshake per frame like
+        grab_pipe and is no faster.
+        """
+        self.check_pipe_owner()
+        if out is None:
+            out = numpy.empty((count,) + self.frame_shape(),
+                              dtype=numpy.uint16)
+
+        if self.command == "stream" and not self.line_frames:
+            return self.grab_stream_many(count, out)
+        if self.command == "stream" and out.flags.c_contiguous:
+            return self.grab_line_stream_many(count, out)
+
+        for i in range(count):
+            result, data = self.grab_pipe()
+            if not result:
+                return 0, "fail"
+            out[i] = data
+        return 1, out
+
+    def grab_line_stream_many(self, count, out):
+        """ Fill out with the lines left from the last snap, then read
+        whole snaps straight into consecutive rows. A snap that only
+        partly fits keeps its other lines for the next grab.
+        """
+        filled = self.take_pending(out)
+        snaps, rest = divmod(count - filled, self.lines)
+        if snaps:
+            rows = out[filled:filled + snaps * self.lines]
+            result, data = self.grab_stream_many(snaps,
+                rows.reshape(snaps, self.lines, self.pixels))
+            if not result:
+                return result, data
+            self.instrument.count("lines", snaps * self.lines)
+
+        if rest:
+            result, block = self.grab_lines()
+            if not result:
+                return result, block
+            out[count - rest:] = block[:rest]
+            self.pending_lines = block
+            self.pending_index = rest
+        return 1, out
+
+    def grab_stream_many(self, count, out):
+        """ Read count frame records into out with at most stream_depth
+        requests in flight, so the console never blocks on a full stdout
+        while the requests fill its stdin. A failure leaves records in
+        the pipe, the console is discarded.
+        """
+        decoder = pixelformat.get_decoder(self.pixel_format)
+        direct = decoder.is_view(self.pixel_endian) and \
+                 out.dtype == numpy.dtype("<u2") and \
+                 out.flags.c_contiguous
+        depth = max(self.stream_depth, 1)
+        requested = 0
+        try:
+            for i in range(count):
+                if requested - i < depth:
+                    more = min(depth - (requested - i), count - requested)
+                    self.pipe.stdin.write(b"\n" * more)
+                    self.pipe.stdin.flush()
+                    requested += more
+                if direct:
+                    counter = read_frame_into(self.pipe.stdout, out[i])
+                else:
+                    counter, payload = read_frame(self.pipe.stdout)
+                    out[i] = self.decode(payload)
+                self.frame_count = counter
+        except:
+            log.critical("Problem reading frame records " + \
+                          str(sys.exc_info()))
+            self.instrument.count("grab_failures")
+            self.close_pipe(healthy=False)
+            return 0, "fail"
+
+        self.instrument.count("frames", count)
+        return 1, out
+
+    def generate_frames(self, stop_event):
+        """ In stream mode keep stream_depth frame requests queued on
+        the console so the pipe round trip overlaps acquisition. Read
+        back every outstanding record on stop to leave the pipe in sync.
+        """
+        if self.command != "stream":
+            for data in super(SaperaCMD, self).generate_frames(stop_event):
+                yield data
+            return
+
+        pending = 0
+        try:
+            while True:
+                if not stop_event.is_set():
+                    while pending < self.stream_depth:
+                        self.pipe.stdin.write(b"\n")
+                        pending += 1
+                    self.pipe.stdin.flush()
+                elif pending == 0:
+                    return
+
+                counter, payload = read_frame(self.pipe.stdout)
+                pending -= 1
+                self.frame_count = counter
+                if not stop_event.is_set():
+                    start = time.perf_counter()
+                    data = self.decode(payload)
+                    self.instrument.record(instrument.DECODE, start)
+                    self.instrument.count("frames")
+                    for frame in self.snap_frames(data):
+                        yield frame
+        except:
+            log.critical("Stream failure " + str(sys.exc_info()))
+
 
     def trigger_repeat(self):
         """ Convenience function to illustrate the order of operations.
         """
         log.debug("WR enter to trigger repeat")
-        self.pipe.stdin.write("\n")
-        line = self.pipe.stdout.readline().replace('\n', '')
-        log.debug("READ " + str(line))
+        self.pipe.stdin.write(b"\n")
+        self.pipe.stdin.flush()
+        line = self.pipe.stdout.readline().rstrip()
+        log.debug("READ %s", line)
         log.debug("\n")
 
     def trigger_next(self):
         """ Convenience function to illustrate the order of operations.
         """
-        line = self.pipe.stdout.readline().replace('\n', '')
-        log.debug("READ " + str(line))
+        line = self.pipe.stdout.readline().rstrip()
+        log.debug("READ %s", line)
         log.debug("\n")
 
     def trigger_save(self):
         """ Convenience function to illustrate the order of operations.
         """
-        line = self.pipe.stdout.readline().replace('\n', '')
-        log.debug("READ " + str(line))
+        line = self.pipe.stdout.readline().rstrip()
+        log.debug("READ %s", line)
         log.debug("WR enter to trigger save")
         log.debug("\n")
-        self.pipe.stdin.write("\n")
+        self.pipe.stdin.write(b"\n")
+        self.pipe.stdin.flush()
 
     def trigger_snap(self):
         """ Convenience function to illustrate the order of operations.
         """
-        line = self.pipe.stdout.readline().replace('\n', '')
-        log.debug("READ " + str(line))
+        line = self.pipe.stdout.readline().rstrip()
+        log.debug("READ %s", line)
         log.debug("WR enter to trigger snap")
         log.debug("\n")
-        self.pipe.stdin.write("\n")
+        self.pipe.stdin.write(b"\n")
+        self.pipe.stdin.flush()
+
+    def decode(self, raw_data):
+        """ Convert the raw bytes of a frame to pixel values.
+        """
+        return decode_pixels(raw_data, self.pixels, self.lines,
+                             self.bytes_per_pixel, self.pixel_format,
+                             self.pixel_endian)
 
     def grab_data(self, in_filename="test.raw"):
         """ Read from the given raw pixel file as extracted from the
-        DALSA command line example program. Return list of pixel values
-        after unpacking.
+        DALSA command line example program. Return numpy array of pixel
+        values after unpacking.
         """
-        img_data = []
         try:
+            start = time.perf_counter()
             in_file = open(in_filename, 'rb')
             all_data = in_file.read()
             in_file.close()
-            pos = 0
-            # 2048 pixels of data, 4096 bytes
-            byte_size = (self.pixels * 2) - 1
-            while pos < byte_size:
-                pixel_one = all_data[pos] + all_data[pos+1]
-                data_pak = struct.unpack("H", pixel_one)
-                img_data.append(data_pak[0])
-                pos += 2
+            stage = self.instrument.record(instrument.FILE_READ, start)
 
-            return 1, img_data
+            data = self.decode(all_data)
+            self.instrument.record(instrument.DECODE, stage)
+            return 1, data
 
         except:
             log.critical("Problem reading " + str(in_filename) + \
@@ -181,21 +499,20 @@ class SaperaCMD(object):
         return 0, "done"
 
 
-    def close_pipe(self):
-        """ write multiple q's to close the stdout pipe.
+    def close_pipe(self, healthy=True):
+        """ write multiple q's to close the stdout pipe. Pooled consoles
+        go back to the pool unless healthy is False.
         """
         log.info("Close pipe")
+        if self.is_streaming():
+            self.stop_stream()
+
+        if self.console_pool is not None:
+            self.console_pool.release(self, self.pipe, healthy)
+            return 1
+
         # write a bunch of q's and read the lines to close it out
-        try:
-            for i in range(10):
-                log.debug("WR q" + str(i))
-                self.pipe.stdin.write("q\n")
-                line = self.pipe.stdout.readline().replace('\n','')
-            
-            #log.info("Flush pipes")
-            #self.pipe.stdin.flush()
-            #self.pipe.stdout.flush()
-        except:
+        if not quit_console(self.pipe):
             log.warn("close pipe fail: " + str(sys.exc_info()))
 
         return 1
@@ -207,103 +524,177 @@ class Cobra(SaperaCMD):
     example from Sapera. Provide device control wrappers around the
     serial port interface.
     """
-    def __init__(self, card="Xcelera-CL_LX1_1", ccf="cobra"):
-        super(Cobra, self).__init__()
+    def __init__(self, card="Xcelera-CL_LX1_1", ccf="cobra",
+                 com_port=COM_PORT, console_pool=None):
+        super(Cobra, self).__init__(console_pool)
         log.debug("Cobra Startup")
 
         self.card = card
         self.ccf = ccf
 
+        # windows reported port number or a device path like /dev/ttyS0
+        self.com_port = com_port
+        self.session = None
+
+        # Last acknowledged device settings, command name to value. The
+        # lock covers the cache check, the write and the cache update so
+        # concurrent writers cannot leave a stale value behind.
+        self.settings = {}
+        self.settings_lock = threading.RLock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.serial_time = 0.0
+
         self.set_pixel_size()
 
-    def start_scan(self):
+    def start_scan(self, force=False):
         """ Issue the required startup parameters to set the device in
         internal triggered mode.
         """
-        if not self.write_command("init"):
-            return 0
-        if not self.write_command("ats 0"):
-            return 0
-        if not self.write_command("lsc 1"):
-            return 0
-        return 1
-
-    def set_gain(self, gain):
-        """ write the gain value over serial.
+        with self.settings_lock:
+            if not force and self.settings.get("ats") == "0" and \
+               self.settings.get("lsc") == "1":
+                self.cache_hits += 1
+                return 1
+            return self.write_commands(["init", "ats 0", "lsc 1"])
+
+    def set_gain(self, gain, force=False):
+        """ write the gain value over serial, skipped if the device
+        already acknowledged this gain.
         """
         #return self.open_write_close("gain %s" % gain)
-        return self.write_command("gain %s" % gain)
+        return self.write_setting("gain", gain, force)
+
+    def set_offset(self, offset, force=False):
+        """ write the offset value over serial, skipped if the device
+        already acknowledged this offset.
+        """
+        return self.write_setting("offset", offset, force)
+
+    def write_setting(self, name, value, force=False):
+        """ Send "name value" unless the settings cache shows the
+        device already has that value.
+        """
+        with self.settings_lock:
+            if not force and self.settings.get(name) == str(value):
+                self.cache_hits += 1
+                return 1
+            return self.write_command("%s %s" % (name, value))
+
+    def invalidate_settings(self):
+        """ Forget the cached device state, the next writes go to the
+        device.
+        """
+        self.settings.clear()
 
-    def set_offset(self, offset):
-        """ write the offset value over serial.
+    def update_settings(self, command):
+        """ Record an acknowledged command in the settings cache.
+        """
+        words = command.split()
+        if not words:
+            return
+        if words[0] == "init":
+            # init restores the power on defaults
+            self.invalidate_settings()
+        elif len(words) == 2:
+            self.settings[words[0]] = words[1]
+
+    def cache_stats(self):
+        """ Return the cache hit and miss counts and an estimate of the
+        serial time saved by the hits.
         """
-        return self.write_command("offset %s" % offset)
+        saved = 0.0
+        if self.cache_misses:
+            saved = self.cache_hits * self.serial_time / self.cache_misses
+        return {"hits": self.cache_hits,
+                "misses": self.cache_misses,
+                "serial_time": self.serial_time,
+                "saved_time": saved}
 
     def open_write_close(self, command):
-        """ Open the serial port, write the command, close it.
+        """ Write the command over the persistent serial session. Kept for
+        callers of the old open, write, close pattern, the port is no
+        longer reopened for every command.
         """
-        self.open_port()
-        self.write_command(command)
-        self.close_port()
-        return True
+        return bool(self.write_command(command))
 
     def close_port(self):
         try:
-            self.serial_port.close()
+            self.session.close()
             return 1
         except:
             log.critical("Problem closing port: " + str(sys.exc_info()))
         return 0
 
+    def port_name(self):
+        """ Return the pyserial port name, windows reported numbers
+        become COMn, device paths are used as given.
+        """
+        if isinstance(self.com_port, int):
+            return "COM%s" % self.com_port
+        return self.com_port
 
-    def open_port(self):
-        """ Connect to the serial port for the Cobra cameralink board,
-        verify the version number is as expected.  """
-
-        com_port = COM_PORT - 1 # zero based in python, 1 based in
-                                # windows
-        self.serial_port = serial.Serial()
-        self.serial_port.baudrate = 9600
-        self.serial_port.port = int(com_port)
-        self.serial_port.timeout = 1
-        self.serial_port.writeTimeout = 1
+    def serial_session(self):
+        """ Return the serial session for the current port, created
+        without connecting if needed.
+        """
+        if self.session is None or \
+           self.session.port_name != self.port_name():
+            if self.session is not None:
+                self.session.close()
+            self.session = SerialSession(self.port_name(),
+                                         on_connect=self.invalidate_settings,
+                                         instrument=self.instrument)
+        return self.session
 
-        try:
-            result = self.serial_port.close()  # yes, close before open
-            result = self.serial_port.open()
-        except:
-            log.critical("Problem close/open: " + str(sys.exc_info()))
+    def open_port(self):
+        """ Connect to the serial port for the Cobra cameralink board.
+        The connection stays open across commands, an already open
+        session is reused.  """
+        if not self.serial_session().connect():
             return 0
-            
-        return 0
+        return 1
 
+    @property
+    def serial_port(self):
+        if self.session is None:
+            return None
+        return self.session.port
 
-    def write_command(self, command, read_bytes=7):
+    def write_command(self, command):
         """ append required control characters to the specified command,
         write to the device over the serial port, and expect OK from the
         device.
         """
+        return self.write_commands([command])
 
-        try:
-            fin_command = command + '\r'
-            log.debug("send command [%s]" % fin_command)
-            result = self.serial_port.write(str(fin_command))
-            self.serial_port.flush()
-        except:
-            log.critical("Problem writing %s" % command)
-            log.critical("%s", sys.exc_info())
-            return 0
-
-        try:
-            result = self.serial_port.read(read_bytes)
-            log.debug("Serial read result [%r]" % result)
-            if "<ok>" not in result:
-                log.critical("Command failure: %s,%s" %(command,result))
+    def write_commands(self, commands):
+        """ Write the commands back to back and match the replies in
+        order. Return 1 only if every command was acknowledged. The
+        session connects, and reconnects with backoff, as needed.
+        """
+        with self.settings_lock:
+            self.cache_misses += len(commands)
+            start = time.time()
+            try:
+                results = self.serial_session().batch(commands)
+            except:
+                log.critical("Problem writing %s", commands)
+                log.critical("%s", sys.exc_info())
+                self.instrument.count("serial_failures")
+                self.invalidate_settings()
                 return 0
-        except:
-            log.critical("Problem reading from com " + str(com_port))
-            log.critical(str(sys.exc_info()))
-            return -2
+            finally:
+                self.serial_time += time.time() - start
+
+            self.instrument.count("serial_commands", len(commands))
+            for command, (ok, reply) in zip(commands, results):
+                if not ok:
+                    self.instrument.count("serial_failures")
+                    # Device state is unknown after a failure
+                    self.invalidate_settings()
+                    return 0
+                self.update_settings(command)
 
         log.debug("command write")
         return 1
@@ -313,8 +704,9 @@ class BaslerSprint4K(SaperaCMD):
     """ Use a Dalsa frame grabber and the stdin/stdout customized
     example from Sapera.
     """
-    def __init__(self, card="Xcelera-CL_LX1_1", ccf="BaslerSprint4K"):
-        super(BaslerSprint4K, self).__init__()
+    def __init__(self, card="Xcelera-CL_LX1_1", ccf="BaslerSprint4K",
+                 console_pool=None):
+        super(BaslerSprint4K, self).__init__(console_pool)
         log.debug("Basler sprint 4k Startup")
 
         self.card = card
@@ -326,11 +718,7 @@ class OPTOCobra(Cobra):
     """ Re-use the same cobra inteface, specify a different ccf file.
     """
     #def __init__(self, card="Xcelera-CL_LX1_1", ccf="opto"):
-    def __init__(self, card="Xcelera-CL_PX4_1", ccf="opto"):
-        super(OPTOCobra, self).__init__()
+    def __init__(self, card="Xcelera-CL_PX4_1", ccf="opto",
+                 com_port=COM_PORT, console_pool=None):
+        super(OPTOCobra, self).__init__(card, ccf, com_port, console_pool)
         log.debug("OPTO Cobra Startup")
-
-        self.card = card
-        self.ccf = ccf
-
-        self.set_pixel_size()
@@ -104,10 +104,24 @@ namespace DALSA.SaperaLT.Examples.NET.CSharp.GrabConsole
                 return;
             }
 
+            // Stream mode: every line on stdin snaps one frame and writes it to
+            // stdout as a binary record, see protocol.py for the layout.
+            if (args.Length > 0 && args[0] == "stream")
+            {
+                StreamFrames(Xfer, Buffers);
+                DestroysObjects(Acq, AcqDevice, Buffers, Xfer, View);
+                loc.Dispose();
+                return;
+            }
+
             // Grab as fast as possible, wait for a key to be pressed, if it's p, 
             // write the file, otherwise if it's q exit the program. Designed to be run by and monitored 
             // through a pipe
 
+            // Optional fifth argument gives each console its own frame file
+            string out_filename = "test.raw";
+            if (args.Length > 4) { out_filename = args[4]; }
+
             Boolean stop_snap = false;
             int curr_code = 0;
             string new_cmd = "";
@@ -119,7 +133,7 @@ namespace DALSA.SaperaLT.Examples.NET.CSharp.GrabConsole
 
                 Console.WriteLine("Press a key to trigger save");
                 new_cmd = Console.ReadLine();
-                View.Buffer.Save("test.raw", "-format raw");
+                View.Buffer.Save(out_filename, "-format raw");
 
                 var dsb = new StringBuilder("frame: " + frame_count);
                 Console.WriteLine(dsb);
@@ -138,6 +152,36 @@ namespace DALSA.SaperaLT.Examples.NET.CSharp.GrabConsole
         }
 
 
+        static void StreamFrames(SapTransfer Xfer, SapBuffer Buffers)
+        {
+            Stream stdout = Console.OpenStandardOutput();
+            int length = Buffers.Width * Buffers.Height * Buffers.BytesPerPixel;
+            byte[] payload = new byte[length];
+            byte[] magic = Encoding.ASCII.GetBytes("WPFR");
+
+            string new_cmd = Console.ReadLine();
+            while (new_cmd != null && new_cmd != "q")
+            {
+                Xfer.Snap();
+                Xfer.Wait(5000);
+
+                IntPtr address;
+                Buffers.GetAddress(out address);
+                Marshal.Copy(address, payload, 0, length);
+                Buffers.ReleaseAddress(address);
+
+                stdout.Write(magic, 0, 4);
+                stdout.Write(BitConverter.GetBytes((UInt32)frame_count), 0, 4);
+                stdout.Write(BitConverter.GetBytes((UInt32)length), 0, 4);
+                stdout.Write(payload, 0, length);
+                stdout.Flush();
+                frame_count = frame_count + 1;
+
+                new_cmd = Console.ReadLine();
+            }
+        }
+
+
         static bool GetOptions(string[] args, MyAcquisitionParams acqParams)
         {
            // Check if arguments were passed
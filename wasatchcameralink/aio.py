@@ -0,0 +1,258 @@
+""" asyncio counterparts of the pipe and serial device interfaces. Wrap
+an existing device object so several cameras and serial controllers can
+share one event loop. Frames of a console started by the wrapper are
+read by the event loop, blocking file reads and serial commands run in
+the default executor.
+
+    device = AsyncSaperaCMD(Cobra())
+    await device.setup_pipe()
+    result, data = await device.grab()
+    await device.close_pipe()
+"""
+
+import sys
+import time
+import asyncio
+import logging
+
+from wasatchcameralink import instrument
+from wasatchcameralink.timing import REAL_TIME
+from wasatchcameralink.streaming import Frame
+from wasatchcameralink.protocol import FRAME_HEADER, parse_header
+
+log = logging.getLogger(__name__)
+
+
+class AsyncDevice(object):
+    """ Shared frame iteration for the async device wrappers.
+    """
+    def __init__(self, device):
+        super(AsyncDevice, self).__init__()
+        self.device = device
+
+    async def grab(self):
+        """ Run the blocking grab_pipe of the device in the default
+        executor. Subclasses talk to the device without a thread.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.device.grab_pipe)
+
+    def snap_frames(self, data):
+        return [data]
+
+    async def frames(self, count=None):
+        """ Yield Frames until count frames are produced or a grab fails.
+        """
+        sequence = 0
+        while count is None or sequence < count:
+            result, data = await self.grab()
+            if not result:
+                return
+            for frame in self.snap_frames(data):
+                if count is not None and sequence >= count:
+                    return
+                yield Frame(sequence, time.time(), frame)
+                sequence += 1
+
+
+class PipeReader(object):
+    """ Read a blocking pipe file in the default executor with the
+    StreamReader calls the grab methods use. Pooled consoles are plain
+    Popen pipes shared with the synchronous device code. Reading through
+    the same buffered file keeps any output read ahead for the next
+    owner of the console.
+    """
+    def __init__(self, pipe):
+        super(PipeReader, self).__init__()
+        self.pipe = pipe
+
+    async def call(self, method, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, method, *args)
+
+    async def readline(self):
+        return await self.call(self.pipe.readline)
+
+    async def readexactly(self, count):
+        data = await self.call(self.pipe.read, count)
+        if len(data) < count:
+            raise asyncio.IncompleteReadError(data, count)
+        return data
+
+
+class AsyncSaperaCMD(AsyncDevice):
+    """ Drive the grab console of a SaperaCMD device through an asyncio
+    subprocess, read by the event loop. With a console_pool the device
+    takes a pooled console instead, whose blocking pipe is read in the
+    default executor. The grab mode frame file read and the serial
+    commands of Cobra devices also block and run in the executor on
+    purpose, the serial calls then share the session lock and the
+    settings cache with the blocking interface.
+    """
+    def __init__(self, device):
+        super(AsyncSaperaCMD, self).__init__(device)
+        self.process = None
+        self.pooled = None
+        self.stdout = None
+        self.healthy = True
+
+    async def setup_pipe(self):
+        log.info("Setup async pipe device")
+        self.healthy = True
+        if self.device.console_pool is not None:
+            return await self.setup_pooled(self.device.console_pool)
+
+        opts = self.device.console_args()
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                *opts, stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                startupinfo=self.device.startupinfo)
+        except:
+            log.critical("Failure to setup pipe: " + str(sys.exc_info()))
+            return False
+        self.stdout = self.process.stdout
+        return True
+
+    async def setup_pooled(self, pool):
+        loop = asyncio.get_running_loop()
+        process = await loop.run_in_executor(None, pool.acquire,
+                                             self.device)
+        if process is None:
+            return False
+        self.pooled = process
+        self.device.pipe = process
+        self.stdout = PipeReader(process.stdout)
+        return True
+
+    def snap_frames(self, data):
+        return self.device.snap_frames(data)
+
+    async def write_line(self, line=b"\n"):
+        if self.pooled is not None:
+            # a few bytes to an otherwise idle pipe do not block
+            self.pooled.stdin.write(line)
+            self.pooled.stdin.flush()
+            return
+        self.process.stdin.write(line)
+        await self.process.stdin.drain()
+
+    async def read_line(self):
+        line = await self.stdout.readline()
+        log.debug("READ %s", line)
+        return line
+
+    async def grab(self):
+        """ Return the result and the decoded pixels of one frame.
+        """
+        try:
+            if self.device.command == "stream":
+                return await self.grab_stream()
+
+            await self.read_line()      # snap prompt
+            await self.write_line()
+            await self.read_line()      # save prompt
+            await self.write_line()
+            await self.read_line()      # frame counter
+
+            loop = asyncio.get_running_loop()
+            result, data = await loop.run_in_executor(
+                None, self.device.grab_data, self.device.raw_filename)
+
+            await self.write_line()
+            await self.read_line()      # repeat prompt
+            return result, data
+        except:
+            log.critical("Async grab failure " + str(sys.exc_info()))
+            self.healthy = False
+            return 0, "fail"
+
+    async def grab_stream(self):
+        record = self.device.instrument.record
+        start = time.perf_counter()
+        await self.write_line()
+        header = await self.stdout.readexactly(FRAME_HEADER.size)
+        counter, length = parse_header(header)
+        payload = await self.stdout.readexactly(length)
+        stage = record(instrument.SNAP, start)
+
+        self.device.frame_count = counter
+        data = self.device.decode(payload)
+        record(instrument.DECODE, stage)
+        return 1, data
+
+    async def release(self, healthy):
+        process, self.pooled = self.pooled, None
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.device.console_pool.release,
+                                   self.device, process, healthy)
+
+    async def close_pipe(self):
+        """ Write q's until the console exits, wait for the process.
+        Pooled consoles go back to the pool instead.
+        """
+        log.info("Close async pipe")
+        if self.pooled is not None:
+            await self.release(self.healthy)
+            return 1
+        try:
+            for i in range(10):
+                await self.write_line(b"q\n")
+                if not await self.read_line():
+                    break
+            await self.process.wait()
+        except:
+            log.warning("close pipe fail: " + str(sys.exc_info()))
+        return 1
+
+    async def serial_call(self, method, *args):
+        """ Run a Cobra serial method in the default executor. The call
+        goes through the device serial session, so it shares the session
+        lock, reconnects and backoff, the settings cache and the counters
+        with the blocking interface.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, method, *args)
+
+    async def set_gain(self, gain, force=False):
+        return await self.serial_call(self.device.set_gain, gain, force)
+
+    async def set_offset(self, offset, force=False):
+        return await self.serial_call(self.device.set_offset, offset,
+                                      force)
+
+    async def write_command(self, command):
+        return await self.serial_call(self.device.write_command, command)
+
+
+class AsyncSimulatedDevice(AsyncDevice):
+    """ Async interface to SimulatedPipeDevice and its subclasses. Each
+    call yields to the event loop once so simulated devices interleave
+    like real ones. Devices paced by a real time TimingModel sleep, so
+    their calls run in the default executor instead.
+    """
+    async def call(self, method, *args):
+        timing = getattr(self.device, "timing", None)
+        if timing is not None and timing.mode == REAL_TIME:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, method, *args)
+        await asyncio.sleep(0)
+        return method(*args)
+
+    async def setup_pipe(self):
+        return self.device.setup_pipe()
+
+    async def grab(self):
+        return await self.call(self.device.grab_pipe)
+
+    async def set_gain(self, gain, force=False):
+        """ force is accepted for interface parity with AsyncSaperaCMD,
+        the simulated devices keep no settings cache to skip writes.
+        """
+        return await self.call(self.device.set_gain, gain)
+
+    async def set_offset(self, offset, force=False):
+        return await self.call(self.device.set_offset, offset)
+
+    async def close_pipe(self):
+        return self.device.close_pipe()
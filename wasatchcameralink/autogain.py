@@ -0,0 +1,318 @@
+""" Closed loop gain and offset control from frame statistics.
+
+Stepping set_gain through its whole range costs a serial command and a
+frame per step. The controller treats the signal level as a monotonic
+function of the setting instead. It measures the level at the current
+setting, then picks each next setting from a secant through the last
+two measurements, or by bisection when the model does not hold. A frame
+with more than max_saturated of its pixels at full scale counts as over
+the target whatever its percentile. The search stops within tolerance
+of the target, when the bracket has no setting left to try or after
+max_steps frames.
+
+The level rises with the gain. The direction of the offset depends on
+the camera: the Cobra reads lower as its offset goes up, the simulated
+SLED reads higher. A direction of 1 or -1 can be given per setting,
+otherwise it is inferred from the first two measurements.
+
+    control = AutoGain(device, target=3000, dark_target=2300)
+    offset, gain = control.run()
+    gain.value, gain.level, gain.steps, gain.converged
+"""
+
+import sys
+import numpy
+import logging
+import collections
+
+from wasatchcameralink.correction import device_setting
+
+log = logging.getLogger(__name__)
+
+FrameStats = collections.namedtuple("FrameStats", "level dark saturated")
+
+Adjustment = collections.namedtuple("Adjustment",
+    "name value level steps converged")
+
+
+def current_setting(device, name):
+    """ Return the integer setting of the device, None when unknown.
+    """
+    value = device_setting(device, name)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def frame_stats(data, percentile=99.0, dark_percentile=1.0,
+                full_scale=4095):
+    """ Return the signal level and dark level percentiles of a frame
+    and the fraction of its pixels at full scale.
+    """
+    data = numpy.asarray(data)
+    level, dark = numpy.percentile(data, (percentile, dark_percentile))
+    saturated = int(numpy.count_nonzero(data >= full_scale))
+    return FrameStats(float(level), float(dark),
+                      saturated / float(data.size))
+
+
+class AutoGain(object):
+    """ Drive set_gain to bring the percentile level of the frames to
+    target, and set_offset to bring the dark_percentile level to
+    dark_target. Works with any device that has set_gain, set_offset and
+    grab_pipe, such as Cobra and SimulatedCobraSLED. Levels and
+    tolerance are in counts. full_scale defaults to the ccf pixel depth,
+    12 bit without a ccf. slope is an optional first guess in counts per
+    setting step, used before two measurements are available.
+    directions maps a setting name to 1 when the level rises with the
+    setting and -1 when it falls, missing settings are inferred.
+    """
+    def __init__(self, device, target=None, dark_target=None,
+                 tolerance=None, percentile=99.0, dark_percentile=1.0,
+                 max_saturated=0.001, full_scale=None, gain_range=(0, 255),
+                 offset_range=(0, 255), max_steps=8, frames=1, settle=0,
+                 slope=None, directions=None):
+        super(AutoGain, self).__init__()
+        self.device = device
+
+        if full_scale is None:
+            config = getattr(device, "ccf_config", None)
+            depth = config.pixel_depth if config is not None else 12
+            full_scale = (1 << depth) - 1
+        self.full_scale = full_scale
+
+        self.target = 0.75 * full_scale if target is None else target
+        self.dark_target = dark_target
+        self.tolerance = 0.01 * full_scale if tolerance is None else \
+                         tolerance
+        self.percentile = percentile
+        self.dark_percentile = dark_percentile
+        self.max_saturated = max_saturated
+        self.gain_range = gain_range
+        self.offset_range = offset_range
+        self.max_steps = max_steps
+        self.frames = frames
+        self.settle = settle
+        self.slope = slope
+        self.directions = {"gain": 1}
+        if directions is not None:
+            self.directions.update(directions)
+
+        self.gain = current_setting(device, "gain")
+        self.offset = current_setting(device, "offset")
+        self.history = []
+        self.commands = 0
+        self.grabs = 0
+
+    def measure(self):
+        """ Return the FrameStats of the mean of frames grabbed after
+        discarding settle frames, None on a grab failure.
+        """
+        total = None
+        for i in range(self.settle + self.frames):
+            result, data = self.device.grab_pipe()
+            self.grabs += 1
+            if not result:
+                log.critical("Auto gain grab failure")
+                return None
+            if i < self.settle:
+                continue
+            if total is None:
+                total = numpy.array(data, dtype=numpy.float64)
+            else:
+                total += data
+        return frame_stats(total / self.frames, self.percentile,
+                           self.dark_percentile, self.full_scale)
+
+    def apply(self, name, value):
+        """ Send the setting, False if the device reports a failure.
+        """
+        self.commands += 1
+        try:
+            result = getattr(self.device, "set_%s" % name)(value)
+        except:
+            log.critical("Auto gain set %s failure: " % name + \
+                         str(sys.exc_info()))
+            return False
+        if result == 0:
+            log.critical("Auto gain set %s %s not acknowledged",
+                         name, value)
+            return False
+        setattr(self, name, value)
+        return True
+
+    def next_value(self, target, points, below, above, low, high,
+                   bisect):
+        """ Pick the next setting inside the open bracket, None when no
+        untried setting is left. points are the unsaturated (value,
+        level) measurements, newest last. Levels and target are signed
+        by the direction, so they rise with the setting.
+        """
+        lower = below[0] + 1 if below is not None else low
+        upper = above[0] - 1 if above is not None else high
+        if lower > upper:
+            return None
+
+        candidate = None
+        if not bisect:
+            if below is not None and above is not None and \
+               below[1] is not None and above[1] is not None:
+                first, second = below, above
+            elif len(points) >= 2:
+                first, second = points[-2], points[-1]
+            else:
+                first = second = None
+
+            if first is not None and second[0] != first[0]:
+                slope = (second[1] - first[1]) / float(second[0] - first[0])
+            elif points and self.slope:
+                second, slope = points[-1], abs(self.slope)
+            else:
+                slope = None
+
+            if slope is not None and slope > 0:
+                candidate = second[0] + (target - second[1]) / slope
+
+        if candidate is None:
+            candidate = (lower + upper) / 2.0
+        return int(min(max(round(candidate), lower), upper))
+
+    def infer_direction(self, name, measured):
+        """ Return 1 when the level rose with the setting between the
+        first two measurements, -1 when it fell. A saturated frame is
+        brighter than any unsaturated one. Assume 1 when they do not
+        tell.
+        """
+        (first, first_level, first_saturated), \
+            (second, second_level, second_saturated) = measured[:2]
+        if first_saturated != second_saturated:
+            rise = 1 if second_saturated else -1
+        else:
+            rise = (second_level > first_level) - \
+                   (second_level < first_level)
+        if first_saturated and second_saturated or not rise or \
+           first == second:
+            log.warning("Auto %s direction unknown, assume rising", name)
+            return 1
+        return rise if second > first else -rise
+
+    def probe_value(self, value, low, high):
+        """ Second setting of a search whose direction is unknown.
+        """
+        probe = (low + high) // 2
+        if probe == value:
+            probe = high if value < high else low
+        return None if probe == value else probe
+
+    def search(self, name, statistic, target, value_range):
+        """ Run the bracketed secant search for one setting, return its
+        Adjustment. The setting is left at the best value found.
+        """
+        low, high = value_range
+        start = getattr(self, name)
+        value = low if start is None else int(min(max(start, low), high))
+        direction = self.directions.get(name)
+
+        measured = []
+        points = []
+        below = above = best = None
+        converged = False
+        width = None
+        bisect = False
+        steps = 0
+        while steps < self.max_steps:
+            if not self.apply(name, value):
+                break
+            stats = self.measure()
+            steps += 1
+            if stats is None:
+                break
+
+            level = getattr(stats, statistic)
+            saturated = stats.saturated > self.max_saturated
+            self.history.append((name, value, level, stats.saturated))
+            log.debug("Auto %s %s level %s saturated %s", name, value,
+                      level, stats.saturated)
+
+            if not saturated:
+                if best is None or \
+                   abs(level - target) < abs(best[1] - target):
+                    best = (value, level)
+                if abs(level - target) <= self.tolerance:
+                    converged = True
+                    break
+
+            measured.append((value, level, saturated))
+            if direction is None:
+                if len(measured) < 2:
+                    value = self.probe_value(value, low, high)
+                    if value is None:
+                        break
+                    continue
+                direction = self.infer_direction(name, measured)
+                log.debug("Auto %s direction %s", name, direction)
+                placed = measured
+            else:
+                placed = measured[-1:]
+
+            # in signed levels the level rises with the setting, a
+            # saturated frame is over the target either way
+            for setting, reading, clipped in placed:
+                over = clipped or reading > target
+                signed = None if clipped else direction * reading
+                if signed is not None:
+                    points.append((setting, signed))
+                if over == (direction > 0):
+                    if above is None or setting < above[0]:
+                        above = (setting, signed)
+                elif below is None or setting > below[0]:
+                    below = (setting, signed)
+
+            # fall back to bisection when a model step leaves more than
+            # half of a closed bracket
+            if below is not None and above is not None:
+                bracket = above[0] - below[0]
+                bisect = not bisect and width is not None and \
+                         bracket > width / 2.0
+                width = bracket
+
+            value = self.next_value(direction * target, points, below,
+                                    above, low, high, bisect)
+            if value is None:
+                break
+
+        if best is None:
+            return Adjustment(name, getattr(self, name), None, steps, False)
+        if getattr(self, name) != best[0]:
+            self.apply(name, best[0])
+        return Adjustment(name, best[0], best[1], steps, converged)
+
+    def adjust_gain(self, target=None):
+        """ Bring the signal percentile level to target, by default the
+        controller target.
+        """
+        target = self.target if target is None else target
+        return self.search("gain", "level", target, self.gain_range)
+
+    def adjust_offset(self, target=None):
+        """ Bring the dark percentile level to target, by default the
+        controller dark_target.
+        """
+        target = self.dark_target if target is None else target
+        return self.search("offset", "dark", target, self.offset_range)
+
+    def run(self):
+        """ Adjust the offset first when there is a dark target, as it
+        moves the whole frame, then the gain. Return the Adjustments.
+        """
+        adjustments = []
+        if self.dark_target is not None:
+            adjustments.append(self.adjust_offset())
+        adjustments.append(self.adjust_gain())
+        return adjustments
+
+    def stats(self):
+        return {"commands": self.commands,
+                "grabs": self.grabs,
+                "steps": len(self.history)}
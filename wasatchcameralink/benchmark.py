@@ -0,0 +1,325 @@
+""" Hardware free acquisition benchmarks. The pipe paths run SaperaCMD
+against the stand-in grab console, the serial path runs Cobra against
+the pty fake controller.
+
+Usage:
+    python -m wasatchcameralink.benchmark [--frames N] [--output FILE]
+                                          [--compare OLD_FILE]
+
+Each result reports frames per second, per frame latency percentiles,
+decoded bytes per second and allocations per frame. Allocations are
+measured in a separate tracemalloc pass: the transient peak bytes and
+the net number of memory blocks left behind per frame.
+"""
+
+import os
+import sys
+import json
+import time
+import numpy
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+from wasatchcameralink import compressed
+from wasatchcameralink.ccf import activate_crop
+from wasatchcameralink import pixelformat
+from wasatchcameralink import simulation
+from wasatchcameralink.peaks import PeakEngine
+from wasatchcameralink.DALSA import CONSOLE_DIR, Cobra, OPTOCobra, \
+                                     decode_pixels
+from wasatchcameralink.fakecobra import FakeCobraController
+from wasatchcameralink.grabconsole import console_command
+
+log = logging.getLogger(__name__)
+
+
+def percentile(values, fraction):
+    return float(numpy.percentile(values, fraction * 100.0))
+
+
+def measure_allocations(step, frames):
+    """ Return the mean peak traced bytes and the net allocated blocks
+    per call of step.
+    """
+    peaks = []
+    tracemalloc.start()
+    try:
+        blocks_start = sys.getallocatedblocks()
+        for i in range(frames):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            step()
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        blocks = sys.getallocatedblocks() - blocks_start
+    finally:
+        tracemalloc.stop()
+    return float(numpy.mean(peaks)), float(blocks) / frames
+
+
+def measure(name, step, frames, frame_bytes=0, warmup=5,
+            alloc_frames=50):
+    """ Time frames calls of step, return the result dict.
+    """
+    for i in range(warmup):
+        step()
+
+    latencies = numpy.zeros(frames)
+    start = time.perf_counter()
+    for i in range(frames):
+        begin = time.perf_counter()
+        step()
+        latencies[i] = time.perf_counter() - begin
+    elapsed = time.perf_counter() - start
+
+    peak, blocks = measure_allocations(step, min(frames, alloc_frames))
+
+    return {"name": name,
+            "frames": frames,
+            "elapsed": elapsed,
+            "frames_per_sec": frames / elapsed,
+            "latency_p50_ms": percentile(latencies, 0.50) * 1000,
+            "latency_p90_ms": percentile(latencies, 0.90) * 1000,
+            "latency_p99_ms": percentile(latencies, 0.99) * 1000,
+            "bytes_per_sec": frame_bytes * frames / elapsed,
+            "alloc_peak_bytes_per_frame": peak,
+            "alloc_blocks_per_frame": blocks}
+
+
+def check(result):
+    if not result:
+        raise RuntimeError("Benchmark step failed")
+
+
+def bench_decode(frames, pixels=2048):
+    raw = numpy.arange(pixels, dtype="<u2").tobytes()
+    step = lambda: decode_pixels(raw, pixels)
+    return measure("decode_%s" % pixels, step, frames, len(raw))
+
+
+def bench_formats(frames, pixels=2048, lines=128,
+                  formats=("mono8", "mono10p", "mono12p", "mono16")):
+    """ Decode (lines, pixels) frames in every pixel format and byte
+    order, reporting the decode time per megapixel.
+    """
+    values = numpy.arange(pixels * lines) % 1024
+    megapixels = pixels * lines / 1e6
+    results = []
+    for name in formats:
+        decoder = pixelformat.get_decoder(name)
+        for endian in pixelformat.ENDIANS:
+            raw = decoder.encode(values, endian)
+            step = lambda: decode_pixels(raw, pixels, lines,
+                                         pixel_format=name, endian=endian)
+            result = measure("format_%s_%s" % (name, endian), step,
+                             frames, len(raw))
+            result["ms_per_megapixel"] = \
+                result["latency_p50_ms"] / megapixels
+            results.append(result)
+    return results
+
+
+def bench_pipe(command, frames, work_dir):
+    """ Grab frames through the stand-in console in grab (file) or
+    stream mode.
+    """
+    dev = Cobra()
+    dev.console = console_command()
+    dev.command = command
+    dev.raw_filename = os.path.join(work_dir, "%s.raw" % command)
+    check(dev.setup_pipe())
+    try:
+        step = lambda: check(dev.grab_pipe()[0])
+        return measure("pipe_%s" % command, step, frames,
+                       dev.pixels * dev.bytes_per_pixel)
+    finally:
+        dev.close_pipe()
+
+
+def bench_pipe_lines(command, frames, work_dir):
+    """ Grab single line frames from the opto ccf with its 480 line crop
+    activated, one snap handshake serves every line of the snap. Every
+    step takes the lines of one whole snap, so frames_per_sec counts
+    snaps and lines_per_sec the single line frames.
+    """
+    path = activate_crop(os.path.join(CONSOLE_DIR, "opto.ccf"),
+                         os.path.join(work_dir, "opto_lines.ccf"))
+    dev = OPTOCobra(ccf=path)
+    dev.console = console_command()
+    dev.command = command
+    dev.line_frames = True
+    dev.raw_filename = os.path.join(work_dir, "%s_lines.raw" % command)
+    check(dev.setup_pipe())
+    try:
+        out = numpy.empty((dev.lines, dev.pixels), dtype=numpy.uint16)
+        step = lambda: check(dev.grab_many(dev.lines, out)[0])
+        result = measure("pipe_%s_lines" % command, step, frames,
+                         dev.lines * dev.pixels * dev.bytes_per_pixel)
+        result["lines_per_snap"] = dev.lines
+        result["lines_per_sec"] = result["frames_per_sec"] * dev.lines
+        return result
+    finally:
+        dev.close_pipe()
+
+
+def bench_serial(frames, baudrate=None):
+    """ Alternate the gain so every command goes to the fake controller,
+    then repeat one gain to measure the settings cache path.
+    """
+    fake = FakeCobraController(baudrate=baudrate).start()
+    dev = Cobra(com_port=fake.port_name)
+    try:
+        check(dev.open_port())
+        gains = [100, 187]
+        counter = [0]
+
+        def step():
+            counter[0] += 1
+            check(dev.set_gain(gains[counter[0] % 2]))
+
+        results = [measure("serial_gain", step, frames)]
+        step = lambda: check(dev.set_gain(100))
+        results.append(measure("serial_gain_cached", step, frames))
+        return results
+    finally:
+        dev.close_port()
+        fake.stop()
+
+
+def bench_simulation(frames):
+    results = []
+    for name, dev in (("sim_pipe", simulation.SimulatedPipeDevice()),
+                      ("sim_sled", simulation.SimulatedCobraSLED()),
+                      ("sim_spectra",
+                       simulation.SimulatedSpectraDevice(rng=0))):
+        dev.setup_pipe()
+        step = lambda: check(dev.grab_pipe()[0])
+        results.append(measure(name, step, frames, dev.pixels * 2))
+    return results
+
+
+def bench_archive(frames, work_dir, codec="zlib"):
+    """ Append simulated sled frames to a compressed archive, report
+    the compression ratio with the timings.
+    """
+    dev = simulation.SimulatedCobraSLED()
+    data = dev.grab_many(frames, numpy.empty((frames, dev.pixels),
+                                             numpy.uint16))[1]
+    path = os.path.join(work_dir, "bench_%s.wpc" % codec)
+    writer = compressed.CompressedArchiveWriter(path, dev.pixels,
+                                                codec=codec)
+    counter = [0]
+
+    def step():
+        i = counter[0] % frames
+        counter[0] += 1
+        writer.append(data[i:i + 1], [i], [0.0])
+
+    try:
+        result = measure("archive_%s" % codec, step, frames,
+                         dev.pixels * 2)
+    finally:
+        writer.close()
+    result["compression_ratio"] = writer.stats()["ratio"]
+    return result
+
+
+def bench_peaks(frames, batch=32):
+    """ Peak detection on simulated raman spectra, one frame per call
+    and batch frames per call. The batch result counts spectra.
+    """
+    batch = min(batch, frames)
+    dev = simulation.SimulatedSpectraDevice(rng=0)
+    data = dev.grab_many(batch)[1].astype(numpy.float64)
+    engine = PeakEngine(dev.pixels)
+
+    single = measure("peaks_frame", lambda: engine.process(data[0]),
+                     frames, dev.pixels * 8)
+    steps = frames // batch
+    result = measure("peaks_batch%s" % batch, lambda: engine.process(data),
+                     steps, dev.pixels * 8 * batch)
+    result["frames"] = steps * batch
+    result["frames_per_sec"] *= batch
+    return [single, result]
+
+
+def run_all(frames=500, baudrate=None):
+    """ Run every benchmark, return a JSON serializable report.
+    """
+    work_dir = tempfile.mkdtemp(prefix="wasatchbench")
+    try:
+        results = [bench_decode(frames), bench_decode(frames, 4096)]
+        results.extend(bench_formats(frames))
+        results.extend([bench_pipe("grab", frames, work_dir),
+                        bench_pipe("stream", frames, work_dir),
+                        bench_pipe_lines("grab", frames, work_dir),
+                        bench_pipe_lines("stream", frames, work_dir)])
+        results.extend(bench_serial(frames, baudrate))
+        results.extend(bench_simulation(frames))
+        results.append(bench_archive(frames, work_dir))
+        results.extend(bench_peaks(frames))
+    finally:
+        shutil.rmtree(work_dir)
+
+    return {"timestamp": time.time(),
+            "python": platform.python_version(),
+            "numpy": numpy.__version__,
+            "platform": platform.platform(),
+            "frames": frames,
+            "results": results}
+
+
+def compare(old_report, new_report):
+    """ Return a list of (name, old fps, new fps, ratio) for benchmarks
+    present in both reports.
+    """
+    old = dict((result["name"], result) for result in old_report["results"])
+    rows = []
+    for result in new_report["results"]:
+        previous = old.get(result["name"])
+        if previous is None:
+            continue
+        ratio = result["frames_per_sec"] / previous["frames_per_sec"]
+        rows.append((result["name"], previous["frames_per_sec"],
+                     result["frames_per_sec"], ratio))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--frames", type=int, default=500)
+    parser.add_argument("--baudrate", type=int, default=None,
+                        help="emulate serial wire time at this baud rate")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--compare", default=None,
+                        help="earlier report to compare against")
+    args = parser.parse_args(argv)
+
+    report = run_all(args.frames, args.baudrate)
+    with open(args.output, "w") as out_file:
+        json.dump(report, out_file, indent=2)
+
+    print("%-20s %12s %10s %10s %14s %12s" % ("name", "frames/s",
+          "p50 ms", "p99 ms", "bytes/s", "alloc B/fr"))
+    for result in report["results"]:
+        print("%-20s %12.1f %10.3f %10.3f %14.0f %12.0f" % (
+              result["name"], result["frames_per_sec"],
+              result["latency_p50_ms"], result["latency_p99_ms"],
+              result["bytes_per_sec"],
+              result["alloc_peak_bytes_per_frame"]))
+
+    if args.compare:
+        with open(args.compare) as in_file:
+            previous = json.load(in_file)
+        print("")
+        for name, old_fps, new_fps, ratio in compare(previous, report):
+            print("%-20s %12.1f -> %12.1f  x%.2f" % (name, old_fps,
+                                                     new_fps, ratio))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
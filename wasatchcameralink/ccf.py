@@ -0,0 +1,157 @@
+""" Parser for the Sapera camera configuration (.ccf) files. Results are
+immutable and cached by path and modification time, so constructing
+many devices for the same ccf reads the file once.
+"""
+
+import os
+import types
+import logging
+import threading
+import collections
+
+from wasatchcameralink.pixelformat import get_decoder
+
+log = logging.getLogger(__name__)
+
+_CCFConfig = collections.namedtuple("CCFConfig",
+    "path sections crop_width crop_height crop_activation pixel_depth "
+    "output_format")
+
+
+class CCFConfig(_CCFConfig):
+    """ Structured view of a ccf file. sections maps each [Section] name
+    to a read-only mapping of its key=value strings.
+    """
+    __slots__ = ()
+
+    @property
+    def bytes_per_pixel(self):
+        """ Pixels deeper than 8 bits are transferred in 16 bit words.
+        """
+        return 1 if self.pixel_depth <= 8 else 2
+
+    @property
+    def pixel_format(self):
+        """ Name of the pixelformat decoder for the transferred frames.
+        10 and 12 bit pixels are packed when the [Output] section has
+        Pixel Packing=1.
+        """
+        if self.bytes_per_pixel == 1:
+            return "mono8"
+        packed = to_int(self.get("Output", "Pixel Packing"), 0)
+        if packed and self.pixel_depth in (10, 12):
+            return "mono%sp" % self.pixel_depth
+        return "mono16"
+
+    @property
+    def frame_lines(self):
+        """ Lines delivered per frame. The crop rectangle only applies
+        with Crop Activation=1, otherwise every frame is one line.
+        """
+        return self.crop_height if self.crop_activation else 1
+
+    @property
+    def frame_bytes(self):
+        return get_decoder(self.pixel_format).frame_bytes(
+            self.crop_width * self.frame_lines)
+
+    def get(self, section, key, default=None):
+        return self.sections.get(section, {}).get(key, default)
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def read_sections(lines):
+    """ Return an ordered dict of section name to dict of entries.
+    """
+    sections = collections.OrderedDict()
+    current = sections.setdefault("", collections.OrderedDict())
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith(";"):
+            continue
+        if line.startswith("[") and line.endswith("]"):
+            current = sections.setdefault(line[1:-1],
+                                          collections.OrderedDict())
+            continue
+        key, sep, value = line.partition("=")
+        if sep:
+            current[key.strip()] = value.strip()
+
+    if not sections[""]:
+        del sections[""]
+    return sections
+
+
+def to_int(value, default):
+    try:
+        return int(value, 0)
+    except (TypeError, ValueError):
+        return default
+
+
+def build_config(path, sections):
+    frozen = types.MappingProxyType(collections.OrderedDict(
+        (name, types.MappingProxyType(entries))
+        for name, entries in sections.items()))
+
+    stream = sections.get("Stream Conditioning", {})
+    signal = sections.get("Signal Description", {})
+    output = sections.get("Output", {})
+
+    return CCFConfig(path=path,
+                     sections=frozen,
+                     crop_width=to_int(stream.get("Crop Width"), 0),
+                     crop_height=max(to_int(stream.get("Crop Height"), 1), 1),
+                     crop_activation=bool(to_int(
+                         stream.get("Crop Activation"), 0)),
+                     pixel_depth=to_int(signal.get("Pixel Depth"), 16),
+                     output_format=to_int(output.get("Output Format"), None))
+
+
+def parse_ccf(path):
+    """ Return the CCFConfig for the file at path. The parsed result is
+    reused until the file modification time changes.
+    """
+    path = os.path.abspath(path)
+    mtime = os.stat(path).st_mtime
+
+    with _cache_lock:
+        cached = _cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    log.debug("Parse ccf file: %s", path)
+    with open(path) as in_file:
+        config = build_config(path, read_sections(in_file))
+
+    with _cache_lock:
+        _cache[path] = (mtime, config)
+    return config
+
+
+def activate_crop(source, target):
+    """ Copy the ccf at source to target with Crop Activation=1, so every
+    frame acquired with target holds Crop Height lines.
+    """
+    with open(source) as in_file:
+        lines = in_file.readlines()
+
+    section = None
+    with open(target, "w") as out_file:
+        for line in lines:
+            text = line.strip()
+            if text.startswith("[") and text.endswith("]"):
+                section = text[1:-1]
+            elif section == "Stream Conditioning" and \
+                 text.partition("=")[0].strip() == "Crop Activation":
+                line = "Crop Activation=1\n"
+            out_file.write(line)
+    return target
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
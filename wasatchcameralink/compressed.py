@@ -0,0 +1,444 @@
+""" Compressed frame archive with random access.
+
+Frames are grouped in chunks of chunk_frames. Each chunk is delta
+encoded, either frame to frame starting from the first frame of the
+chunk or against one reference frame, byte shuffled so the high and low
+bytes of the small residuals sit together, then compressed with a
+stdlib codec. Chunks are compressed on a thread pool and written in
+order. The chunk table and frame index are appended at close, so frame
+k is found with one table lookup and one chunk decode. Archives that
+were not closed are recovered by scanning the chunk headers.
+
+    writer = CompressedArchiveWriter("night.wpc", 2048)
+    writer.append(frames, sequences, timestamps)
+    writer.close()
+
+    archive = CompressedArchive("night.wpc")
+    spectrum = archive[123456]
+"""
+
+import os
+import bz2
+import lzma
+import zlib
+import numpy
+import struct
+import logging
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+from wasatchcameralink.recorder import INDEX_DTYPE, ArchiveError
+
+log = logging.getLogger(__name__)
+
+COMPRESSED_MAGIC = b"WPCA"
+COMPRESSED_VERSION = 1
+
+# magic, version, header size, pixels, lines, chunk frames, dtype,
+# codec, delta mode, level
+COMPRESSED_HEADER = struct.Struct("<4sHHIII8sBBB")
+HEADER_SIZE = 64
+
+CHUNK_MAGIC = b"WPCK"
+CHUNK_HEADER = struct.Struct("<4sII")
+
+TRAILER_MAGIC = b"WPCI"
+TRAILER = struct.Struct("<4sQQQ")
+
+CHUNK_DTYPE = numpy.dtype([("offset", "<u8"), ("frames", "<u4"),
+                           ("length", "<u4")])
+
+# Delta modes
+DELTA_NONE = "none"
+DELTA_PREVIOUS = "previous"
+DELTA_REFERENCE = "reference"
+DELTA_MODES = (DELTA_NONE, DELTA_PREVIOUS, DELTA_REFERENCE)
+
+CODECS = {
+    "none": (0, lambda data, level: data, lambda data: data),
+    "zlib": (1, zlib.compress, zlib.decompress),
+    "bz2": (2, lambda data, level: bz2.compress(data, max(level, 1)),
+            bz2.decompress),
+    "lzma": (3, lambda data, level: lzma.compress(data, preset=level),
+             lzma.decompress),
+}
+CODEC_NAMES = dict((codec[0], name) for name, codec in CODECS.items())
+
+
+def storage_dtype(dtype):
+    """ Archives always hold little endian unsigned pixels.
+    """
+    dtype = numpy.dtype(dtype)
+    if dtype.kind != "u":
+        raise ValueError("Unsupported archive pixel type %s" % dtype)
+    return dtype.newbyteorder("<")
+
+
+def shuffle(data):
+    """ Return the bytes of data grouped by byte position, all low bytes
+    then all high bytes for 16 bit pixels.
+    """
+    itemsize = data.dtype.itemsize
+    if itemsize == 1:
+        return data.tobytes()
+    return data.view(numpy.uint8).reshape(-1, itemsize).T.tobytes()
+
+
+def unshuffle(raw, dtype, shape):
+    itemsize = dtype.itemsize
+    data = numpy.frombuffer(raw, dtype=numpy.uint8)
+    if itemsize > 1:
+        data = data.reshape(itemsize, -1).T.copy()
+    else:
+        data = data.copy()
+    return data.view(dtype).reshape(shape)
+
+
+def encode_chunk(frames, delta, reference, codec, level):
+    """ Delta encode, shuffle and compress a (count, values) block.
+    Unsigned subtraction wraps, so the residuals fit the pixel type and
+    decode exactly.
+    """
+    if delta == DELTA_PREVIOUS:
+        residual = numpy.empty_like(frames)
+        residual[0] = frames[0]
+        numpy.subtract(frames[1:], frames[:-1], out=residual[1:])
+    elif delta == DELTA_REFERENCE:
+        residual = frames - reference
+    else:
+        residual = frames
+    return CODECS[codec][1](shuffle(residual), level)
+
+
+def decode_chunk(payload, count, values, dtype, delta, reference, codec):
+    """ Return the (count, values) frames of one compressed chunk.
+    """
+    frames = unshuffle(CODECS[codec][2](payload), dtype, (count, values))
+    if delta == DELTA_PREVIOUS:
+        numpy.cumsum(frames, axis=0, dtype=dtype, out=frames)
+    elif delta == DELTA_REFERENCE:
+        frames += reference
+    return frames
+
+
+class CompressedArchiveWriter(object):
+    """ Write frames to a new compressed archive. Full chunks are
+    compressed on a pool of worker threads, at most max_pending chunks
+    wait for compression before append blocks. With the reference delta
+    mode and no reference given, the first frame is the reference.
+    """
+    def __init__(self, path, pixels, lines=1, dtype=numpy.uint16,
+                 chunk_frames=64, codec="zlib", level=6,
+                 delta=DELTA_PREVIOUS, reference=None, workers=None,
+                 max_pending=None):
+        super(CompressedArchiveWriter, self).__init__()
+        if codec not in CODECS:
+            raise ValueError("Unknown codec: %s" % codec)
+        if delta not in DELTA_MODES:
+            raise ValueError("Unknown delta mode: %s" % delta)
+
+        self.path = path
+        self.pixels = pixels
+        self.lines = lines
+        self.values = pixels * lines
+        self.dtype = storage_dtype(dtype)
+        self.frame_bytes = self.values * self.dtype.itemsize
+        self.chunk_frames = chunk_frames
+        self.codec = codec
+        self.level = level
+        self.delta = delta
+        self.reference = None
+        if reference is not None:
+            self.reference = numpy.ascontiguousarray(
+                reference, dtype=self.dtype).reshape(self.values)
+
+        # zlib, bz2 and lzma release the GIL while compressing
+        workers = workers or min(4, os.cpu_count() or 1)
+        self.executor = ThreadPoolExecutor(workers)
+        self.max_pending = max_pending or 2 * workers
+        self.pending = collections.deque()
+
+        # frames waiting for a full chunk
+        self.buffer = numpy.empty((chunk_frames, self.values), self.dtype)
+        self.buffer_index = numpy.empty(chunk_frames, INDEX_DTYPE)
+        self.buffered = 0
+
+        self.chunks = []
+        self.index_blocks = []
+        self.count = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+        self.out_file = open(path, "wb")
+        self.header_written = False
+
+    def write_header(self):
+        dtype = self.dtype.str.encode("ascii")
+        header = COMPRESSED_HEADER.pack(
+            COMPRESSED_MAGIC, COMPRESSED_VERSION, HEADER_SIZE, self.pixels,
+            self.lines, self.chunk_frames, dtype, CODECS[self.codec][0],
+            DELTA_MODES.index(self.delta), self.level)
+        self.out_file.write(header.ljust(HEADER_SIZE, b"\x00"))
+        if self.delta == DELTA_REFERENCE:
+            self.out_file.write(self.reference.tobytes())
+        self.header_written = True
+        self.stored_bytes = self.out_file.tell()
+
+    def append(self, frames, sequences, timestamps):
+        """ Add a block of frames with one sequence and timestamp each.
+        Return the number of frame bytes taken.
+        """
+        frames = numpy.asarray(frames).reshape(-1, self.values)
+        count = len(frames)
+        if count != len(sequences):
+            raise ValueError("Frame block does not match the index")
+
+        if self.delta == DELTA_REFERENCE and self.reference is None \
+           and count:
+            self.reference = frames[0].astype(self.dtype)
+
+        for start in range(count):
+            self.buffer[self.buffered] = frames[start]
+            self.buffer_index[self.buffered] = (sequences[start],
+                                                timestamps[start])
+            self.buffered += 1
+            if self.buffered == self.chunk_frames:
+                self.submit()
+
+        self.count += count
+        self.raw_bytes += count * self.frame_bytes
+        return count * self.frame_bytes
+
+    def submit(self):
+        """ Queue the buffered frames for compression.
+        """
+        if not self.buffered:
+            return
+        if not self.header_written:
+            self.write_header()
+
+        frames = self.buffer[:self.buffered].copy()
+        index = self.buffer_index[:self.buffered].copy()
+        self.buffered = 0
+
+        future = self.executor.submit(encode_chunk, frames, self.delta,
+                                      self.reference, self.codec,
+                                      self.level)
+        self.pending.append((future, index))
+        self.drain(len(self.pending) > self.max_pending)
+
+    def drain(self, block=False, all_chunks=False):
+        """ Write compressed chunks in order. Wait for the oldest when
+        block is set, for all of them with all_chunks.
+        """
+        while self.pending:
+            future, index = self.pending[0]
+            if not future.done() and not (block or all_chunks):
+                return
+            payload = future.result()
+            self.pending.popleft()
+            self.write_chunk(payload, index)
+            block = False
+
+    def write_chunk(self, payload, index):
+        offset = self.out_file.tell()
+        self.out_file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, len(index),
+                                              len(payload)))
+        self.out_file.write(index.tobytes())
+        self.out_file.write(payload)
+        self.chunks.append((offset, len(index), len(payload)))
+        self.index_blocks.append(index)
+        self.stored_bytes = self.out_file.tell()
+
+    def flush(self):
+        """ Write every chunk that is done compressing.
+        """
+        self.drain()
+        self.out_file.flush()
+
+    def close(self):
+        """ Compress the partial chunk, write the chunk table, the frame
+        index and the trailer.
+        """
+        if not self.header_written:
+            if self.reference is None and self.delta == DELTA_REFERENCE:
+                self.reference = numpy.zeros(self.values, self.dtype)
+            self.write_header()
+        self.submit()
+        self.drain(all_chunks=True)
+        self.executor.shutdown()
+
+        table_offset = self.out_file.tell()
+        table = numpy.array(self.chunks, dtype=CHUNK_DTYPE)
+        self.out_file.write(table.tobytes())
+        for index in self.index_blocks:
+            self.out_file.write(index.tobytes())
+        self.out_file.write(TRAILER.pack(TRAILER_MAGIC, table_offset,
+                                         len(self.chunks), self.count))
+        self.stored_bytes = self.out_file.tell()
+        self.out_file.close()
+
+    def stats(self):
+        ratio = 0.0
+        if self.stored_bytes:
+            ratio = float(self.raw_bytes) / self.stored_bytes
+        return {"frames": self.count,
+                "chunks": len(self.chunks),
+                "pending_chunks": len(self.pending),
+                "raw_bytes": self.raw_bytes,
+                "stored_bytes": self.stored_bytes,
+                "ratio": ratio}
+
+
+def read_compressed_header(in_file):
+    data = in_file.read(COMPRESSED_HEADER.size)
+    if len(data) < COMPRESSED_HEADER.size:
+        raise ArchiveError("Truncated archive header")
+    (magic, version, header_size, pixels, lines, chunk_frames, dtype,
+     codec, delta, level) = COMPRESSED_HEADER.unpack(data)
+    if magic != COMPRESSED_MAGIC:
+        raise ArchiveError("Bad archive magic %r" % magic)
+    if version != COMPRESSED_VERSION or header_size != HEADER_SIZE:
+        raise ArchiveError("Unsupported archive version %s" % version)
+    if codec not in CODEC_NAMES or delta >= len(DELTA_MODES):
+        raise ArchiveError("Unknown codec %s or delta mode %s" %
+                           (codec, delta))
+    dtype = numpy.dtype(dtype.rstrip(b"\x00").decode())
+    return (pixels, lines, chunk_frames, dtype, CODEC_NAMES[codec],
+            DELTA_MODES[delta])
+
+
+class CompressedArchive(object):
+    """ Random access reader. The most recently decoded chunk is kept so
+    sequential reads decompress each chunk once.
+    """
+    def __init__(self, path):
+        super(CompressedArchive, self).__init__()
+        self.path = path
+        self.in_file = open(path, "rb")
+        (self.pixels, self.lines, self.chunk_frames, self.dtype,
+         self.codec, self.delta) = read_compressed_header(self.in_file)
+        self.in_file.seek(HEADER_SIZE)
+        self.values = self.pixels * self.lines
+
+        self.reference = None
+        if self.delta == DELTA_REFERENCE:
+            size = self.values * self.dtype.itemsize
+            self.reference = numpy.frombuffer(self.in_file.read(size),
+                                              dtype=self.dtype)
+        self.data_start = self.in_file.tell()
+
+        self.lock = threading.Lock()
+        self.cached_chunk = (None, None)
+        self.recovered = False
+        if not self.read_trailer():
+            self.scan_chunks()
+        self.count = int(self.table["frames"].sum())
+
+    def read_trailer(self):
+        """ Load the chunk table and frame index written at close.
+        Return False when the archive has no trailer.
+        """
+        size = os.path.getsize(self.path)
+        if size < self.data_start + TRAILER.size:
+            return False
+        self.in_file.seek(size - TRAILER.size)
+        magic, table_offset, chunks, frames = \
+            TRAILER.unpack(self.in_file.read(TRAILER.size))
+        if magic != TRAILER_MAGIC:
+            return False
+
+        self.in_file.seek(table_offset)
+        self.table = numpy.fromfile(self.in_file, CHUNK_DTYPE, chunks)
+        self.index = numpy.fromfile(self.in_file, INDEX_DTYPE, frames)
+        return True
+
+    def scan_chunks(self):
+        """ Rebuild the table and index from the chunk headers of an
+        archive that was not closed, dropping a truncated last chunk.
+        """
+        log.warning("No index in %s, scanning chunks", self.path)
+        self.recovered = True
+        size = os.path.getsize(self.path)
+        table, blocks = [], []
+        offset = self.data_start
+        while offset + CHUNK_HEADER.size <= size:
+            self.in_file.seek(offset)
+            magic, frames, length = \
+                CHUNK_HEADER.unpack(self.in_file.read(CHUNK_HEADER.size))
+            end = offset + CHUNK_HEADER.size + \
+                  frames * INDEX_DTYPE.itemsize + length
+            if magic != CHUNK_MAGIC or end > size:
+                break
+            blocks.append(numpy.fromfile(self.in_file, INDEX_DTYPE, frames))
+            table.append((offset, frames, length))
+            offset = end
+
+        self.table = numpy.array(table, dtype=CHUNK_DTYPE)
+        if blocks:
+            self.index = numpy.concatenate(blocks)
+        else:
+            self.index = numpy.empty(0, INDEX_DTYPE)
+
+    @property
+    def sequences(self):
+        return self.index["sequence"]
+
+    @property
+    def timestamps(self):
+        return self.index["timestamp"]
+
+    def frame_shape(self):
+        if self.lines > 1:
+            return (self.lines, self.pixels)
+        return (self.pixels,)
+
+    def __len__(self):
+        return self.count
+
+    def chunk(self, number):
+        """ Return the decoded (frames, values) block of a chunk.
+        """
+        with self.lock:
+            if self.cached_chunk[0] == number:
+                return self.cached_chunk[1]
+
+            offset, frames, length = self.table[number]
+            self.in_file.seek(int(offset) + CHUNK_HEADER.size +
+                              int(frames) * INDEX_DTYPE.itemsize)
+            payload = self.in_file.read(int(length))
+            data = decode_chunk(payload, int(frames), self.values,
+                                self.dtype, self.delta, self.reference,
+                                self.codec)
+            self.cached_chunk = (number, data)
+            return data
+
+    def __getitem__(self, frame):
+        """ Return a copy of frame number frame.
+        """
+        if frame < 0:
+            frame += self.count
+        if not 0 <= frame < self.count:
+            raise IndexError("Frame %s out of range" % frame)
+        number, position = divmod(frame, self.chunk_frames)
+        return self.chunk(number)[position].reshape(
+            self.frame_shape()).copy()
+
+    def read(self, start=0, stop=None):
+        """ Return frames start to stop as one array.
+        """
+        stop = self.count if stop is None else min(stop, self.count)
+        out = numpy.empty((max(stop - start, 0), self.values), self.dtype)
+        position = start
+        while position < stop:
+            number, first = divmod(position, self.chunk_frames)
+            block = self.chunk(number)
+            take = min(len(block) - first, stop - position)
+            out[position - start:position - start + take] = \
+                block[first:first + take]
+            position += take
+        return out.reshape((len(out),) + self.frame_shape())
+
+    def close(self):
+        self.in_file.close()
@@ -0,0 +1,306 @@
+""" Pool of pre-started grab console processes.
+
+Starting SapNETCSharpGrabConsole.exe loads the ccf and creates the
+acquisition, buffer and transfer objects before the first frame. The
+pool keeps idle consoles running for each (card, index, ccf) so a
+device gets one that is already set up, and a switch between ccfs does
+not wait for a new process. The mode and output file are part of the
+key because the console is started with them.
+
+    pool = ConsolePool(standby=1)
+    pool.prestart(Cobra(console_pool=pool))
+    device = OPTOCobra(console_pool=pool)
+    device.setup_pipe()             # hands out a warm console
+    ...
+    device.close_pipe()             # returns it to the pool
+    pool.shutdown()                 # q to every idle console
+"""
+
+import sys
+import time
+import logging
+import threading
+import collections
+from subprocess import Popen, PIPE, TimeoutExpired
+
+from wasatchcameralink.protocol import read_frame
+
+log = logging.getLogger(__name__)
+
+
+def quit_console(process, attempts=10, timeout=5.0):
+    """ Write q's until the console closes stdout, then wait for it to
+    exit. Kill it only if it does not exit in time. Return True for a
+    clean exit.
+    """
+    try:
+        for i in range(attempts):
+            log.debug("WR q%s", i)
+            process.stdin.write(b"q\n")
+            process.stdin.flush()
+            if not process.stdout.readline():
+                # console has exited, stdout is closed
+                break
+        process.wait(timeout)
+        return True
+    except (OSError, ValueError, TimeoutExpired):
+        log.warning("Console did not quit: %s", sys.exc_info())
+
+    try:
+        process.kill()
+        process.wait(timeout)
+    except OSError:
+        log.critical("Cannot kill console: " + str(sys.exc_info()))
+    return False
+
+
+def pool_key(device):
+    """ Consoles can be shared by devices with the same key.
+    """
+    return (device.card, device.index, device.ccf, device.command,
+            device.raw_filename)
+
+
+class PooledConsole(object):
+    """ A console process and the time it went idle.
+    """
+    def __init__(self, key, process):
+        super(PooledConsole, self).__init__()
+        self.key = key
+        self.process = process
+        self.idle_since = time.monotonic()
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+
+class ConsolePool(object):
+    """ Keep standby idle consoles per key. acquire hands out an idle
+    console or starts one, release takes it back. A background thread
+    started by start_health_checks replaces consoles that died and
+    recycles consoles idle for longer than max_idle seconds.
+    """
+    def __init__(self, standby=1, max_idle=None, quit_timeout=5.0):
+        super(ConsolePool, self).__init__()
+        self.standby = standby
+        self.max_idle = max_idle
+        self.quit_timeout = quit_timeout
+
+        self.lock = threading.Lock()
+        self.replenish_lock = threading.Lock()
+        self.idle = collections.defaultdict(collections.deque)
+        self.launch = {}
+        self.in_use = {}
+        self.counters = collections.Counter()
+        self.closed = False
+
+        self.health_thread = None
+        self.health_stop = threading.Event()
+
+    def start_process(self, key):
+        args, startupinfo = self.launch[key]
+        log.info("Start pooled console %s", key)
+        process = Popen(args, stdin=PIPE, stdout=PIPE,
+                        startupinfo=startupinfo)
+        self.count("started")
+        return PooledConsole(key, process)
+
+    def register(self, device):
+        """ Remember how to start consoles for the key of device.
+        """
+        key = pool_key(device)
+        with self.lock:
+            self.launch[key] = (device.console_args(), device.startupinfo)
+        return key
+
+    def prestart(self, device, count=None):
+        """ Start idle consoles for the device until count, by default
+        standby, are waiting.
+        """
+        key = self.register(device)
+        self.replenish(key, count)
+        return key
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def replenish(self, key, count=None):
+        count = self.standby if count is None else count
+        with self.replenish_lock:
+            while True:
+                with self.lock:
+                    if self.closed or len(self.idle[key]) >= count:
+                        return
+                try:
+                    console = self.start_process(key)
+                except OSError:
+                    log.critical("Failure to start console: " + \
+                                 str(sys.exc_info()))
+                    return
+                # shutdown may have run while the console started
+                with self.lock:
+                    closed = self.closed
+                    if not closed:
+                        self.idle[key].append(console)
+                if closed:
+                    self.discard(console)
+                    return
+
+    def replenish_later(self, key):
+        thread = threading.Thread(target=self.replenish, args=(key,),
+                                  name="console-replenish")
+        thread.daemon = True
+        thread.start()
+
+    def acquire(self, device):
+        """ Return a running console process for the device, warm if one
+        is idle. Return None if no console could be started.
+        """
+        key = self.register(device)
+        console = None
+        with self.lock:
+            idle = self.idle[key]
+            while idle and console is None:
+                candidate = idle.popleft()
+                if candidate.is_alive():
+                    console = candidate
+                else:
+                    self.counters["died"] += 1
+
+        if console is not None:
+            self.count("warm")
+        else:
+            self.count("cold")
+            try:
+                console = self.start_process(key)
+            except OSError:
+                log.critical("Failure to setup pipe: " + \
+                             str(sys.exc_info()))
+                return None
+
+        with self.lock:
+            self.in_use[id(console.process)] = console
+        if self.standby:
+            self.replenish_later(key)
+        return console.process
+
+    def release(self, device, process, healthy=True):
+        """ Take a console back from a device. Consoles that exited or
+        that the device reports as out of step are closed instead.
+        """
+        with self.lock:
+            console = self.in_use.pop(id(process), None)
+        if console is None:
+            log.warning("Release of a console not from this pool")
+            quit_console(process, timeout=self.quit_timeout)
+            return False
+
+        if not healthy or not console.is_alive():
+            self.discard(console)
+            return False
+
+        console.idle_since = time.monotonic()
+        with self.lock:
+            closed = self.closed
+            if not closed:
+                self.idle[console.key].append(console)
+        if closed:
+            self.discard(console)
+            return False
+        return True
+
+    def discard(self, console):
+        self.count("discarded")
+        if console.is_alive():
+            if quit_console(console.process, timeout=self.quit_timeout):
+                self.count("quit")
+            else:
+                self.count("killed")
+
+    def probe(self, console):
+        """ A stream mode console must answer a frame request. Grab mode
+        consoles wait at the snap prompt and are only checked for life.
+        """
+        if not console.is_alive():
+            return False
+        if console.key[3] != "stream":
+            return True
+        try:
+            console.process.stdin.write(b"\n")
+            console.process.stdin.flush()
+            read_frame(console.process.stdout)
+        except:
+            log.warning("Console probe failure: %s", sys.exc_info())
+            return False
+        return True
+
+    def check_idle(self):
+        """ Health check every idle console, close dead, unresponsive and
+        expired ones, then top the standby consoles back up.
+        """
+        with self.lock:
+            consoles = [console for idle in self.idle.values()
+                        for console in idle]
+            for idle in self.idle.values():
+                idle.clear()
+
+        now = time.monotonic()
+        for console in consoles:
+            expired = self.max_idle is not None and \
+                      now - console.idle_since > self.max_idle
+            if expired or not self.probe(console):
+                self.discard(console)
+                continue
+            with self.lock:
+                self.idle[console.key].append(console)
+
+        for key in list(self.launch):
+            self.replenish(key)
+        self.count("checks")
+
+    def start_health_checks(self, interval=5.0):
+        def run():
+            while not self.health_stop.wait(interval):
+                try:
+                    self.check_idle()
+                except:
+                    log.critical("Console health check failure: " + \
+                                 str(sys.exc_info()))
+
+        self.health_stop.clear()
+        self.health_thread = threading.Thread(target=run,
+                                              name="console-health")
+        self.health_thread.daemon = True
+        self.health_thread.start()
+
+    def idle_count(self, key=None):
+        with self.lock:
+            if key is not None:
+                return len(self.idle.get(key, ()))
+            return sum(len(idle) for idle in self.idle.values())
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["idle"] = sum(len(idle) for idle in self.idle.values())
+            stats["in_use"] = len(self.in_use)
+        return stats
+
+    def shutdown(self):
+        """ Stop the health checks and quit every idle console. Consoles
+        still in use are quit when they are released.
+        """
+        self.health_stop.set()
+        if self.health_thread is not None:
+            self.health_thread.join()
+            self.health_thread = None
+
+        with self.lock:
+            self.closed = True
+            consoles = [console for idle in self.idle.values()
+                        for console in idle]
+            self.idle.clear()
+        for console in consoles:
+            self.discard(console)
+        return True
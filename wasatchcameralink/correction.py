@@ -0,0 +1,192 @@
+""" Dark frame and flat field correction for any device with grab_many.
+
+Calibrations are averages of N frames, stored per (ccf, gain, offset)
+device state. The state is read from the device on every frame, so a
+set_gain or set_offset that changes it switches to the calibration for
+the new state, or reports the device as uncalibrated until one is
+built. Going back to an earlier state reuses its calibration.
+
+    corrector = FrameCorrector(device)
+    corrector.calibrate_dark()      # shutter closed
+    corrector.calibrate_flat()      # uniform illumination
+    result, data = corrector.grab_pipe()
+"""
+
+import sys
+import numpy
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class CalibrationError(Exception):
+    """ Raised when no calibration exists for the device state.
+    """
+
+
+class Calibration(object):
+    """ Dark level and flat field gain of one device state. gain is
+    None until a flat is taken.
+    """
+    def __init__(self, dark):
+        super(Calibration, self).__init__()
+        self.dark = dark
+        self.gain = None
+
+
+def device_setting(device, name):
+    """ Return the value of a device setting, None when unknown. Cobra
+    keeps acknowledged values in its settings cache, the simulated
+    devices keep gain and offset attributes.
+    """
+    settings = getattr(device, "settings", None)
+    if isinstance(settings, dict):
+        return settings.get(name)
+    return getattr(device, name, None)
+
+
+def device_state(device):
+    """ Return the (ccf, gain, offset) key of the device, unknown values
+    are None.
+    """
+    gain = device_setting(device, "gain")
+    offset = device_setting(device, "offset")
+    if gain is not None:
+        gain = str(gain)
+    if offset is not None:
+        offset = str(offset)
+    return (getattr(device, "ccf", None), gain, offset)
+
+
+class FrameCorrector(object):
+    """ Correct frames as (frame - dark) * gain in preallocated float
+    buffers. Without a flat only the dark is subtracted.
+    """
+    def __init__(self, device, frames=32, dtype=numpy.float64):
+        super(FrameCorrector, self).__init__()
+        self.device = device
+        self.frames = frames
+        self.dtype = dtype
+        self.calibrations = {}
+
+        if hasattr(device, "frame_shape"):
+            self.shape = device.frame_shape()
+        else:
+            self.shape = (device.pixels,)
+        self.buffer = numpy.empty(self.shape, dtype)
+        self.average_buffer = None
+
+    def state(self):
+        return device_state(self.device)
+
+    def average(self, frames=None):
+        """ Return the mean of frames grabbed from the device.
+        """
+        frames = frames or self.frames
+        shape = (frames,) + self.shape
+        if self.average_buffer is None or \
+           self.average_buffer.shape != shape:
+            self.average_buffer = numpy.empty(shape, self.dtype)
+
+        result, data = self.device.grab_many(frames, self.average_buffer)
+        if not result:
+            raise CalibrationError("Grab failure while averaging")
+        return data.mean(axis=0)
+
+    def calibrate_dark(self, frames=None):
+        """ Average frames with no light on the sensor as the dark for
+        the current state, dropping any flat taken against the old dark.
+        """
+        return self.set_dark(self.average(frames))
+
+    def set_dark(self, dark):
+        """ Use a stored dark, like reference.dark_frame(), for the
+        current state.
+        """
+        dark = numpy.array(dark, dtype=self.dtype).reshape(self.shape)
+        calibration = Calibration(dark)
+        self.calibrations[self.state()] = calibration
+        return calibration
+
+    def calibrate_flat(self, frames=None):
+        """ Average frames of uniform illumination. The gain scales each
+        pixel to the mean dark corrected response, pixels with no
+        response are left at zero.
+        """
+        calibration = self.calibration()
+        response = self.average(frames)
+        response -= calibration.dark
+
+        valid = response > 0
+        gain = numpy.zeros(self.shape, self.dtype)
+        if valid.any():
+            numpy.divide(response[valid].mean(), response, out=gain,
+                         where=valid)
+        calibration.gain = gain
+        return calibration
+
+    def calibration(self):
+        """ Return the calibration for the current device state.
+        """
+        state = self.state()
+        calibration = self.calibrations.get(state)
+        if calibration is None:
+            raise CalibrationError("No dark calibration for %s" % (state,))
+        return calibration
+
+    def invalidate(self, all_states=True):
+        """ Forget the calibrations of every state, or only of the
+        current one.
+        """
+        if all_states:
+            self.calibrations.clear()
+        else:
+            self.calibrations.pop(self.state(), None)
+
+    def is_calibrated(self):
+        return self.state() in self.calibrations
+
+    def correct(self, data, out=None):
+        """ Return the corrected frame or (count,) + frame shape block in
+        out. By default a single frame is written to a buffer that the
+        next call reuses.
+        """
+        calibration = self.calibration()
+        if out is None:
+            out = self.buffer if numpy.shape(data) == self.shape else \
+                  numpy.empty(numpy.shape(data), self.dtype)
+
+        numpy.subtract(data, calibration.dark, out=out, casting="unsafe")
+        if calibration.gain is not None:
+            numpy.multiply(out, calibration.gain, out=out)
+        return out
+
+    def grab_pipe(self):
+        """ Grab one frame from the device and correct it, following the
+        (result, data) convention of the devices.
+        """
+        result, data = self.device.grab_pipe()
+        if not result:
+            return result, data
+        try:
+            return 1, self.correct(data)
+        except CalibrationError:
+            log.critical("Correction failure: " + str(sys.exc_info()))
+            return 0, "fail"
+
+    def grab_many(self, count, out=None):
+        """ Grab count frames straight into the float block out and
+        correct them in place.
+        """
+        if out is None:
+            out = numpy.empty((count,) + self.shape, self.dtype)
+        try:
+            self.calibration()
+        except CalibrationError:
+            log.critical("Correction failure: " + str(sys.exc_info()))
+            return 0, "fail"
+
+        result, data = self.device.grab_many(count, out)
+        if not result:
+            return result, data
+        return 1, self.correct(data, data)
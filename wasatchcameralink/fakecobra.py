@@ -0,0 +1,105 @@
+""" pty backed stand-in for the Cobra serial controller. Open the
+port_name with pyserial like the real COM port.
+
+    fake = FakeCobraController()
+    fake.start()
+    port = serial.Serial(fake.port_name, 9600, timeout=1)
+"""
+
+import os
+import tty
+import time
+import select
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+
+class FakeCobraController(object):
+    """ Answer carriage return terminated commands with <ok> or <err>,
+    keep the last gain, offset and scan settings. With a baudrate the
+    replies are delayed by the time the bytes take on the wire.
+    """
+    def __init__(self, baudrate=None, reply_delay=0.0):
+        super(FakeCobraController, self).__init__()
+        self.baudrate = baudrate
+        self.reply_delay = reply_delay
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port_name = os.ttyname(self.slave)
+
+        self.settings = {}
+        self.commands = []
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.serve,
+                                       name="fake-cobra")
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        for descriptor in (self.master, self.slave):
+            try:
+                os.close(descriptor)
+            except OSError:
+                pass
+
+    def wire_time(self, size):
+        if not self.baudrate:
+            return 0.0
+        # 8N1 framing, ten bits per byte
+        return size * 10.0 / self.baudrate
+
+    def handle(self, command):
+        """ Return the reply bytes for a single command.
+        """
+        self.commands.append(command)
+        words = command.split()
+        if not words:
+            return b"<err>\r\n"
+
+        name, args = words[0], words[1:]
+        if name == "init" and not args:
+            self.settings.clear()
+            return b"<ok>\r\n"
+
+        if name in ("gain", "offset", "ats", "lsc") and len(args) == 1:
+            try:
+                self.settings[name] = int(args[0])
+            except ValueError:
+                return b"<err>\r\n"
+            return b"<ok>\r\n"
+
+        return b"<err>\r\n"
+
+    def serve(self):
+        buffered = b""
+        while self.running:
+            ready, _, _ = select.select([self.master], [], [], 0.05)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.master, 1024)
+            except OSError:
+                return
+
+            buffered += data
+            while b"\r" in buffered:
+                line, buffered = buffered.split(b"\r", 1)
+                command = line.decode("ascii", "replace").strip()
+                reply = self.handle(command)
+                delay = self.reply_delay + \
+                        self.wire_time(len(line) + 1 + len(reply))
+                if delay:
+                    time.sleep(delay)
+                os.write(self.master, reply)
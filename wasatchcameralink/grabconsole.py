@@ -0,0 +1,149 @@
+""" Python stand-in for SapNETCSharpGrabConsole.exe. Speaks the same
+stdin/stdout protocol as GrabConsole.cs so the pipe handling in
+DALSA.py can be exercised and benchmarked without a DALSA card.
+
+Usage:
+    python grabconsole.py grab|stream card index ccf [raw_file]
+
+In grab mode the snap/save/repeat prompts are printed and each frame is
+saved to raw_file, test.raw by default. In stream mode every newline on stdin returns one
+binary frame record on stdout, q or end of input quits.
+"""
+
+import os
+import sys
+import numpy
+
+if __name__ == "__main__" and not __package__:
+    # Started as a script, make the package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+
+from wasatchcameralink.ccf import parse_ccf
+from wasatchcameralink.pixelformat import get_decoder
+from wasatchcameralink.protocol import write_frame
+
+
+def console_command():
+    """ Return the argument list prefix that starts this stand-in, use
+    it in place of the path to the .net executable.
+    """
+    return [sys.executable, os.path.abspath(__file__)]
+
+
+class GrabConsole(object):
+    """ Generate a deterministic test pattern frame for every snap. Each
+    line is a ramp offset by the frame counter and line number, clipped
+    to the pixel depth. Packed pixel formats are packed little endian
+    before they are written.
+    """
+    def __init__(self, pixels=2048, lines=1, pixel_depth=12, stdin=None,
+                 stdout=None, pixel_format=None):
+        super(GrabConsole, self).__init__()
+        self.pixels = pixels
+        self.lines = lines
+        self.mask = (1 << pixel_depth) - 1
+        self.frame_count = 0
+        self.stdin = stdin or sys.stdin.buffer
+        self.stdout = stdout or sys.stdout.buffer
+
+        dtype = numpy.uint8 if pixel_depth <= 8 else numpy.dtype("<u2")
+        self.ramp = numpy.add.outer(numpy.arange(self.lines),
+                                    numpy.arange(self.pixels))
+        self.work = numpy.zeros((self.lines, self.pixels), dtype=numpy.int64)
+        self.frame = numpy.zeros((self.lines, self.pixels), dtype=dtype)
+
+        self.packer = None
+        if pixel_format is not None:
+            decoder = get_decoder(pixel_format)
+            if decoder.bits not in (8, 16):
+                self.packer = decoder
+
+    @classmethod
+    def from_ccf(cls, ccf_file, **kwargs):
+        config = parse_ccf(ccf_file)
+        return cls(config.crop_width, config.frame_lines,
+                   config.pixel_depth, pixel_format=config.pixel_format,
+                   **kwargs)
+
+    def snap(self):
+        """ Fill the frame buffer with the pattern for the current frame.
+        """
+        numpy.add(self.ramp, self.frame_count, out=self.work)
+        numpy.bitwise_and(self.work, self.mask, out=self.work)
+        self.frame[...] = self.work
+
+    def payload(self):
+        """ Return the frame as transferred by the card.
+        """
+        if self.packer is not None:
+            return self.packer.encode(self.frame)
+        return self.frame
+
+    def prompt(self, message):
+        """ Print the message, return the stripped response line or None
+        at the end of input.
+        """
+        self.stdout.write(message.encode() + b"\n")
+        self.stdout.flush()
+        return self.read_command()
+
+    def read_command(self):
+        line = self.stdin.readline()
+        if not line:
+            return None
+        return line.strip()
+
+    def run_grab(self, out_filename="test.raw"):
+        """ Mirror the snap, save, repeat prompt loop of GrabConsole.cs.
+        """
+        while True:
+            if self.prompt("Press a key to trigger snap") is None:
+                return
+            self.snap()
+
+            if self.prompt("Press a key to trigger save") is None:
+                return
+            with open(out_filename, "wb") as out_file:
+                out_file.write(self.payload())
+
+            self.stdout.write(b"frame: %d\n" % self.frame_count)
+            self.frame_count += 1
+
+            new_cmd = self.prompt("File saved, Press a key to repeat, "
+                                  "q to quit:")
+            if new_cmd is None or new_cmd == b"q":
+                return
+
+    def run_stream(self):
+        """ Write a binary frame record for every request line.
+        """
+        while True:
+            new_cmd = self.read_command()
+            if new_cmd is None or new_cmd == b"q":
+                return
+
+            self.snap()
+            write_frame(self.stdout, self.frame_count, self.payload())
+            self.frame_count += 1
+
+
+def main(argv=None):
+    args = list(sys.argv[1:] if argv is None else argv)
+    if len(args) < 4:
+        sys.stderr.write(__doc__)
+        return 1
+
+    command, card, index, ccf_file = args[:4]
+    out_filename = args[4] if len(args) > 4 else "test.raw"
+
+    console = GrabConsole.from_ccf(ccf_file)
+    if command == "stream":
+        console.run_stream()
+    else:
+        console.run_grab(out_filename)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
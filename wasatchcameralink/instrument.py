@@ -0,0 +1,134 @@
+""" Per-stage latency and event counters for the acquisition paths.
+Stages are timed with time.perf_counter, a monotonic clock, and the
+latest samples of each stage are kept in a fixed size window for
+percentiles and histograms.
+
+    start = time.perf_counter()
+    self.trigger_snap()
+    start = self.instrument.record("snap", start)
+    ...
+    device.stats()["stages"]["snap"]["p99"]
+"""
+
+import sys
+import time
+import numpy
+import logging
+import threading
+import collections
+
+log = logging.getLogger(__name__)
+
+# Stage names recorded by the devices
+SNAP = "snap"
+SAVE = "save"
+FILE_READ = "file_read"
+DECODE = "decode"
+SERIAL_WRITE = "serial_write"
+SERIAL_ACK = "serial_ack"
+REPEAT = "repeat"
+FRAME = "frame"
+
+
+class LatencyWindow(object):
+    """ Rolling window of the last size durations of one stage, with a
+    running count and total over all samples.
+    """
+    def __init__(self, size=1024):
+        super(LatencyWindow, self).__init__()
+        self.samples = numpy.zeros(size)
+        self.position = 0
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, seconds):
+        self.samples[self.position] = seconds
+        self.position = (self.position + 1) % len(self.samples)
+        self.count += 1
+        self.total += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    def recent(self):
+        """ Return a copy of the samples in the window, oldest first.
+        """
+        if self.count < len(self.samples):
+            return self.samples[:self.count].copy()
+        return numpy.roll(self.samples, -self.position)
+
+    def summary(self):
+        recent = self.recent()
+        summary = {"count": self.count,
+                   "total": self.total,
+                   "max": self.maximum,
+                   "mean": 0.0, "p50": 0.0, "p99": 0.0}
+        if len(recent):
+            p50, p99 = numpy.percentile(recent, [50, 99])
+            summary.update(mean=float(recent.mean()), p50=float(p50),
+                           p99=float(p99))
+        return summary
+
+
+class Instrumentation(object):
+    """ Collect stage timings and counters for one device. The optional
+    hook is called with (stage, seconds) for every sample, for example
+    to forward timings to a metrics system.
+    """
+    def __init__(self, window=1024, hook=None):
+        super(Instrumentation, self).__init__()
+        self.window = window
+        self.hook = hook
+        self.enabled = True
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stages = {}
+            self.counters = collections.Counter()
+
+    def record(self, stage, start):
+        """ Record the time since start, a time.perf_counter value, for
+        stage. Return the current time so stages can be chained.
+        """
+        now = time.perf_counter()
+        if not self.enabled:
+            return now
+
+        seconds = now - start
+        with self.lock:
+            window = self.stages.get(stage)
+            if window is None:
+                window = self.stages[stage] = LatencyWindow(self.window)
+            window.add(seconds)
+
+        if self.hook is not None:
+            try:
+                self.hook(stage, seconds)
+            except:
+                log.critical("Instrumentation hook failure: " + \
+                             str(sys.exc_info()))
+        return now
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] += amount
+
+    def histogram(self, stage, bins=20):
+        """ Return numpy.histogram counts and edges of the recent
+        samples of stage.
+        """
+        with self.lock:
+            window = self.stages.get(stage)
+            recent = window.recent() if window else numpy.zeros(0)
+        return numpy.histogram(recent, bins)
+
+    def stats(self):
+        """ Return the summary of every stage and the counters.
+        """
+        with self.lock:
+            return {"stages": dict((stage, window.summary())
+                                   for stage, window in self.stages.items()),
+                    "counters": dict(self.counters)}
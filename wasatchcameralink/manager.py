@@ -0,0 +1,170 @@
+""" Run several acquisition devices side by side, for example a Cobra on
+an Xcelera-CL_LX1_1 and an OPTO Cobra on an Xcelera-CL_PX4_1 in the same
+host. Grabs are dispatched to a worker pool and returned as aligned
+frame sets.
+"""
+
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+import collections
+
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+FrameSet = collections.namedtuple("FrameSet",
+                                  "sequence timestamps results data")
+
+
+class AcquisitionManager(object):
+    """ Coordinate any mix of hardware and simulated devices. Devices
+    are given as a dict of name to device, or a list which is named
+    device0, device1...
+
+    isolate gives every grab console its own frame file through the raw
+    file argument of the console. The shipped SapNETCSharpGrabConsole.exe
+    predates that argument and always writes test.raw, so leave isolate
+    off with it until the console is rebuilt.
+    """
+    def __init__(self, devices, output_dir=None, isolate=False):
+        super(AcquisitionManager, self).__init__()
+        if not isinstance(devices, dict):
+            devices = collections.OrderedDict(
+                ("device%s" % i, dev) for i, dev in enumerate(devices))
+        self.devices = devices
+
+        self.output_dir = output_dir
+        self.temp_dir = None
+        self.pool = ThreadPoolExecutor(max_workers=max(len(devices), 1))
+
+        self.sequence = 0
+        self.frames = 0
+        self.start_time = None
+
+        if isolate:
+            self.isolate_outputs()
+        self.check_outputs()
+
+    def isolate_outputs(self):
+        """ Give every console its own frame file so devices sharing a
+        working directory do not overwrite each other. Without an
+        output_dir the files go to a temporary directory that is removed
+        on shutdown.
+        """
+        for name, device in self.devices.items():
+            if not hasattr(device, "raw_filename"):
+                continue
+            if self.output_dir is None:
+                self.output_dir = tempfile.mkdtemp(prefix="wasatch")
+                self.temp_dir = self.output_dir
+            device.raw_filename = os.path.join(self.output_dir,
+                                               "%s.raw" % name)
+
+    def shared_outputs(self):
+        """ Return the names of grab mode devices that write the same
+        frame file as another device.
+        """
+        paths = collections.defaultdict(list)
+        for name, device in self.devices.items():
+            if getattr(device, "command", None) != "grab" or \
+               not hasattr(device, "raw_filename"):
+                continue
+            paths[os.path.abspath(device.raw_filename)].append(name)
+        return [name for names in paths.values() if len(names) > 1
+                for name in names]
+
+    def check_outputs(self):
+        shared = self.shared_outputs()
+        if shared:
+            log.critical("Grab mode devices %s share one frame file, "
+                         "their frames will overwrite each other. Use "
+                         "stream mode or isolate=True with a rebuilt "
+                         "console.", ", ".join(shared))
+
+    def map(self, function):
+        """ Call function(device) for every device on the pool, return a
+        dict of name to result.
+        """
+        futures = collections.OrderedDict(
+            (name, self.pool.submit(function, device))
+            for name, device in self.devices.items())
+        return collections.OrderedDict(
+            (name, future.result()) for name, future in futures.items())
+
+    def setup_pipes(self):
+        results = self.map(lambda device: device.setup_pipe())
+        self.start_time = time.time()
+        return all(results.values())
+
+    def close_pipes(self):
+        results = self.map(lambda device: device.close_pipe())
+        return all(results.values())
+
+    def grab_all(self):
+        """ Grab one frame from every device in parallel. Return a
+        FrameSet holding the per device completion timestamps, results
+        and data.
+        """
+        if self.start_time is None:
+            self.start_time = time.time()
+
+        def grab(device):
+            try:
+                result, data = device.grab_pipe()
+            except:
+                log.critical("Grab failure: " + str(sys.exc_info()))
+                result, data = 0, "fail"
+            return time.time(), result, data
+
+        grabs = self.map(grab)
+
+        timestamps = collections.OrderedDict()
+        results = collections.OrderedDict()
+        data = collections.OrderedDict()
+        for name, (stamp, result, frame) in grabs.items():
+            timestamps[name] = stamp
+            results[name] = result
+            data[name] = frame
+            if result:
+                self.frames += 1
+
+        frame_set = FrameSet(self.sequence, timestamps, results, data)
+        self.sequence += 1
+        return frame_set
+
+    def frame_sets(self, count):
+        """ Yield count aligned frame sets.
+        """
+        for i in range(count):
+            yield self.grab_all()
+
+    def throughput(self):
+        """ Return the aggregate frames and frame sets per second since
+        the pipes were set up.
+        """
+        elapsed = 0.0
+        if self.start_time is not None:
+            elapsed = time.time() - self.start_time
+
+        frames_per_sec = 0.0
+        sets_per_sec = 0.0
+        if elapsed > 0:
+            frames_per_sec = self.frames / elapsed
+            sets_per_sec = self.sequence / elapsed
+
+        return {"devices": len(self.devices),
+                "frames": self.frames,
+                "frame_sets": self.sequence,
+                "elapsed": elapsed,
+                "frames_per_sec": frames_per_sec,
+                "sets_per_sec": sets_per_sec}
+
+    def shutdown(self):
+        self.pool.shutdown()
+        if self.temp_dir is not None:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+            self.temp_dir = None
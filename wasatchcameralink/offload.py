@@ -0,0 +1,232 @@
+""" Run expensive per frame analysis on a process pool.
+
+Frames are copied into slots of one shared memory block instead of
+being pickled. The workers map the same block and call the function on
+a view of the slot. Only the slot number goes to the worker and only
+the function result comes back. A slot stays taken until its result is
+handed out, so the number of slots bounds both the frames in flight
+and the results waiting for the consumer. submit blocks, or refuses
+the frame, when the workers or the consumer fall behind. Results are
+handed out in submission order.
+
+    def fit(frame):                     # module level, picklable
+        return expensive_model(frame)
+
+    offload = ProcessOffload(fit, 2048, callback=handle_result)
+    device.start_stream(offload.put_frame)
+    ...
+    offload.close()
+"""
+
+import os
+import sys
+import time
+import numpy
+import queue
+import logging
+import threading
+import collections
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+
+log = logging.getLogger(__name__)
+
+# Worker side view of the shared frame slots
+_worker_slots = None
+
+
+def attach_slots(name, shape, dtype):
+    """ Pool initializer, map the shared frame slots in the worker.
+    """
+    global _worker_slots
+    # workers share the resource tracker of the parent, which unlinks
+    # the block once, in close
+    memory = shared_memory.SharedMemory(name=name)
+    _worker_slots = (memory, numpy.ndarray(shape, dtype, memory.buf))
+
+
+def run_slot(function, slot):
+    """ Worker task, return the result of function on one slot with the
+    worker pid and busy time.
+    """
+    start = time.perf_counter()
+    result = function(_worker_slots[1][slot])
+    return result, os.getpid(), time.perf_counter() - start
+
+
+class ProcessOffload(object):
+    """ Hand frames of a fixed shape to function on a pool of worker
+    processes. Results go to callback(sequence, result) in submission
+    order, or are pulled with next_result. Without a callback the slot
+    of a frame is free again only once next_result returns its result.
+    """
+    def __init__(self, function, pixels, lines=1, slots=None, workers=None,
+                 dtype=numpy.float64, callback=None, mp_context=None):
+        super(ProcessOffload, self).__init__()
+        self.function = function
+        self.callback = callback
+        self.workers = workers or os.cpu_count() or 1
+        self.slots = slots or 2 * self.workers
+        self.frame_shape = (lines, pixels) if lines > 1 else (pixels,)
+        self.dtype = numpy.dtype(dtype)
+
+        shape = (self.slots,) + self.frame_shape
+        size = int(numpy.prod(shape)) * self.dtype.itemsize
+        self.memory = shared_memory.SharedMemory(create=True, size=size)
+        self.frames = numpy.ndarray(shape, self.dtype, self.memory.buf)
+
+        self.free_slots = queue.Queue()
+        for slot in range(self.slots):
+            self.free_slots.put(slot)
+
+        self.pending = collections.deque()
+        self.lock = threading.Lock()
+        self.deliver_lock = threading.Lock()
+        self.sequence = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.wait_time = 0.0
+        self.worker_stats = {}
+        self.start_time = time.perf_counter()
+
+        self.executor = ProcessPoolExecutor(
+            self.workers, mp_context=mp_context, initializer=attach_slots,
+            initargs=(self.memory.name, shape, self.dtype))
+
+    def submit(self, data, block=True, timeout=None):
+        """ Copy data into a free slot and queue it. Wait for a slot when
+        block is set, return the sequence number or None when no slot
+        became free.
+        """
+        start = time.perf_counter()
+        if self.callback is not None:
+            self.deliver()
+            if block and self.free_slots.empty():
+                # the oldest frame holds its slot until it is delivered
+                self.deliver(wait=True, count=1)
+        try:
+            slot = self.free_slots.get(block, timeout)
+        except queue.Empty:
+            with self.lock:
+                self.rejected += 1
+            return None
+
+        self.frames[slot][...] = data
+        with self.lock:
+            self.wait_time += time.perf_counter() - start
+            sequence = self.sequence
+            self.sequence += 1
+            self.submitted += 1
+
+        future = self.executor.submit(run_slot, self.function, slot)
+        with self.lock:
+            self.pending.append((sequence, slot, future))
+
+        if self.callback is not None:
+            self.deliver()
+        return sequence
+
+    def put_frame(self, frame):
+        """ Frame callback for StreamingDevice.start_stream, refuses the
+        frame instead of blocking the producer when all slots are busy.
+        """
+        return self.submit(frame.data, block=False) is not None
+
+    def collect(self, future):
+        """ Return the result of a finished task, None if it raised.
+        """
+        try:
+            result, pid, busy = future.result()
+        except:
+            log.critical("Offload task failure: " + str(sys.exc_info()))
+            with self.lock:
+                self.failed += 1
+            return None
+
+        with self.lock:
+            self.completed += 1
+            tasks, total = self.worker_stats.get(pid, (0, 0.0))
+            self.worker_stats[pid] = (tasks + 1, total + busy)
+        return result
+
+    def next_result(self, timeout=None):
+        """ Wait for the oldest outstanding task, return (sequence,
+        result). Raise queue.Empty when nothing is outstanding and
+        TimeoutError when it does not finish in time.
+        """
+        with self.lock:
+            if not self.pending:
+                raise queue.Empty("No outstanding frames")
+            sequence, slot, future = self.pending[0]
+        future.exception(timeout)
+        with self.lock:
+            self.pending.popleft()
+        result = self.collect(future)
+        self.free_slots.put(slot)
+        return sequence, result
+
+    def deliver(self, wait=False, count=None):
+        """ Pass finished results to the callback in order, at most
+        count of them. Stop at the first unfinished task unless wait is
+        set. Called from submit, and from close for the rest.
+        """
+        with self.deliver_lock:
+            delivered = 0
+            while count is None or delivered < count:
+                with self.lock:
+                    if not self.pending:
+                        return
+                    sequence, slot, future = self.pending[0]
+                if not wait and not future.done():
+                    return
+                delivered += 1
+                sequence, result = self.next_result()
+                try:
+                    self.callback(sequence, result)
+                except:
+                    log.critical("Offload callback failure: " + \
+                                 str(sys.exc_info()))
+
+    def results(self):
+        """ Yield (sequence, result) for every outstanding frame in
+        order, waiting as needed.
+        """
+        while True:
+            try:
+                yield self.next_result()
+            except queue.Empty:
+                return
+
+    def close(self):
+        """ Finish outstanding frames, stop the workers and release the
+        shared memory.
+        """
+        if self.callback is not None:
+            self.deliver(wait=True)
+        else:
+            for sequence, slot, future in list(self.pending):
+                future.exception()
+        self.executor.shutdown()
+        del self.frames
+        self.memory.close()
+        self.memory.unlink()
+
+    def stats(self):
+        """ Return frame counts, slots in use, the time submit spent
+        waiting for slots and the busy fraction of every worker.
+        """
+        elapsed = time.perf_counter() - self.start_time
+        with self.lock:
+            workers = dict((pid, {"tasks": tasks, "busy": busy,
+                                  "utilization": busy / elapsed})
+                           for pid, (tasks, busy)
+                           in self.worker_stats.items())
+            return {"submitted": self.submitted,
+                    "completed": self.completed,
+                    "failed": self.failed,
+                    "rejected": self.rejected,
+                    "in_flight": self.slots - self.free_slots.qsize(),
+                    "wait_time": self.wait_time,
+                    "workers": workers}
@@ -0,0 +1,208 @@
+""" Vectorized Raman peak detection for single frames and (frames,
+pixels) batches.
+
+Each frame goes through:
+    baseline   block minimums linearly interpolated across the frame,
+               raised to the median of the remaining signal
+    smoothing  gaussian kernel applied in the frequency domain
+    detection  local maxima above a multiple of the per frame noise
+    centroid   three point parabolic fit around every maximum
+
+The interpolation weights, the kernel spectrum and the pixel axis are
+computed once per engine, so a batch of frames costs a handful of whole
+array operations.
+
+    engine = PeakEngine(2048, axis=wavenumbers)
+    peaks = engine.process(block)
+    peaks[peaks["frame"] == 3]["position"]
+"""
+
+import sys
+import numpy
+import logging
+
+log = logging.getLogger(__name__)
+
+PEAK_DTYPE = numpy.dtype([("frame", "<i8"), ("pixel", "<i8"),
+                          ("position", "<f8"), ("height", "<f8")])
+
+# median absolute deviation of a normal difference to its sigma
+MAD_SCALE = 1.0 / (0.6745 * numpy.sqrt(2.0))
+
+
+class PeakEngine(object):
+    """ Find peaks in frames of a fixed pixel count. block is the width
+    of the baseline minimum windows and must be wider than the peaks,
+    sigma is the gaussian smoothing width in pixels and threshold the
+    detection level in multiples of the noise. axis maps pixels to
+    positions, for example wavenumbers, and defaults to pixel numbers.
+    """
+    def __init__(self, pixels, block=64, sigma=1.5, threshold=5.0,
+                 axis=None, callback=None):
+        super(PeakEngine, self).__init__()
+        self.pixels = pixels
+        self.block = block
+        self.sigma = sigma
+        self.threshold = threshold
+        self.callback = callback
+
+        if axis is None:
+            axis = numpy.arange(pixels, dtype=numpy.float64)
+        self.axis = numpy.asarray(axis, dtype=numpy.float64)
+        if self.axis.shape != (pixels,):
+            raise ValueError("Axis length does not match %s pixels" %
+                             pixels)
+
+        self.pixel_index = numpy.arange(pixels, dtype=numpy.float64)
+        self.build_baseline_weights()
+        self.build_kernel()
+        self.buffers = {}
+        self.last_peaks = None
+
+    def build_baseline_weights(self):
+        """ Block centres and the linear weights that spread the block
+        minimums back over every pixel.
+        """
+        blocks = -(-self.pixels // self.block)
+        self.padded = blocks * self.block
+        centres = (numpy.arange(blocks) + 0.5) * self.block - 0.5
+        centres[-1] = min(centres[-1], self.pixels - 1)
+
+        pixels = numpy.arange(self.pixels)
+        right = numpy.searchsorted(centres, pixels)
+        right = right.clip(1, max(blocks - 1, 1))
+        left = right - 1
+        if blocks == 1:
+            left = right = numpy.zeros(self.pixels, dtype=int)
+            weight = numpy.zeros(self.pixels)
+        else:
+            span = centres[right] - centres[left]
+            weight = ((pixels - centres[left]) / span).clip(0.0, 1.0)
+
+        self.baseline_left = left
+        self.baseline_right = right
+        self.baseline_weight = weight
+
+    def build_kernel(self):
+        """ Frequency response of the normalized gaussian, zero padded
+        so the convolution does not wrap around.
+        """
+        if not self.sigma:
+            self.kernel_spectrum = None
+            return
+        half = int(numpy.ceil(4 * self.sigma))
+        taps = numpy.arange(-half, half + 1)
+        kernel = numpy.exp(-0.5 * (taps / float(self.sigma)) ** 2)
+        kernel /= kernel.sum()
+
+        self.kernel_half = half
+        self.fft_size = self.pixels + 2 * half
+        self.kernel_spectrum = numpy.fft.rfft(kernel, self.fft_size)
+
+    def buffer(self, name, shape):
+        key = (name, shape)
+        array = self.buffers.get(key)
+        if array is None:
+            array = self.buffers[key] = numpy.empty(shape)
+        return array
+
+    def baseline(self, frames):
+        """ Return the baseline of a (frames, pixels) float array.
+        """
+        count = len(frames)
+        padded = self.buffer("padded", (count, self.padded))
+        padded[:, :self.pixels] = frames
+        # repeat the last pixel so a short last block is not biased
+        padded[:, self.pixels:] = frames[:, -1:]
+        minimums = padded.reshape(count, -1, self.block).min(axis=2)
+
+        out = self.buffer("baseline", (count, self.pixels))
+        left = minimums[:, self.baseline_left]
+        numpy.subtract(minimums[:, self.baseline_right], left, out=out)
+        out *= self.baseline_weight
+        out += left
+
+        # minimums sit at the bottom of the noise, lift the baseline to
+        # the median of what is left
+        out += numpy.median(frames - out, axis=1)[:, None]
+        return out
+
+    def smooth(self, frames):
+        """ Return the gaussian smoothed (frames, pixels) array.
+        """
+        if self.kernel_spectrum is None:
+            return frames
+        spectrum = numpy.fft.rfft(frames, self.fft_size, axis=1)
+        spectrum *= self.kernel_spectrum
+        full = numpy.fft.irfft(spectrum, self.fft_size, axis=1)
+        return full[:, self.kernel_half:self.kernel_half + self.pixels]
+
+    def noise(self, frames):
+        """ Robust per frame noise level from the pixel to pixel
+        differences.
+        """
+        differences = numpy.abs(numpy.diff(frames, axis=1))
+        return numpy.median(differences, axis=1) * MAD_SCALE
+
+    def corrected(self, frames):
+        """ Return the baseline subtracted, smoothed frames.
+        """
+        frames = numpy.asarray(frames, dtype=numpy.float64)
+        single = frames.ndim == 1
+        if single:
+            frames = frames[None, :]
+
+        signal = frames - self.baseline(frames)
+        smoothed = self.smooth(signal)
+        return smoothed[0] if single else smoothed
+
+    def process(self, frames):
+        """ Return the peaks of a frame or a (frames, pixels) block as a
+        PEAK_DTYPE array ordered by frame then pixel.
+        """
+        frames = numpy.asarray(frames, dtype=numpy.float64)
+        if frames.ndim == 1:
+            frames = frames[None, :]
+
+        signal = frames - self.baseline(frames)
+        noise = self.noise(signal)
+        smoothed = self.smooth(signal)
+
+        limit = (self.threshold * noise)[:, None]
+        centre = smoothed[:, 1:-1]
+        maxima = (centre > smoothed[:, :-2]) & \
+                 (centre >= smoothed[:, 2:]) & (centre > limit)
+        rows, columns = numpy.nonzero(maxima)
+        columns += 1
+
+        below = smoothed[rows, columns - 1]
+        peak = smoothed[rows, columns]
+        above = smoothed[rows, columns + 1]
+        curvature = below - 2 * peak + above
+        offset = numpy.zeros(len(columns))
+        numpy.divide(0.5 * (below - above), curvature, out=offset,
+                     where=curvature != 0)
+        offset.clip(-0.5, 0.5, out=offset)
+
+        peaks = numpy.empty(len(columns), dtype=PEAK_DTYPE)
+        peaks["frame"] = rows
+        peaks["pixel"] = columns
+        peaks["position"] = numpy.interp(columns + offset,
+                                         self.pixel_index,
+                                         self.axis)
+        peaks["height"] = peak - 0.25 * (below - above) * offset
+        return peaks
+
+    def put_frame(self, frame):
+        """ Frame callback for StreamingDevice.start_stream, keeps the
+        latest peaks and passes them to the engine callback.
+        """
+        peaks = self.process(frame.data)
+        self.last_peaks = peaks
+        if self.callback is not None:
+            try:
+                self.callback(frame, peaks)
+            except:
+                log.critical("Peak callback failure: " + \
+                             str(sys.exc_info()))
+        return peaks
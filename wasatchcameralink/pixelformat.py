@@ -0,0 +1,211 @@
+""" Decoders from raw frame bytes to uint16 pixel values.
+
+Every pixel format is a named decoder in a registry. A ccf selects the
+format through CCFConfig.pixel_format:
+
+    mono8           one byte per pixel, widened to 16 bits
+    mono10/12/16    one 16 bit word per pixel
+    mono10p/12p     pixels packed back to back with no padding bits,
+                    4 pixels in 5 bytes or 2 pixels in 3 bytes
+
+The endianness is always explicit. For 16 bit words it is the byte
+order. For packed formats little means the first pixel starts at the
+least significant bit of the first byte, as in the GenICam Mono12p
+layout. Big means it starts at the most significant bit.
+
+    decoder = get_decoder("mono12p")
+    data = decoder.decode(raw_data, 2048, LITTLE)
+"""
+
+import numpy
+import logging
+
+log = logging.getLogger(__name__)
+
+LITTLE = "little"
+BIG = "big"
+ENDIANS = (LITTLE, BIG)
+
+
+def check_endian(endian):
+    if endian not in ENDIANS:
+        raise ValueError("Unknown endianness: %s" % endian)
+
+
+class WordDecoder(object):
+    """ One byte or one 16 bit word per pixel. Little endian words are
+    returned as a read-only view on the raw bytes, without a copy.
+    """
+    def __init__(self, name, bits):
+        super(WordDecoder, self).__init__()
+        self.name = name
+        self.bits = bits
+
+    def frame_bytes(self, count):
+        return count * self.bits // 8
+
+    def is_view(self, endian):
+        """ True when decode returns a view of the raw bytes, so frames
+        can be read straight into uint16 arrays.
+        """
+        return self.bits == 16 and endian == LITTLE
+
+    def decode(self, raw_data, count, endian=LITTLE):
+        check_endian(endian)
+        if self.bits == 8:
+            data = numpy.frombuffer(raw_data, dtype=numpy.uint8,
+                                    count=count)
+            return data.astype(numpy.uint16)
+
+        word = "<u2" if endian == LITTLE else ">u2"
+        data = numpy.frombuffer(raw_data, dtype=word, count=count)
+        if endian == BIG:
+            data = data.astype(numpy.uint16)
+        return data
+
+    def encode(self, values, endian=LITTLE):
+        check_endian(endian)
+        if self.bits == 8:
+            return numpy.asarray(values, dtype=numpy.uint8).tobytes()
+        word = "<u2" if endian == LITTLE else ">u2"
+        return numpy.asarray(values).astype(word).tobytes()
+
+
+def bit_slots(depth, pixels, endian):
+    """ For every pixel of a packing group return the bytes it spans,
+    the shift of each byte into the combined value and the right shift
+    that aligns the pixel.
+    """
+    slots = []
+    for index in range(pixels):
+        start = depth * index
+        stop = start + depth
+        first, last = start // 8, (stop - 1) // 8
+        if endian == LITTLE:
+            terms = [(byte, 8 * (byte - first))
+                     for byte in range(first, last + 1)]
+            shift = start - 8 * first
+        else:
+            terms = [(byte, 8 * (last - byte))
+                     for byte in range(first, last + 1)]
+            shift = 8 * (last + 1) - stop
+        slots.append((terms, shift))
+    return slots
+
+
+class PackedDecoder(object):
+    """ depth bit pixels packed back to back. The bytes are processed in
+    groups that hold a whole number of pixels, one array operation per
+    byte a pixel of the group spans.
+    """
+    def __init__(self, name, depth):
+        super(PackedDecoder, self).__init__()
+        self.name = name
+        self.bits = depth
+        self.mask = (1 << depth) - 1
+
+        group_bits = depth
+        while group_bits % 8:
+            group_bits += depth
+        self.group_pixels = group_bits // depth
+        self.group_bytes = group_bits // 8
+        self.slots = dict((endian, bit_slots(depth, self.group_pixels,
+                                             endian))
+                          for endian in ENDIANS)
+
+    def frame_bytes(self, count):
+        return -(-count * self.bits // 8)
+
+    def is_view(self, endian):
+        return False
+
+    def groups(self, raw_data, count):
+        """ Return the raw bytes as a (groups, group bytes) array, zero
+        padded when the last group is only partly used.
+        """
+        groups = -(-count // self.group_pixels)
+        size = groups * self.group_bytes
+        data = numpy.frombuffer(raw_data, dtype=numpy.uint8,
+                                count=min(len(raw_data), size))
+        if len(data) < size:
+            if len(data) < self.frame_bytes(count):
+                raise ValueError("%s bytes for %s %s pixels" %
+                                 (len(data), count, self.name))
+            data = numpy.concatenate((data, numpy.zeros(size - len(data),
+                                                        numpy.uint8)))
+        return data.reshape(groups, self.group_bytes)
+
+    def decode(self, raw_data, count, endian=LITTLE):
+        check_endian(endian)
+        groups = self.groups(raw_data, count)
+        # one contiguous row per byte position keeps the loops unit stride
+        words = numpy.empty((self.group_bytes, len(groups)), numpy.uint16)
+        words[...] = groups.T
+
+        out = numpy.empty((len(groups), self.group_pixels), numpy.uint16)
+        value = numpy.empty(len(groups), numpy.uint16)
+        term = numpy.empty(len(groups), numpy.uint16)
+        for index, (terms, shift) in enumerate(self.slots[endian]):
+            for position, (byte, byte_shift) in enumerate(terms):
+                target = term if position else value
+                if byte_shift >= shift:
+                    numpy.left_shift(words[byte], byte_shift - shift,
+                                     out=target)
+                else:
+                    numpy.right_shift(words[byte], shift - byte_shift,
+                                      out=target)
+                if position:
+                    value |= term
+            value &= self.mask
+            out[:, index] = value
+        return out.reshape(-1)[:count]
+
+    def encode(self, values, endian=LITTLE):
+        """ Pack values into bytes, the inverse of decode. Used by the
+        stand-in grab console and the tests.
+        """
+        check_endian(endian)
+        values = numpy.asarray(values, dtype=numpy.uint32).reshape(-1)
+        count = len(values)
+        groups = -(-count // self.group_pixels)
+        padded = numpy.zeros(groups * self.group_pixels, numpy.uint32)
+        padded[:count] = values & self.mask
+        padded = padded.reshape(groups, self.group_pixels)
+
+        out = numpy.zeros((groups, self.group_bytes), numpy.uint32)
+        for index, (terms, shift) in enumerate(self.slots[endian]):
+            value = padded[:, index] << shift
+            for byte, byte_shift in terms:
+                out[:, byte] |= (value >> byte_shift) & 0xFF
+        data = out.astype(numpy.uint8).tobytes()
+        return data[:self.frame_bytes(count)]
+
+
+DECODERS = {}
+
+
+def register_decoder(decoder, name=None):
+    """ Add a decoder to the registry under its name, replacing any
+    decoder of that name.
+    """
+    DECODERS[name or decoder.name] = decoder
+    return decoder
+
+
+def get_decoder(name):
+    try:
+        return DECODERS[name]
+    except KeyError:
+        raise ValueError("Unknown pixel format: %s" % name)
+
+
+def decode(raw_data, count, pixel_format="mono16", endian=LITTLE):
+    return get_decoder(pixel_format).decode(raw_data, count, endian)
+
+
+register_decoder(WordDecoder("mono8", 8))
+register_decoder(WordDecoder("mono10", 16))
+register_decoder(WordDecoder("mono12", 16))
+register_decoder(WordDecoder("mono16", 16))
+register_decoder(PackedDecoder("mono10p", 10))
+register_decoder(PackedDecoder("mono12p", 12))
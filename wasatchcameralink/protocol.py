@@ -0,0 +1,93 @@
+""" Binary frame records exchanged with the grab console in stream mode.
+
+Each frame is written to stdout as a fixed size header followed by the
+raw pixel bytes:
+
+    magic    4 bytes  "WPFR"
+    counter  uint32   frame number since the console started
+    length   uint32   number of payload bytes that follow
+
+All header fields are little endian.
+"""
+
+import struct
+
+FRAME_MAGIC = b"WPFR"
+FRAME_HEADER = struct.Struct("<4sII")
+
+
+class ProtocolError(Exception):
+    """ Raised when the byte stream does not contain a valid frame
+    record.
+    """
+
+
+def read_exact(stream, length):
+    """ Read exactly length bytes from the stream, raise ProtocolError if
+    the stream ends first.
+    """
+    data = stream.read(length)
+    if len(data) == length:
+        return data
+
+    # Raw (unbuffered) streams may return short reads
+    chunks = [data]
+    remaining = length - len(data)
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            raise ProtocolError("Stream ended %s bytes short" % remaining)
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def parse_header(header):
+    """ Return the frame counter and payload length from the header
+    bytes.
+    """
+    magic, counter, length = FRAME_HEADER.unpack(header)
+    if magic != FRAME_MAGIC:
+        raise ProtocolError("Bad frame magic %r" % magic)
+    return counter, length
+
+
+def read_frame(stream):
+    """ Read one frame record from the stream, return the frame counter
+    and the payload bytes.
+    """
+    counter, length = parse_header(read_exact(stream, FRAME_HEADER.size))
+    return counter, read_exact(stream, length)
+
+
+def read_frame_into(stream, buffer):
+    """ Read one frame record with the payload placed directly in the
+    writable buffer, which must match the payload size. Return the frame
+    counter.
+    """
+    counter, length = parse_header(read_exact(stream, FRAME_HEADER.size))
+    view = memoryview(buffer).cast("B")
+    if length != view.nbytes:
+        # Consume the payload to keep the stream in sync
+        read_exact(stream, length)
+        raise ProtocolError("Payload of %s bytes for a %s byte buffer" %
+                            (length, view.nbytes))
+
+    filled = 0
+    while filled < length:
+        count = stream.readinto(view[filled:])
+        if not count:
+            raise ProtocolError("Stream ended %s bytes short" %
+                                (length - filled))
+        filled += count
+    return counter
+
+
+def write_frame(stream, counter, payload):
+    """ Write one frame record to the stream and flush it. The payload
+    may be any object supporting the buffer protocol.
+    """
+    length = memoryview(payload).nbytes
+    stream.write(FRAME_HEADER.pack(FRAME_MAGIC, counter, length))
+    stream.write(payload)
+    stream.flush()
@@ -0,0 +1,328 @@
+""" Append-only frame archive and a background recorder that fills it.
+
+The archive is a data file with a fixed size header followed by the raw
+frames back to back, and an index file next to it holding the sequence
+number and timestamp of every frame. Reading maps the data file as an
+(N, pixels) array, nothing is loaded until it is accessed.
+
+    recorder = FrameRecorder.for_device(device, "run1.wpa")
+    device.start_stream(recorder.put_frame)
+    ...
+    device.stop_stream()
+    recorder.close()
+
+    archive = FrameArchive("run1.wpa")
+    archive.frames[1000:1010].mean(axis=0)
+"""
+
+import os
+import sys
+import time
+import numpy
+import queue
+import struct
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+ARCHIVE_MAGIC = b"WPAR"
+ARCHIVE_VERSION = 1
+
+# magic, version, header size, pixels, lines, dtype string
+ARCHIVE_HEADER = struct.Struct("<4sHHII8s")
+HEADER_SIZE = 64
+
+INDEX_DTYPE = numpy.dtype([("sequence", "<u8"), ("timestamp", "<f8")])
+
+
+class ArchiveError(Exception):
+    """ Raised for files that are not frame archives.
+    """
+
+
+def index_path(path):
+    return path + ".idx"
+
+
+def write_header(out_file, pixels, lines, dtype):
+    header = ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION,
+                                 HEADER_SIZE, pixels, lines,
+                                 numpy.dtype(dtype).str.encode("ascii"))
+    out_file.write(header.ljust(HEADER_SIZE, b"\x00"))
+
+
+def read_header(in_file):
+    """ Return (pixels, lines, dtype) from the start of an archive.
+    """
+    data = in_file.read(ARCHIVE_HEADER.size)
+    if len(data) < ARCHIVE_HEADER.size:
+        raise ArchiveError("Truncated archive header")
+    magic, version, header_size, pixels, lines, dtype = \
+        ARCHIVE_HEADER.unpack(data)
+    if magic != ARCHIVE_MAGIC:
+        raise ArchiveError("Bad archive magic %r" % magic)
+    if version != ARCHIVE_VERSION or header_size != HEADER_SIZE:
+        raise ArchiveError("Unsupported archive version %s" % version)
+    return pixels, lines, numpy.dtype(dtype.rstrip(b"\x00").decode())
+
+
+class FrameArchiveWriter(object):
+    """ Append frames of a fixed shape and dtype to a new archive.
+    """
+    def __init__(self, path, pixels, lines=1, dtype=numpy.uint16):
+        super(FrameArchiveWriter, self).__init__()
+        self.path = path
+        self.pixels = pixels
+        self.lines = lines
+        self.dtype = numpy.dtype(dtype)
+        self.frame_bytes = pixels * lines * self.dtype.itemsize
+        self.count = 0
+
+        self.data_file = open(path, "wb")
+        write_header(self.data_file, pixels, lines, self.dtype)
+        self.index_file = open(index_path(path), "wb")
+
+    def append(self, frames, sequences, timestamps):
+        """ Write a block of frames, any array that reshapes to (count,
+        lines * pixels), with one sequence and timestamp per frame.
+        """
+        frames = numpy.ascontiguousarray(frames, dtype=self.dtype)
+        count = len(sequences)
+        if frames.size != count * self.pixels * self.lines:
+            raise ValueError("Frame block does not match the archive "
+                             "shape")
+
+        index = numpy.empty(count, dtype=INDEX_DTYPE)
+        index["sequence"] = sequences
+        index["timestamp"] = timestamps
+
+        self.data_file.write(frames.data)
+        self.index_file.write(index.data)
+        self.count += count
+        return count * self.frame_bytes
+
+    def flush(self):
+        self.data_file.flush()
+        self.index_file.flush()
+
+    def close(self):
+        self.data_file.close()
+        self.index_file.close()
+
+
+class FrameArchive(object):
+    """ Read-only memory mapped view of an archive. Frames written after
+    the archive was opened are picked up by refresh.
+    """
+    def __init__(self, path):
+        super(FrameArchive, self).__init__()
+        self.path = path
+        with open(path, "rb") as in_file:
+            self.pixels, self.lines, self.dtype = read_header(in_file)
+        self.frame_bytes = self.pixels * self.lines * self.dtype.itemsize
+        self.refresh()
+
+    def frame_shape(self):
+        if self.lines > 1:
+            return (self.lines, self.pixels)
+        return (self.pixels,)
+
+    def refresh(self):
+        """ Map every complete frame that has an index entry.
+        """
+        data_frames = (os.path.getsize(self.path) - HEADER_SIZE) // \
+                      self.frame_bytes
+        index_frames = os.path.getsize(index_path(self.path)) // \
+                       INDEX_DTYPE.itemsize
+        count = min(data_frames, index_frames)
+
+        if count == 0:
+            self.frames = numpy.empty((0,) + self.frame_shape(),
+                                      dtype=self.dtype)
+            self.index = numpy.empty(0, dtype=INDEX_DTYPE)
+            return
+
+        self.frames = numpy.memmap(self.path, dtype=self.dtype, mode="r",
+                                   offset=HEADER_SIZE,
+                                   shape=(count,) + self.frame_shape())
+        self.index = numpy.memmap(index_path(self.path), dtype=INDEX_DTYPE,
+                                  mode="r", shape=(count,))
+
+    @property
+    def sequences(self):
+        return self.index["sequence"]
+
+    @property
+    def timestamps(self):
+        return self.index["timestamp"]
+
+    def __len__(self):
+        return len(self.frames)
+
+
+class FrameRecorder(object):
+    """ Write frames to an archive from a background thread. put_frame
+    and record only copy the frame into a bounded queue, frames that
+    arrive while the queue is full are counted as dropped instead of
+    stalling the acquisition. writer_class can be any writer with the
+    FrameArchiveWriter interface, like compressed.CompressedArchiveWriter,
+    built with writer_options as keyword arguments.
+    """
+    def __init__(self, path, pixels, lines=1, dtype=numpy.uint16,
+                 queue_size=256, batch_size=32, flush_interval=1.0,
+                 writer_class=FrameArchiveWriter, writer_options=None):
+        super(FrameRecorder, self).__init__()
+        self.writer = writer_class(path, pixels, lines, dtype,
+                                   **(writer_options or {}))
+        self.shape = (lines, pixels) if lines > 1 else (pixels,)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.queue = queue.Queue(queue_size)
+        self.lock = threading.Lock()
+        self.sequence = 0
+        self.received = 0
+        self.dropped = 0
+        self.written = 0
+        self.bytes_written = 0
+        self.write_time = 0.0
+        self.max_depth = 0
+        self.start_time = time.perf_counter()
+        self.failure = None
+
+        self.thread = threading.Thread(target=self.write_loop,
+                                       name="frame-recorder")
+        self.thread.daemon = True
+        self.thread.start()
+
+    @classmethod
+    def for_device(cls, device, path, **kwargs):
+        """ Take the frame shape and pixel type from a SaperaCMD device,
+        the simulated devices record single line 16 bit frames.
+        """
+        if hasattr(device, "frame_shape"):
+            shape = device.frame_shape()
+        else:
+            shape = (device.pixels,)
+        lines = shape[0] if len(shape) == 2 else 1
+        dtype = numpy.uint16
+        config = getattr(device, "ccf_config", None)
+        if config is not None and config.bytes_per_pixel == 1:
+            dtype = numpy.uint8
+        return cls(path, shape[-1], lines, dtype, **kwargs)
+
+    def record(self, data, sequence=None, timestamp=None):
+        """ Queue a copy of data for writing. Return False if the frame
+        was dropped because the writer is behind or has failed, or because
+        data does not have the recorder frame shape.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        with self.lock:
+            if sequence is None:
+                sequence = self.sequence
+            self.sequence = sequence + 1
+            self.received += 1
+
+        if self.failure is not None:
+            with self.lock:
+                self.dropped += 1
+            return False
+
+        try:
+            copy = numpy.array(data, dtype=self.writer.dtype)
+            copy = copy.reshape(self.shape)
+            self.queue.put_nowait((copy, sequence, timestamp))
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+            return False
+        except ValueError:
+            log.critical("Frame does not fit the recorder: " + \
+                         str(sys.exc_info()))
+            with self.lock:
+                self.dropped += 1
+            return False
+
+        depth = self.queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    def put_frame(self, frame):
+        """ Frame callback for StreamingDevice.start_stream.
+        """
+        return self.record(frame.data, frame.sequence, frame.timestamp)
+
+    def next_batch(self):
+        """ Wait for one item, then take whatever else is queued up to
+        batch_size. A None item asks the writer to stop.
+        """
+        batch = [self.queue.get()]
+        while batch[-1] is not None and len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def write_loop(self):
+        last_flush = time.perf_counter()
+        while True:
+            batch = self.next_batch()
+            stop = batch[-1] is None
+            if stop:
+                batch.pop()
+
+            if batch and self.failure is None:
+                start = time.perf_counter()
+                try:
+                    frames, sequences, timestamps = zip(*batch)
+                    written = self.writer.append(numpy.stack(frames),
+                                                 sequences, timestamps)
+                    if start - last_flush >= self.flush_interval:
+                        self.writer.flush()
+                        last_flush = start
+                except:
+                    log.critical("Recorder write failure: " + \
+                                 str(sys.exc_info()))
+                    self.failure = sys.exc_info()[1]
+                    with self.lock:
+                        self.dropped += len(batch)
+                else:
+                    with self.lock:
+                        self.written += len(batch)
+                        self.bytes_written += written
+                        self.write_time += time.perf_counter() - start
+            if stop:
+                return
+
+    def close(self, timeout=None):
+        """ Write everything still queued, then close the archive.
+        """
+        self.queue.put(None)
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            log.critical("Recorder thread did not stop")
+            return False
+        self.writer.close()
+        return self.failure is None
+
+    def stats(self):
+        """ Return frame counts, the queue depth and the write
+        throughput, both while writing and over the whole session.
+        """
+        elapsed = time.perf_counter() - self.start_time
+        with self.lock:
+            return {"received": self.received,
+                    "written": self.written,
+                    "dropped": self.dropped,
+                    "queue_depth": self.queue.qsize(),
+                    "max_queue_depth": self.max_depth,
+                    "bytes_written": self.bytes_written,
+                    "write_bytes_per_sec": self.bytes_written /
+                                           self.write_time
+                                           if self.write_time else 0.0,
+                    "bytes_per_sec": self.bytes_written / elapsed
+                                     if elapsed else 0.0}
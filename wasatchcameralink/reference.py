@@ -0,0 +1,118 @@
+""" Shared store for the reference spectra shipped with the package. The
+comma separated text files are parsed once, then kept as a binary .npy
+sidecar in a cache directory and memory mapped read-only. Every caller
+gets the same array until the source file modification time changes.
+"""
+
+import os
+import numpy
+import hashlib
+import logging
+import tempfile
+import threading
+
+log = logging.getLogger(__name__)
+
+SINGLE_SLED = "cobra_singlesled.txt"
+NO_SIGNAL = "cobra_nosignal.txt"
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def package_path(filename):
+    """ Return the path of a reference file stored next to this module.
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        filename)
+
+
+def cache_dir():
+    """ Directory for the .npy sidecars, WASATCH_CACHE_DIR or a
+    wasatchcameralink folder under the system temp directory.
+    """
+    path = os.environ.get("WASATCH_CACHE_DIR")
+    if not path:
+        path = os.path.join(tempfile.gettempdir(), "wasatchcameralink")
+    return path
+
+
+def sidecar_path(path):
+    """ Return the sidecar file name for the source at path. The digest
+    of the full path keeps same named sources apart.
+    """
+    digest = hashlib.sha1(path.encode("utf-8")).hexdigest()[:12]
+    name = "%s-%s.npy" % (os.path.basename(path), digest)
+    return os.path.join(cache_dir(), name)
+
+
+def write_sidecar(sidecar, data):
+    """ Save data to sidecar through a temporary file so readers never
+    see a partial file. Return False if the cache is not writable.
+    """
+    try:
+        os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+        handle, temp_name = tempfile.mkstemp(
+            dir=os.path.dirname(sidecar), suffix=".tmp")
+        with os.fdopen(handle, "wb") as out_file:
+            numpy.save(out_file, data)
+        os.replace(temp_name, sidecar)
+    except OSError:
+        log.warning("Cannot write reference cache %s", sidecar)
+        return False
+    return True
+
+
+def load_source(path, mtime):
+    """ Return a read-only array for the text file at path, from the
+    sidecar when it is newer than the source.
+    """
+    sidecar = sidecar_path(path)
+    try:
+        if os.stat(sidecar).st_mtime >= mtime:
+            return numpy.load(sidecar, mmap_mode="r")
+    except (OSError, ValueError):
+        pass
+
+    log.debug("Parse reference file: %s", path)
+    data = numpy.loadtxt(path, delimiter=",")
+    if write_sidecar(sidecar, data):
+        return numpy.load(sidecar, mmap_mode="r")
+
+    data.flags.writeable = False
+    return data
+
+
+def load_reference(filename):
+    """ Return the shared read-only array for a reference file. Plain
+    names are looked up in the package directory.
+    """
+    path = filename
+    if not os.path.isabs(path) and not os.path.exists(path):
+        path = package_path(filename)
+    path = os.path.abspath(path)
+    mtime = os.stat(path).st_mtime
+
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        data = load_source(path, mtime)
+        _cache[path] = (mtime, data)
+        return data
+
+
+def single_sled():
+    return load_reference(SINGLE_SLED)
+
+
+def dark_frame():
+    return load_reference(NO_SIGNAL)
+
+
+def clear_cache():
+    """ Forget the in memory arrays, the sidecars stay on disk.
+    """
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,177 @@
+""" Fixed capacity frame buffer between an acquisition producer and a
+consumer. All frames live in one preallocated array, consumers get
+views into it instead of copies.
+"""
+
+import logging
+import threading
+
+import numpy
+
+from wasatchcameralink.streaming import Frame
+
+log = logging.getLogger(__name__)
+
+DROP_OLDEST = "drop_oldest"
+BLOCK = "block"
+
+
+class FrameRingBuffer(object):
+    """ Single producer, single consumer ring of frames. With the
+    drop_oldest policy a full buffer overwrites the oldest unread frame,
+    with the block policy the producer waits for the consumer.
+
+    The data view returned by get stays valid until the next call to get
+    or release. One spare row is swapped in for the frame held by the
+    consumer so the producer never writes into it.
+
+    pixels is the pixel count of single line frames, or the (lines,
+    pixels) shape of multi-line frames.
+    """
+    def __init__(self, capacity, pixels, policy=DROP_OLDEST,
+                 dtype=numpy.uint16):
+        super(FrameRingBuffer, self).__init__()
+        if capacity < 1:
+            raise ValueError("Capacity must be at least 1")
+        if policy not in (DROP_OLDEST, BLOCK):
+            raise ValueError("Unknown policy %s" % policy)
+
+        self.shape = tuple(pixels) if isinstance(pixels, tuple) else \
+                     (pixels,)
+        self.capacity = capacity
+        self.pixels = self.shape[-1]
+        self.policy = policy
+
+        self.frames = numpy.zeros((capacity + 1,) + self.shape, dtype=dtype)
+        self.sequences = numpy.zeros(capacity, dtype=numpy.int64)
+        self.timestamps = numpy.zeros(capacity, dtype=numpy.float64)
+
+        # Monotonic write and read positions, slot is position % capacity
+        # and rows maps each slot to its row in frames.
+        self.head = 0
+        self.tail = 0
+        self.rows = numpy.arange(capacity)
+        self.spare_row = capacity
+        self.held_row = None
+        self.closed = False
+
+        self.produced = 0
+        self.consumed = 0
+        self.dropped = 0
+
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+
+    @classmethod
+    def for_device(cls, device, capacity=64, policy=DROP_OLDEST):
+        """ Size the buffer from the frame shape of the device, the
+        simulated devices deliver single line frames.
+        """
+        if hasattr(device, "frame_shape"):
+            shape = device.frame_shape()
+        else:
+            shape = (device.pixels,)
+        return cls(capacity, shape, policy)
+
+    def __len__(self):
+        with self.lock:
+            return self.head - self.tail
+
+    def space(self):
+        """ Number of slots the producer can fill, caller holds the lock.
+        """
+        return self.capacity - (self.head - self.tail)
+
+    def put(self, data, sequence=None, timestamp=0.0, timeout=None):
+        """ Copy the pixel data into the next free slot. Return False if
+        the buffer is closed or a blocking put timed out.
+        """
+        with self.lock:
+            if self.policy == BLOCK:
+                ready = lambda: self.closed or self.space() > 0
+                if not self.not_full.wait_for(ready, timeout):
+                    return False
+            elif self.space() <= 0:
+                self.tail += 1
+                self.dropped += 1
+
+            if self.closed:
+                return False
+
+            slot = self.head % self.capacity
+            row = self.rows[slot]
+            if sequence is None:
+                sequence = self.produced
+
+        # The slot is owned by the producer until head moves, copy
+        # outside the lock so the consumer is not held up.
+        self.frames[row] = data
+
+        with self.lock:
+            self.sequences[slot] = sequence
+            self.timestamps[slot] = timestamp
+            self.head += 1
+            self.produced += 1
+            self.not_empty.notify()
+        return True
+
+    def put_frame(self, frame):
+        """ Frame callback for StreamingDevice.start_stream.
+        """
+        return self.put(frame.data, frame.sequence, frame.timestamp)
+
+    def get(self, timeout=None):
+        """ Return the oldest unread Frame with a view into the buffer,
+        None on timeout or when closed and empty. Releases the slot of
+        the previously returned frame.
+        """
+        with self.lock:
+            self.release_locked()
+            ready = lambda: self.closed or self.head > self.tail
+            if not self.not_empty.wait_for(ready, timeout):
+                return None
+            if self.head == self.tail:
+                return None
+
+            slot = self.tail % self.capacity
+            self.held_row = self.rows[slot]
+            self.rows[slot] = self.spare_row
+            self.spare_row = None
+            self.tail += 1
+            self.consumed += 1
+            self.not_full.notify()
+
+            return Frame(int(self.sequences[slot]),
+                         float(self.timestamps[slot]),
+                         self.frames[self.held_row])
+
+    def release(self):
+        """ Hand the slot of the last returned frame back to the
+        producer.
+        """
+        with self.lock:
+            self.release_locked()
+
+    def release_locked(self):
+        if self.held_row is not None:
+            self.spare_row = self.held_row
+            self.held_row = None
+
+    def close(self):
+        """ Wake any waiting producer or consumer, further puts fail.
+        """
+        with self.lock:
+            self.closed = True
+            self.not_empty.notify_all()
+            self.not_full.notify_all()
+
+    def counters(self):
+        """ Return the produced, consumed, dropped counts and the number
+        of unread frames.
+        """
+        with self.lock:
+            return {"produced": self.produced,
+                    "consumed": self.consumed,
+                    "dropped": self.dropped,
+                    "depth": self.head - self.tail}
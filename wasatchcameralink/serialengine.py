@@ -0,0 +1,231 @@
+""" Serial command handling for the Cobra camera link controller. Replies
+are read until the <ok> terminator instead of a fixed byte count, and a
+batch of commands can be written at once with the replies matched in
+order. SerialSession keeps one connection open per device and
+serializes access from multiple threads.
+"""
+
+import sys
+import time
+import serial
+import logging
+import threading
+
+from wasatchcameralink.instrument import SERIAL_WRITE, SERIAL_ACK
+
+log = logging.getLogger(__name__)
+
+OK_MARKER = b"<ok>"
+ERROR_MARKERS = (b"<err>",)
+
+
+class CommandTimeout(Exception):
+    """ Raised when no terminator arrives within the reply timeout.
+    """
+
+
+class SerialCommandEngine(object):
+    """ Write carriage return terminated commands to an open pyserial
+    port, read each reply up to and including its terminator. Bytes that
+    arrive after a terminator are kept for the next reply.
+    """
+    def __init__(self, serial_port, timeout=1.0, ok_marker=OK_MARKER,
+                 error_markers=ERROR_MARKERS, instrument=None):
+        super(SerialCommandEngine, self).__init__()
+        self.port = serial_port
+        self.instrument = instrument
+        self.timeout = timeout
+        self.ok_marker = ok_marker
+        self.error_markers = tuple(error_markers)
+        self.pending = b""
+
+    def encode(self, command):
+        return (command + "\r").encode("ascii")
+
+    def write(self, commands):
+        """ Write all the commands in one call, flush the port.
+        """
+        data = b"".join(self.encode(command) for command in commands)
+        log.debug("send commands %r", data)
+        self.port.write(data)
+        self.port.flush()
+
+    def split_reply(self, data):
+        """ Return the index just past the first terminator in data, or
+        -1 if none has arrived yet.
+        """
+        end = -1
+        for marker in (self.ok_marker,) + self.error_markers:
+            pos = data.find(marker)
+            if pos >= 0 and (end < 0 or pos + len(marker) < end):
+                end = pos + len(marker)
+        return end
+
+    def read_reply(self):
+        """ Return the bytes of the next reply, raise CommandTimeout if
+        the terminator does not arrive in time.
+        """
+        data = self.pending
+        deadline = time.time() + self.timeout
+        while True:
+            end = self.split_reply(data)
+            if end >= 0:
+                self.pending = data[end:]
+                return data[:end]
+
+            if time.time() >= deadline:
+                break
+            # read returns as soon as any byte arrives, or after the port
+            # timeout with nothing
+            chunk = self.port.read(self.port.in_waiting or 1)
+            data += chunk
+
+        # Drop partial replies so a late terminator is not matched to the
+        # next command
+        self.pending = b""
+        self.port.reset_input_buffer()
+        raise CommandTimeout("No reply terminator in %r" % data)
+
+    def is_ok(self, reply):
+        return reply.endswith(self.ok_marker)
+
+    def command(self, command):
+        """ Write a single command, return (ok, reply).
+        """
+        return self.batch([command])[0]
+
+    def batch(self, commands):
+        """ Write all commands back to back, then read their replies in
+        order. Return a list of (ok, reply) tuples. Replies after a
+        timeout are reported as (False, None). With an instrument the
+        write and every reply wait are timed as serial_write and
+        serial_ack.
+        """
+        instrument = self.instrument
+        start = time.perf_counter()
+        self.write(commands)
+        if instrument is not None:
+            start = instrument.record(SERIAL_WRITE, start)
+
+        results = []
+        for command in commands:
+            try:
+                reply = self.read_reply()
+                if instrument is not None:
+                    start = instrument.record(SERIAL_ACK, start)
+            except CommandTimeout:
+                log.critical("Command timeout: %s", command)
+                if instrument is not None:
+                    instrument.count("serial_timeouts")
+                results.extend([(False, None)] *
+                               (len(commands) - len(results)))
+                break
+
+            log.debug("Serial read result [%r]", reply)
+            ok = self.is_ok(reply)
+            if not ok:
+                log.critical("Command failure: %s,%r", command, reply)
+            results.append((ok, reply))
+        return results
+
+
+class SerialSession(object):
+    """ Persistent connection to one serial port. Every command goes
+    through a lock so threads cannot interleave writes. An I/O error
+    closes the port and reconnects with exponential backoff before the
+    batch is retried.
+    """
+    def __init__(self, port, baudrate=9600, timeout=1.0, retries=3,
+                 backoff=0.1, max_backoff=2.0, on_connect=None,
+                 instrument=None):
+        super(SerialSession, self).__init__()
+        self.port_name = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.on_connect = on_connect
+        self.instrument = instrument
+
+        self.port = None
+        self.engine = None
+        self.connects = 0
+        self.lock = threading.RLock()
+
+    def is_open(self):
+        return self.port is not None and self.port.is_open
+
+    def connect(self):
+        """ Open the port if it is not already open. Return True when a
+        connection is available.
+        """
+        with self.lock:
+            if self.is_open():
+                return True
+            try:
+                self.port = serial.Serial(self.port_name, self.baudrate,
+                                          timeout=self.timeout,
+                                          write_timeout=self.timeout)
+            except (serial.SerialException, OSError, ValueError):
+                log.critical("Problem opening %s: %s", self.port_name,
+                             sys.exc_info())
+                self.port = None
+                return False
+
+            self.engine = SerialCommandEngine(self.port, self.timeout,
+                                              instrument=self.instrument)
+            self.connects += 1
+            if self.on_connect is not None:
+                self.on_connect()
+            return True
+
+    def close(self):
+        with self.lock:
+            if self.port is not None:
+                try:
+                    self.port.close()
+                except (serial.SerialException, OSError):
+                    log.warning("Problem closing %s", self.port_name)
+            self.port = None
+            self.engine = None
+
+    def reconnect(self, attempt):
+        """ Close the port and try to open it again after a backoff
+        delay that doubles with each attempt.
+        """
+        self.close()
+        if self.instrument is not None:
+            self.instrument.count("serial_reconnects")
+        delay = min(self.backoff * (2 ** attempt), self.max_backoff)
+        log.warning("Reconnect %s in %.2fs", self.port_name, delay)
+        time.sleep(delay)
+        return self.connect()
+
+    def batch(self, commands):
+        """ Send the commands under the session lock, see
+        SerialCommandEngine.batch.
+        """
+        with self.lock:
+            attempt = 0
+            while True:
+                if not self.connect():
+                    if attempt >= self.retries:
+                        raise serial.SerialException(
+                            "Cannot open %s" % self.port_name)
+                    self.reconnect(attempt)
+                    attempt += 1
+                    continue
+                try:
+                    return self.engine.batch(commands)
+                except (serial.SerialException, OSError):
+                    log.critical("Serial failure on %s: %s",
+                                 self.port_name, sys.exc_info())
+                    if attempt >= self.retries:
+                        self.close()
+                        raise
+                    self.reconnect(attempt)
+                    attempt += 1
+
+    def command(self, command):
+        return self.batch([command])[0]
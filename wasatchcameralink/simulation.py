@@ -2,33 +2,48 @@
 communication with camera control devices.
 """
 
-import os
 import numpy
 import logging
 
+from wasatchcameralink import reference
+from wasatchcameralink.streaming import StreamingDevice
+
 log = logging.getLogger(__name__)
 
 
-class SimulatedPipeDevice(object):
+class SimulatedPipeDevice(StreamingDevice):
     """ Use the pipe device interface, return a cycling test pattern of
-    data.
+    data. Grabs and settings changes are paced by the optional
+    TimingModel.
     """
 
-    def __init__(self, pattern_jump=1, top_level=1000):
+    def __init__(self, pattern_jump=1, top_level=1000, timing=None):
+        super(SimulatedPipeDevice, self).__init__()
         #log.debug("Startup")
         self.pattern_position = 0
         self.data_length = 1024
+        self.pixels = self.data_length
         self.top_level = top_level
         self.pattern_jump = pattern_jump
+        self.timing = timing
 
     def setup_pipe(self):
         #log.info("Setup pipe device")
         return True
 
+    def pace_frames(self, count=1):
+        if self.timing is not None:
+            self.timing.wait_frames(count)
+
+    def pace_command(self, count=1):
+        if self.timing is not None:
+            self.timing.wait_command(count)
+
     def grab_pipe(self):
         """ Create a cycling test pattern based on the current position
         """
         #log.debug("Grab pipe")
+        self.pace_frames()
         start = self.pattern_position 
         end = self.pattern_position + self.top_level
         data = numpy.linspace(start, end, 1024)
@@ -39,134 +54,206 @@ class SimulatedPipeDevice(object):
 
         return True, data
 
+    def grab_many(self, count, out=None):
+        """ Return count consecutive test pattern frames in a (count,
+        1024) array, float unless out is given.
+        """
+        self.pace_frames(count)
+        if out is None:
+            out = numpy.empty((count, self.data_length))
+
+        # positions climb by pattern_jump and restart at 0 once they
+        # reach top_level, the first run starts at the current position
+        jump = self.pattern_jump
+        steps = numpy.arange(count)
+        first_run = -(-(self.top_level - self.pattern_position) // jump)
+        cycle = -(-self.top_level // jump)
+        positions = numpy.where(steps < first_run,
+                                self.pattern_position + steps * jump,
+                                ((steps - first_run) % cycle) * jump)
+
+        ramp = numpy.linspace(0, self.top_level, self.data_length)
+        numpy.add(positions[:, None], ramp, out=out, casting="unsafe")
+
+        if count:
+            self.pattern_position = int(positions[-1]) + jump
+            if self.pattern_position >= self.top_level:
+                self.pattern_position = 0
+        return True, out
+
+    def noisy_frames(self, uniform, count, out, level=0):
+        """ Fill out with base_data plus count uniform noise draws in one
+        vectorized pass. level shifts the noise range.
+        """
+        self.pace_frames(count)
+        if out is None:
+            out = numpy.empty((count, self.pixels), dtype=int)
+        noise = uniform(self.noise_floor + level, self.noise_ceiling + level,
+                        (count, self.pixels))
+        noise += self.base_data
+        # unsafe casting truncates like astype(int) in grab_pipe
+        numpy.copyto(out, noise, casting="unsafe")
+        return True, out
+
     def close_pipe(self):
         #log.info("Close pipe device")
+        if self.is_streaming():
+            self.stop_stream()
         self.pattern_position = 0
         return True
         
     def set_gain(self, gain):
         """ Placeholder function to simulate settings change
         """    
+        self.pace_command()
 
     def set_offset(self, offset):
         """ Placeholder function to simulate settings change
         """    
+        self.pace_command()
 
 
 class SimulatedSpectraDevice(SimulatedPipeDevice):
     """ Given a class of spectra, create a default waveform, and return
     randomized data along that waveform.
     """
-    def __init__(self, spectra_type="raman"):
-        super(SimulatedSpectraDevice, self).__init__()
+    def __init__(self, spectra_type="raman", pixels=2048, raman_peaks=10,
+                 peak_width=10, rng=None, timing=None):
+        super(SimulatedSpectraDevice, self).__init__(timing=timing)
         self.spectra_type = spectra_type
+        self.pixels = pixels
+        self.raman_peaks = raman_peaks
+        self.peak_width = peak_width
+        self.noise_floor = 50
+        self.noise_ceiling = 150
+
+        # A numpy Generator, or a seed for a new one
+        if not isinstance(rng, numpy.random.Generator):
+            rng = numpy.random.default_rng(rng)
+        self.rng = rng
 
         if self.spectra_type == "raman":
             self.waveform = self.generate_raman()
 
     def generate_raman(self):
-        self.raman_peaks = 10
-        self.noise_floor = 50
-        self.noise_ceiling = 150
-        nru = numpy.random.uniform
+        """ Store a new random raman spectrum as the base data.
+        """
+        self.base_data = self.generate_library(1)[0]
 
-        low_data = nru(100, 200, 2048)
-        blk = numpy.linspace(0, 0, 2048)
+    def generate_library(self, count):
+        """ Return count random raman spectra as a (count, pixels) array.
+        Baseline, peak positions and peak shapes are drawn in whole array
+        operations.
 
-        # up to half the width, add a value that is at least greater
-        # than a threshold, then move the threshold up
-        width = 10
-    
-        half = width / 2
+        Each peak climbs min_gap counts per pixel for half the peak width
+        then falls back, with up to min_gap of uniform jitter per pixel.
+        """
+        rng = self.rng
+        width = self.peak_width
         min_gap = 10
 
+        spectra = rng.uniform(100, 200, (count, self.pixels))
 
-        for position in range(self.raman_peaks):
+        # keep peaks off the edges of the detector
+        low = 100 if self.pixels > 200 + width else 0
+        high = max(self.pixels - width - 1, low + 1)
+        peaks = (count, self.raman_peaks)
+        positions = rng.integers(low, high, peaks)
+        heights = rng.uniform(500, 1000, peaks).astype(int)
 
-            # get a random peak within the range
-            peak_pos = int(nru(100, 2037, 1))
-            peak_height = int(nru(500, 1000, 1))
-
-            floor = peak_height + min_gap
-            peak_x = peak_pos
-
-            for item in range(half):
-                new_floor = floor + min_gap
-                new_height = nru(floor, new_floor, 1)
-                new_height = int(new_height)
-                floor = new_floor
-                blk[peak_x] = new_height
-                peak_x += 1
-    
-            for item in range(half):
-                new_floor = floor - min_gap
-                new_height = nru(floor, new_floor, 1)
-                new_height = int(new_height)
-                floor = new_floor
-                blk[peak_x] = new_height
-                peak_x += 1
-    
-        self.base_data = low_data + blk
+        steps = numpy.arange(width)
+        ramp = min_gap * numpy.minimum(steps + 1, width - steps)
+        shapes = heights[..., None] + ramp + \
+                 rng.uniform(0, min_gap, peaks + (width,))
 
+        rows = numpy.arange(count)[:, None, None]
+        columns = positions[..., None] + steps
+        spectra[numpy.broadcast_to(rows, columns.shape), columns] += \
+            shapes.astype(int)
+        return spectra
 
     def grab_pipe(self):
         """ Apply randomness at each grab.
         """
-        
-        nru = numpy.random.uniform
-        noise_data = nru(self.noise_floor, self.noise_ceiling, 2048)
+        self.pace_frames()
+        noise_data = self.rng.uniform(self.noise_floor, self.noise_ceiling,
+                                      self.pixels)
         new_data = self.base_data + noise_data
-        test_data = numpy.array(new_data).astype(int)
+        test_data = new_data.astype(int)
         return True, test_data
+
+    def grab_many(self, count, out=None):
+        """ Return count noisy spectra in a (count, pixels) int array, or
+        in out when given.
+        """
+        return self.noisy_frames(self.rng.uniform, count, out)
         
 
 class SimulatedCobraSLED(SimulatedPipeDevice):
     """ Display a sled output based stored data. Apply noise and
     other shifts based on sent commands.
     """
-    def __init__(self, sled_type="single"):
-        super(SimulatedCobraSLED, self).__init__()
+    def __init__(self, sled_type="single", timing=None):
+        super(SimulatedCobraSLED, self).__init__(timing=timing)
         self.sled_type = sled_type
+        self.pixels = 2048
 
+        # base_data is the shared read-only reference array, gain and
+        # offset shift this instance's output through level
         if self.sled_type == "single":
             self.base_data = self.load_single_sled()
 
         self.noise_floor = 0
         self.noise_ceiling = 10
+        self.gain = 0
+        self.offset = 0
+
+    def load_single_sled(self, filename=reference.SINGLE_SLED):
+        """ Return the cached example file, use as baseline data.
+        """
+        return reference.load_reference(filename)
 
-    def load_single_sled(self, filename="cobra_singlesled.txt"):
-        """ Read from an example file, use as baseline data.
+    def load_dark(self, filename=reference.NO_SIGNAL):
+        """ Return the cached no signal reading of the same sensor.
         """
-       
-        # Stored txt is in unknown path at runtime 
-        path, file_name = os.path.split(__file__)
-        filen = "%s/%s" % (path, filename)
-        return numpy.loadtxt(filen, delimiter=",")
+        return reference.load_reference(filename)
+
+    @property
+    def level(self):
+        return self.gain + self.offset
 
     def grab_pipe(self):
         """ Apply randomness at each grab.
         """
-        
+        self.pace_frames()
         nru = numpy.random.uniform
-        noise_data = nru(self.noise_floor, self.noise_ceiling, 2048)
-        new_data = self.base_data + noise_data
-        test_data = numpy.array(new_data).astype(int)
+        level = self.level
+        noise_data = nru(self.noise_floor + level,
+                         self.noise_ceiling + level, 2048)
+        noise_data += self.base_data
+        test_data = noise_data.astype(int)
         return True, test_data
+
+    def grab_many(self, count, out=None):
+        """ Return count noisy sled frames in a (count, pixels) int
+        array, or in out when given.
+        """
+        return self.noisy_frames(numpy.random.uniform, count, out,
+                                 self.level)
             
     def set_gain(self, gain):
-        """ Reload the base data, multiply by the gain for easily
-        visualizable results.
+        """ Raise the output by the gain for easily visualizable
+        results.
         """
-        new_data = self.base_data + gain
-        self.base_data = new_data
-        pass
+        self.pace_command()
+        self.gain = gain
             
     def set_offset(self, offset):
-        """ Reload the base data, add by the (offset*10) for easily
-        visualizable results.
+        """ Raise the output by the offset for easily visualizable
+        results.
         """
-        new_data = self.base_data + offset
-        self.base_data = new_data
+        self.pace_command()
+        self.offset = offset
 
     def open_port(self):
         """ simulated serial control
@@ -179,6 +266,7 @@ class SimulatedCobraSLED(SimulatedPipeDevice):
         return True
 
     def start_scan(self):
-        """ simulated serial control
+        """ simulated serial control, init, ats and lsc commands
         """
+        self.pace_command(3)
         return True
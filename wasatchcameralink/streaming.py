@@ -0,0 +1,160 @@
+""" Free running acquisition shared by the hardware and simulated
+devices. A background producer thread keeps grabbing frames while
+consumers pull the newest or the next frame, or get called back for
+every frame.
+"""
+
+import sys
+import time
+import logging
+import threading
+import collections
+
+log = logging.getLogger(__name__)
+
+Frame = collections.namedtuple("Frame", "sequence timestamp data")
+
+
+class StreamBusyError(Exception):
+    """ Raised by a direct grab while the producer thread owns the pipe.
+    """
+
+
+class StreamingDevice(object):
+    """ Mixin for classes that provide grab_pipe. Only the newest frame
+    is held, consumers slower than the producer skip frames.
+    """
+    def __init__(self):
+        super(StreamingDevice, self).__init__()
+        self.stream_thread = None
+        self.stream_stop = threading.Event()
+        self.stream_ready = threading.Condition()
+        self.stream_callbacks = []
+        self.stream_active = False
+        self.newest_frame = None
+
+    def generate_frames(self, stop_event):
+        """ Yield pixel data until stop_event is set. Devices that can
+        acquire faster than one grab_pipe handshake per frame override
+        this.
+        """
+        while not stop_event.is_set():
+            result, data = self.grab_pipe()
+            if not result:
+                log.critical("Stream grab failure, stopping")
+                return
+            yield data
+
+    def start_stream(self, callback=None):
+        """ Start the producer thread. The optional callback is called
+        from the producer thread with each Frame.
+        """
+        if self.is_streaming():
+            log.warning("Stream already running")
+            return False
+
+        if callback is not None:
+            self.stream_callbacks.append(callback)
+
+        self.stream_stop.clear()
+        self.stream_active = True
+        self.newest_frame = None
+        self.stream_thread = threading.Thread(target=self.stream_loop,
+                                              name="frame-producer")
+        self.stream_thread.daemon = True
+        self.stream_thread.start()
+        return True
+
+    def stop_stream(self, timeout=None):
+        """ Signal the producer thread to stop and wait for it to exit.
+        """
+        self.stream_stop.set()
+        if self.stream_thread is not None:
+            self.stream_thread.join(timeout)
+            if self.stream_thread.is_alive():
+                log.critical("Producer thread did not stop")
+                return False
+        self.stream_thread = None
+        del self.stream_callbacks[:]
+        return True
+
+    def is_streaming(self):
+        return self.stream_active
+
+    def check_pipe_owner(self):
+        """ Direct grabs read the same pipe as the producer thread, refuse
+        them from other threads while the stream runs.
+        """
+        if self.is_streaming() and \
+           threading.current_thread() is not self.stream_thread:
+            raise StreamBusyError("Device is streaming, use next_frame "
+                                  "or stop_stream first")
+
+    def stream_loop(self):
+        """ Producer thread body, publish each generated frame.
+        """
+        sequence = 0
+        try:
+            for data in self.generate_frames(self.stream_stop):
+                frame = Frame(sequence, time.time(), data)
+                sequence += 1
+                self.publish_frame(frame)
+        except:
+            log.critical("Producer failure: " + str(sys.exc_info()))
+
+        with self.stream_ready:
+            self.stream_active = False
+            self.stream_ready.notify_all()
+
+    def publish_frame(self, frame):
+        with self.stream_ready:
+            self.newest_frame = frame
+            self.stream_ready.notify_all()
+
+        for callback in list(self.stream_callbacks):
+            try:
+                callback(frame)
+            except:
+                log.critical("Frame callback failure: " + \
+                             str(sys.exc_info()))
+
+    def latest_frame(self):
+        """ Return the newest Frame without waiting, None if nothing has
+        been acquired yet.
+        """
+        return self.newest_frame
+
+    def next_frame(self, after=None, timeout=None):
+        """ Wait for a frame with a sequence number greater than after,
+        by default for a frame newer than the current one. Return None
+        on timeout or when the stream stops.
+        """
+        if after is None:
+            frame = self.newest_frame
+            after = -1 if frame is None else frame.sequence
+
+        def arrived():
+            frame = self.newest_frame
+            if frame is not None and frame.sequence > after:
+                return True
+            return not self.is_streaming()
+
+        with self.stream_ready:
+            self.stream_ready.wait_for(arrived, timeout)
+            frame = self.newest_frame
+
+        if frame is None or frame.sequence <= after:
+            return None
+        return frame
+
+    def frames(self, timeout=None):
+        """ Iterate over the frames of the running stream, stop when the
+        stream stops or no frame arrives within timeout.
+        """
+        after = -1
+        while True:
+            frame = self.next_frame(after, timeout)
+            if frame is None:
+                return
+            after = frame.sequence
+            yield frame
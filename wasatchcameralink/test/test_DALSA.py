@@ -8,6 +8,7 @@ import logging
 
 from wasatchcameralink.DALSA import Cobra
 from wasatchcameralink.DALSA import BaslerSprint4K
+from wasatchcameralink.DALSA import decode_pixels
 
 logging.basicConfig(level=logging.DEBUG)
 log = logging.getLogger()
@@ -142,6 +143,25 @@ class TestBasler4K(unittest.TestCase):
 
         self.assertTrue(self.dev.close_pipe())
 
+class TestDecode(unittest.TestCase):
+
+    def test_decode_matches_pixels(self):
+        pixels = numpy.arange(2048, dtype="<u2") * 17
+        data = decode_pixels(pixels.tobytes(), 2048)
+        self.assertEqual(data.dtype, numpy.uint16)
+        self.assertEqual(len(data), 2048)
+        self.assertTrue(numpy.array_equal(data, pixels))
+
+    def test_decode_ignores_trailing_bytes(self):
+        raw = numpy.arange(4096, dtype="<u2").tobytes()
+        data = decode_pixels(raw, 2048)
+        self.assertEqual(len(data), 2048)
+        self.assertEqual(data[-1], 2047)
+
+    def test_decode_short_buffer_fails(self):
+        raw = numpy.arange(100, dtype="<u2").tobytes()
+        self.assertRaises(ValueError, decode_pixels, raw, 2048)
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -0,0 +1,171 @@
+""" asyncio device interface tests against the stand-in grab console
+and the simulated devices.
+"""
+
+import os
+import numpy
+import asyncio
+import shutil
+import tempfile
+import unittest
+
+from wasatchcameralink import simulation
+from wasatchcameralink.aio import AsyncDevice, AsyncSaperaCMD, \
+                                  AsyncSimulatedDevice
+from wasatchcameralink.ccf import activate_crop
+from wasatchcameralink.consolepool import ConsolePool
+from wasatchcameralink.DALSA import CONSOLE_DIR, Cobra, OPTOCobra
+from wasatchcameralink.grabconsole import console_command
+
+
+class TestAsyncConsole(unittest.TestCase):
+
+    def setUp(self):
+        self.orig_dir = os.getcwd()
+        self.work_dir = tempfile.mkdtemp()
+        os.chdir(self.work_dir)
+
+        self.cobra = Cobra()
+        self.cobra.console = console_command()
+
+    def tearDown(self):
+        os.chdir(self.orig_dir)
+        shutil.rmtree(self.work_dir)
+
+    def cycle(self):
+        dev = AsyncSaperaCMD(self.cobra)
+
+        async def run():
+            self.assertTrue(await dev.setup_pipe())
+            frames = [frame async for frame in dev.frames(3)]
+            self.assertTrue(await dev.close_pipe())
+            return frames
+
+        frames = await_(run())
+        self.assertEqual([frame.sequence for frame in frames], [0, 1, 2])
+        for i, frame in enumerate(frames):
+            self.assertEqual(len(frame.data), 2048)
+            self.assertEqual(frame.data[3], i + 3)
+        self.assertEqual(dev.process.returncode, 0)
+
+    def test_grab_mode(self):
+        self.cycle()
+
+    def test_stream_mode(self):
+        self.cobra.command = "stream"
+        self.cycle()
+
+    def pooled_cycle(self, command):
+        pool = ConsolePool(standby=0)
+        self.cobra.console_pool = pool
+        self.cobra.command = command
+        dev = AsyncSaperaCMD(self.cobra)
+
+        async def run():
+            self.assertTrue(await dev.setup_pipe())
+            first = await dev.grab()
+            self.assertTrue(await dev.close_pipe())
+            return first
+
+        try:
+            key = pool.prestart(self.cobra, 1)
+            process = pool.idle[key][0].process
+            result, data = await_(run())
+            self.assertTrue(result)
+            self.assertEqual(data[3], 3)
+            self.assertEqual(pool.stats()["warm"], 1)
+            self.assertIs(pool.idle[key][0].process, process)
+
+            # the blocking device picks up where the async one stopped
+            self.assertTrue(self.cobra.setup_pipe())
+            self.assertIs(self.cobra.pipe, process)
+            result, data = self.cobra.grab_pipe()
+            self.assertEqual(data[3], 4)
+            self.cobra.close_pipe()
+        finally:
+            pool.shutdown()
+
+    def test_pooled_grab_mode(self):
+        self.pooled_cycle("grab")
+
+    def test_pooled_stream_mode(self):
+        self.pooled_cycle("stream")
+
+    def test_devices_share_loop(self):
+        other = Cobra()
+        other.console = console_command()
+        for device in (self.cobra, other):
+            device.command = "stream"
+        devices = [AsyncSaperaCMD(self.cobra), AsyncSaperaCMD(other)]
+
+        async def run():
+            await asyncio.gather(*[dev.setup_pipe() for dev in devices])
+            results = await asyncio.gather(*[dev.grab() for dev in devices])
+            await asyncio.gather(*[dev.close_pipe() for dev in devices])
+            return results
+
+        for result, data in await_(run()):
+            self.assertTrue(result)
+            self.assertEqual(data[0], 0)
+
+    def test_line_frames(self):
+        path = activate_crop(os.path.join(CONSOLE_DIR, "opto.ccf"),
+                             os.path.join(self.work_dir, "opto.ccf"))
+        opto = OPTOCobra(ccf=path)
+        opto.console = console_command()
+        opto.command = "stream"
+        opto.line_frames = True
+        dev = AsyncSaperaCMD(opto)
+
+        async def run():
+            await dev.setup_pipe()
+            frames = [frame async for frame in dev.frames(482)]
+            await dev.close_pipe()
+            return frames
+
+        frames = await_(run())
+        self.assertEqual(len(frames), 482)
+        self.assertEqual(frames[479].data[0], 479)
+        self.assertEqual(frames[480].data[0], 1)
+        self.assertEqual(frames[481].sequence, 481)
+        self.assertEqual(opto.frame_count, 1)
+
+
+class TestAsyncSimulated(unittest.TestCase):
+
+    def test_sled_cycle(self):
+        dev = AsyncSimulatedDevice(simulation.SimulatedCobraSLED())
+
+        async def run():
+            await dev.setup_pipe()
+            result, start = await dev.grab()
+            await dev.set_gain(100)
+            result, data = await dev.grab()
+            await dev.close_pipe()
+            return start, data
+
+        start, data = await_(run())
+        self.assertGreater(numpy.average(data), numpy.average(start))
+
+    def test_force_accepted(self):
+        dev = AsyncSimulatedDevice(simulation.SimulatedCobraSLED())
+        await_(dev.set_gain(10, force=True))
+        await_(dev.set_offset(5, force=True))
+        self.assertEqual((dev.device.gain, dev.device.offset), (10, 5))
+
+    def test_executor_grab(self):
+        dev = AsyncDevice(simulation.SimulatedCobraSLED())
+
+        async def run():
+            return [frame async for frame in dev.frames(2)]
+
+        frames = await_(run())
+        self.assertEqual([frame.sequence for frame in frames], [0, 1])
+        self.assertEqual(len(frames[0].data), 2048)
+
+
+def await_(coroutine):
+    return asyncio.run(coroutine)
+
+if __name__ == "__main__":
+    unittest.main()
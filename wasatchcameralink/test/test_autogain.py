@@ -0,0 +1,190 @@
+""" closed loop gain and offset control tests
+"""
+
+import numpy
+import unittest
+
+from wasatchcameralink import simulation
+from wasatchcameralink.DALSA import Cobra
+from wasatchcameralink.timing import TimingModel
+from wasatchcameralink.autogain import AutoGain, current_setting, \
+                                       frame_stats
+
+
+class ScaledDevice(object):
+    """ Gain multiplies the signal and the output clips at 12 bits, a
+    response the secant model only approximates. With a negative
+    offset_scale the output falls as the offset rises, as on the Cobra.
+    """
+    def __init__(self, acknowledge=True, offset_scale=1):
+        super(ScaledDevice, self).__init__()
+        self.signal = 200 + 300 * numpy.hanning(2048)
+        self.gain = 0
+        self.offset = 0
+        self.acknowledge = acknowledge
+        self.offset_scale = offset_scale
+
+    def set_gain(self, gain):
+        self.gain = gain
+        return 1 if self.acknowledge else 0
+
+    def set_offset(self, offset):
+        self.offset = offset
+        return 1
+
+    def grab_pipe(self):
+        scale = 1.0 + self.gain / 32.0 + (self.gain / 96.0) ** 2
+        data = self.signal * scale + self.offset_scale * self.offset
+        return 1, numpy.clip(data, 0, 4095).astype(numpy.uint16)
+
+
+class TestFrameStats(unittest.TestCase):
+
+    def test_stats(self):
+        data = numpy.arange(4096)
+        stats = frame_stats(data, 99.0, 1.0, 4095)
+        self.assertAlmostEqual(stats.level, 0.99 * 4095)
+        self.assertAlmostEqual(stats.dark, 0.01 * 4095)
+        self.assertEqual(stats.saturated, 1 / 4096.0)
+
+    def test_current_setting(self):
+        dev = Cobra()
+        self.assertIsNone(current_setting(dev, "gain"))
+        dev.update_settings("gain 100")
+        self.assertEqual(current_setting(dev, "gain"), 100)
+
+        sled = simulation.SimulatedCobraSLED()
+        sled.set_offset(7)
+        self.assertEqual(current_setting(sled, "offset"), 7)
+
+
+class TestSLEDAutoGain(unittest.TestCase):
+
+    def setUp(self):
+        numpy.random.seed(2)
+        self.dev = simulation.SimulatedCobraSLED()
+
+    def test_gain(self):
+        control = AutoGain(self.dev, target=3150, tolerance=10)
+        gain, = control.run()
+        self.assertTrue(gain.converged)
+        self.assertLessEqual(gain.steps, 4)
+        self.assertLessEqual(abs(gain.level - 3150), 10)
+        self.assertEqual(self.dev.gain, gain.value)
+        # the sled 99th percentile sits near 2970 with no gain
+        self.assertLess(abs(gain.value - 180), 10)
+
+    def test_offset_then_gain(self):
+        timing = TimingModel()
+        self.dev = simulation.SimulatedCobraSLED(timing=timing)
+        control = AutoGain(self.dev, target=3100, dark_target=2300)
+        offset, gain = control.run()
+        self.assertEqual(offset.name, "offset")
+        self.assertTrue(offset.converged and gain.converged)
+        self.assertEqual((self.dev.offset, self.dev.gain),
+                         (offset.value, gain.value))
+
+        # a handful of commands and frames instead of a 255 step sweep
+        stats = timing.stats()
+        self.assertEqual(stats["commands"], control.stats()["commands"])
+        self.assertLessEqual(stats["frames"], 8)
+
+    def test_saturated_start(self):
+        self.dev.set_gain(1500)
+        control = AutoGain(self.dev, target=3100, gain_range=(0, 2000))
+        gain, = control.run()
+        self.assertTrue(gain.converged)
+        self.assertLessEqual(gain.steps, 6)
+        self.assertGreater(control.history[0][3], 0.1)
+
+    def test_unreachable(self):
+        control = AutoGain(self.dev, target=4000, max_steps=8)
+        gain, = control.run()
+        self.assertFalse(gain.converged)
+        self.assertEqual(gain.value, 255)
+        self.assertLessEqual(gain.steps, 4)
+
+
+class TestScaledAutoGain(unittest.TestCase):
+
+    def test_nonlinear_gain(self):
+        dev = ScaledDevice()
+        control = AutoGain(dev, target=3000, tolerance=20)
+        gain, = control.run()
+        self.assertTrue(gain.converged)
+        self.assertLessEqual(gain.steps, 6)
+        result, data = dev.grab_pipe()
+        self.assertLess(abs(numpy.percentile(data, 99) - 3000), 20)
+
+    def test_bounded_steps(self):
+        dev = ScaledDevice()
+        control = AutoGain(dev, target=3000, tolerance=0, max_steps=3)
+        gain, = control.run()
+        self.assertEqual(gain.steps, 3)
+        self.assertFalse(gain.converged)
+        # left at the closest of the measured settings
+        levels = dict((value, level)
+                      for name, value, level, saturated in control.history)
+        self.assertEqual(gain.level, levels[gain.value])
+        self.assertEqual(dev.gain, gain.value)
+
+    def test_not_acknowledged(self):
+        control = AutoGain(ScaledDevice(acknowledge=False), target=3000)
+        gain, = control.run()
+        self.assertFalse(gain.converged)
+        self.assertEqual(gain.steps, 0)
+        self.assertIsNone(gain.level)
+
+
+class TestFallingOffset(unittest.TestCase):
+    """ The level falls by 4 counts per offset step from 1200 at offset
+    0, the dark percentile sits near 1200.
+    """
+    def device(self):
+        dev = ScaledDevice(offset_scale=-4)
+        dev.signal = dev.signal + 1000
+        return dev
+
+    def check(self, dev, offset, target):
+        self.assertTrue(offset.converged)
+        self.assertEqual(dev.offset, offset.value)
+        result, data = dev.grab_pipe()
+        self.assertLess(abs(numpy.percentile(data, 1) - target), 10)
+
+    def test_inferred(self):
+        dev = self.device()
+        control = AutoGain(dev, dark_target=800, tolerance=10)
+        offset = control.adjust_offset()
+        self.check(dev, offset, 800)
+        self.assertLessEqual(offset.steps, 4)
+        # a lower dark level needs a higher offset
+        self.assertGreater(offset.value, 90)
+
+    def test_given_direction(self):
+        dev = self.device()
+        dev.offset = 200
+        control = AutoGain(dev, dark_target=1000, tolerance=10,
+                           directions={"offset": -1}, slope=4)
+        offset = control.adjust_offset()
+        self.check(dev, offset, 1000)
+        self.assertLessEqual(offset.steps, 3)
+
+    def test_offset_then_gain(self):
+        dev = self.device()
+        control = AutoGain(dev, target=3000, dark_target=900,
+                           tolerance=20)
+        offset, gain = control.run()
+        self.assertTrue(offset.converged and gain.converged)
+        result, data = dev.grab_pipe()
+        self.assertLess(abs(numpy.percentile(data, 99) - 3000), 20)
+
+    def test_saturated_probe(self):
+        # offset 0 clips the whole frame, the probe at 127 does not
+        dev = ScaledDevice(offset_scale=-20)
+        dev.signal = dev.signal + 4500
+        control = AutoGain(dev, dark_target=2000, tolerance=10)
+        offset = control.adjust_offset()
+        self.check(dev, offset, 2000)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+""" hardware free benchmark suite smoke tests.
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from wasatchcameralink import benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_report(self):
+        output = os.path.join(self.work_dir, "bench.json")
+        self.assertEqual(benchmark.main(["--frames", "20",
+                                         "--output", output]), 0)
+        with open(output) as in_file:
+            report = json.load(in_file)
+
+        names = [result["name"] for result in report["results"]]
+        for name in ("decode_2048", "pipe_grab", "pipe_stream",
+                     "serial_gain", "sim_sled"):
+            self.assertIn(name, names)
+
+        for result in report["results"]:
+            self.assertEqual(result["frames"], 20)
+            self.assertGreater(result["frames_per_sec"], 0)
+            self.assertLessEqual(result["latency_p50_ms"],
+                                 result["latency_p99_ms"])
+
+        # the line benchmarks time whole snaps
+        lines = dict((result["name"], result)
+                     for result in report["results"])["pipe_stream_lines"]
+        self.assertEqual(lines["lines_per_snap"], 480)
+        self.assertAlmostEqual(lines["lines_per_sec"],
+                               lines["frames_per_sec"] * 480)
+
+        rows = benchmark.compare(report, report)
+        self.assertEqual(len(rows), len(names))
+        self.assertEqual(rows[0][3], 1.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+""" ccf configuration parser tests.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from wasatchcameralink import ccf
+from wasatchcameralink.DALSA import CONSOLE_DIR, OPTOCobra
+
+
+class TestCCF(unittest.TestCase):
+
+    def setUp(self):
+        ccf.clear_cache()
+
+    def load(self, name):
+        return ccf.parse_ccf(os.path.join(CONSOLE_DIR, "%s.ccf" % name))
+
+    def test_cobra(self):
+        config = self.load("cobra")
+        self.assertEqual(config.crop_width, 2048)
+        self.assertEqual(config.crop_height, 1)
+        self.assertEqual(config.pixel_depth, 12)
+        self.assertEqual(config.output_format, 3)
+        self.assertEqual(config.pixel_format, "mono16")
+        self.assertEqual(config.frame_bytes, 4096)
+        self.assertEqual(config.get("Board", "Server Name"), "Xcelera-CL_LX1")
+        self.assertEqual(config.get("Serial Port", "Initialization String"),
+                         "")
+
+    def test_opto_and_basler(self):
+        opto = self.load("opto")
+        self.assertEqual(opto.crop_height, 480)
+        # the crop rectangle is not active, frames are single lines
+        self.assertFalse(opto.crop_activation)
+        self.assertEqual(opto.frame_lines, 1)
+        self.assertEqual(opto.frame_bytes, 4096)
+        self.assertEqual(self.load("BaslerSprint4K").crop_width, 4096)
+
+    def test_immutable(self):
+        config = self.load("cobra")
+        self.assertRaises(AttributeError, setattr, config, "crop_width", 1)
+        output = config.sections["Output"]
+        with self.assertRaises(TypeError):
+            output["Output Format"] = "0"
+
+    def test_cached_until_modified(self):
+        work_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(work_dir, "test.ccf")
+            shutil.copy(os.path.join(CONSOLE_DIR, "cobra.ccf"), path)
+            first = ccf.parse_ccf(path)
+            self.assertIs(ccf.parse_ccf(path), first)
+
+            with open(path, "a") as out_file:
+                out_file.write("[Stream Conditioning]\nCrop Width=1024\n")
+            stat = os.stat(path)
+            os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+
+            second = ccf.parse_ccf(path)
+            self.assertIsNot(second, first)
+            self.assertEqual(second.crop_width, 1024)
+        finally:
+            shutil.rmtree(work_dir)
+
+    def test_opto_device_geometry(self):
+        dev = OPTOCobra()
+        self.assertEqual(dev.ccf, "opto")
+        self.assertEqual(dev.card, "Xcelera-CL_PX4_1")
+        self.assertEqual((dev.lines, dev.pixels), (1, 2048))
+        self.assertEqual(dev.decode(bytes(2048 * 2)).shape, (2048,))
+
+    def test_activated_crop(self):
+        work_dir = tempfile.mkdtemp()
+        try:
+            path = ccf.activate_crop(os.path.join(CONSOLE_DIR, "opto.ccf"),
+                                     os.path.join(work_dir, "opto.ccf"))
+            config = ccf.parse_ccf(path)
+            self.assertTrue(config.crop_activation)
+            self.assertEqual(config.frame_lines, 480)
+            self.assertEqual(config.frame_bytes, 480 * 2048 * 2)
+            self.assertEqual(config.get("Board", "Server Name"),
+                             self.load("opto").get("Board", "Server Name"))
+
+            dev = OPTOCobra(ccf=path)
+            self.assertEqual(dev.ccf_path(), path)
+            self.assertEqual(dev.console_args()[4], path)
+            self.assertEqual((dev.lines, dev.pixels), (480, 2048))
+            data = dev.decode(bytes(480 * 2048 * 2))
+            self.assertEqual(data.shape, (480, 2048))
+        finally:
+            shutil.rmtree(work_dir)
+
+if __name__ == "__main__":
+    unittest.main()
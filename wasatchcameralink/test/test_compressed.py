@@ -0,0 +1,144 @@
+""" compressed archive tests
+"""
+
+import os
+import numpy
+import shutil
+import tempfile
+import unittest
+
+from wasatchcameralink import compressed
+from wasatchcameralink import recorder
+from wasatchcameralink import simulation
+
+
+def sled_frames(count):
+    dev = simulation.SimulatedCobraSLED()
+    result, data = dev.grab_many(count,
+                                 numpy.empty((count, 2048), numpy.uint16))
+    return data
+
+
+class TestCompressedArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.work_dir, "test.wpc")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def write(self, frames, **options):
+        writer = compressed.CompressedArchiveWriter(
+            self.path, frames.shape[-1], **options)
+        count = len(frames)
+        writer.append(frames, range(count), numpy.arange(count) * 0.5)
+        writer.close()
+        return writer
+
+    def test_round_trip_modes(self):
+        frames = sled_frames(150)
+        for codec in sorted(compressed.CODECS):
+            for delta in compressed.DELTA_MODES:
+                self.write(frames, codec=codec, delta=delta,
+                           chunk_frames=32)
+                archive = compressed.CompressedArchive(self.path)
+                self.assertEqual(len(archive), 150)
+                self.assertFalse(archive.recovered)
+                self.assertTrue(numpy.array_equal(archive.read(), frames),
+                                (codec, delta))
+                archive.close()
+
+    def test_random_access(self):
+        frames = sled_frames(200)
+        self.write(frames, chunk_frames=16)
+        archive = compressed.CompressedArchive(self.path)
+        for frame in (0, 15, 16, 199, 101, -1):
+            self.assertTrue(numpy.array_equal(archive[frame],
+                                              frames[frame]))
+        self.assertRaises(IndexError, archive.__getitem__, 200)
+        self.assertTrue(numpy.array_equal(archive.read(10, 50),
+                                          frames[10:50]))
+        self.assertEqual(archive.sequences[77], 77)
+        self.assertEqual(archive.timestamps[10], 5.0)
+        archive.close()
+
+    def test_wrapping_deltas(self):
+        frames = numpy.array([[0, 65535, 10], [65535, 0, 9],
+                              [1, 1, 65535]], dtype=numpy.uint16)
+        for delta in compressed.DELTA_MODES:
+            self.write(frames, delta=delta)
+            archive = compressed.CompressedArchive(self.path)
+            self.assertTrue(numpy.array_equal(archive.read(), frames))
+            archive.close()
+
+    def test_compresses_sled(self):
+        writer = self.write(sled_frames(256))
+        stats = writer.stats()
+        self.assertEqual(stats["frames"], 256)
+        self.assertEqual(stats["chunks"], 4)
+        self.assertEqual(stats["stored_bytes"], os.path.getsize(self.path))
+        self.assertGreater(stats["ratio"], 2.0)
+
+    def test_multi_line_uint8(self):
+        frames = numpy.arange(5 * 2 * 8, dtype=numpy.uint8).reshape(5, 2, 8)
+        writer = compressed.CompressedArchiveWriter(
+            self.path, 8, lines=2, dtype=numpy.uint8, chunk_frames=2)
+        writer.append(frames, range(5), range(5))
+        writer.close()
+
+        archive = compressed.CompressedArchive(self.path)
+        self.assertEqual(archive[4].shape, (2, 8))
+        self.assertTrue(numpy.array_equal(archive.read(), frames))
+        archive.close()
+
+    def test_recover_unclosed(self):
+        frames = sled_frames(100)
+        writer = compressed.CompressedArchiveWriter(self.path, 2048,
+                                                    chunk_frames=32)
+        writer.append(frames, range(100), range(100))
+        writer.drain(all_chunks=True)
+        writer.out_file.flush()
+        # Simulate a crash part way through the next chunk
+        with open(self.path, "ab") as out_file:
+            out_file.write(compressed.CHUNK_HEADER.pack(
+                compressed.CHUNK_MAGIC, 32, 5000))
+
+        archive = compressed.CompressedArchive(self.path)
+        self.assertTrue(archive.recovered)
+        self.assertEqual(len(archive), 96)
+        self.assertTrue(numpy.array_equal(archive[95], frames[95]))
+        archive.close()
+        writer.executor.shutdown()
+        writer.out_file.close()
+
+    def test_empty(self):
+        writer = compressed.CompressedArchiveWriter(
+            self.path, 4, delta=compressed.DELTA_REFERENCE)
+        writer.close()
+        archive = compressed.CompressedArchive(self.path)
+        self.assertEqual(len(archive), 0)
+        self.assertEqual(archive.read().shape, (0, 4))
+        archive.close()
+
+    def test_bad_options(self):
+        self.assertRaises(ValueError, compressed.CompressedArchiveWriter,
+                          self.path, 4, codec="zip")
+        self.assertRaises(ValueError, compressed.CompressedArchiveWriter,
+                          self.path, 4, dtype=numpy.float64)
+
+    def test_recorder_writer(self):
+        frames = sled_frames(40)
+        rec = recorder.FrameRecorder(
+            self.path, 2048, writer_class=compressed.CompressedArchiveWriter,
+            writer_options={"chunk_frames": 8})
+        for frame in frames:
+            rec.record(frame)
+        self.assertTrue(rec.close())
+
+        archive = compressed.CompressedArchive(self.path)
+        self.assertTrue(numpy.array_equal(archive.read(), frames))
+        archive.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,187 @@
+""" grab console pool tests against the stand-in grab console.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from wasatchcameralink.consolepool import ConsolePool, pool_key, \
+                                          quit_console
+from wasatchcameralink.DALSA import Cobra, OPTOCobra
+from wasatchcameralink.grabconsole import console_command
+
+
+class TestConsolePool(unittest.TestCase):
+
+    def setUp(self):
+        self.orig_dir = os.getcwd()
+        self.work_dir = tempfile.mkdtemp()
+        os.chdir(self.work_dir)
+        self.pool = ConsolePool(standby=1)
+
+    def tearDown(self):
+        self.pool.shutdown()
+        os.chdir(self.orig_dir)
+        shutil.rmtree(self.work_dir)
+
+    def device(self, device_class=Cobra, command="grab"):
+        dev = device_class(console_pool=self.pool)
+        dev.console = console_command()
+        dev.command = command
+        return dev
+
+    def wait_idle(self, key, count=1):
+        for i in range(100):
+            if self.pool.idle_count(key) >= count:
+                return
+            time.sleep(0.02)
+        self.fail("No standby console for %s" % (key,))
+
+    def test_warm_acquire(self):
+        dev = self.device()
+        key = self.pool.prestart(dev)
+        self.assertEqual(self.pool.idle_count(key), 1)
+
+        self.assertTrue(dev.setup_pipe())
+        result, data = dev.grab_pipe()
+        self.assertTrue(result)
+        self.assertEqual(len(data), 2048)
+        dev.close_pipe()
+
+        stats = self.pool.stats()
+        self.assertEqual(stats["warm"], 1)
+        self.assertEqual(stats.get("cold", 0), 0)
+        self.assertEqual(stats["in_use"], 0)
+        # the standby replacement and the released console
+        self.wait_idle(key, 2)
+
+    def test_release_and_reuse(self):
+        self.pool.standby = 0
+        dev = self.device(command="stream")
+        self.assertTrue(dev.setup_pipe())
+        first = dev.pipe
+        self.assertTrue(dev.grab_pipe()[0])
+        dev.close_pipe()
+
+        self.assertTrue(dev.setup_pipe())
+        self.assertTrue(dev.pipe is first)
+        result, data = dev.grab_pipe()
+        dev.close_pipe()
+        self.assertTrue(result)
+        # the same console keeps counting frames
+        self.assertEqual(dev.frame_count, 1)
+        self.assertEqual(self.pool.stats()["cold"], 1)
+
+    def test_ccf_switch(self):
+        cobra = self.device(Cobra)
+        opto = self.device(OPTOCobra)
+        self.pool.prestart(cobra)
+        self.pool.prestart(opto)
+        self.assertNotEqual(pool_key(cobra), pool_key(opto))
+        self.assertEqual(self.pool.idle_count(), 2)
+
+        for dev in (cobra, opto, cobra):
+            self.assertTrue(dev.setup_pipe())
+            self.assertTrue(dev.grab_pipe()[0])
+            dev.close_pipe()
+            self.wait_idle(pool_key(dev))
+        self.assertEqual(self.pool.stats()["warm"], 3)
+
+    def test_unhealthy_release(self):
+        dev = self.device()
+        self.assertTrue(dev.setup_pipe())
+        process = dev.pipe
+        dev.close_pipe(healthy=False)
+        self.assertEqual(process.returncode, 0)
+        stats = self.pool.stats()
+        self.assertEqual(stats["discarded"], 1)
+        self.assertEqual(stats["quit"], 1)
+
+    def test_dead_console_replaced(self):
+        dev = self.device()
+        key = self.pool.prestart(dev)
+        console = self.pool.idle[key][0]
+        console.process.kill()
+        console.process.wait()
+
+        self.assertTrue(dev.setup_pipe())
+        self.assertFalse(dev.pipe is console.process)
+        self.assertTrue(dev.grab_pipe()[0])
+        dev.close_pipe()
+        stats = self.pool.stats()
+        self.assertEqual(stats["died"], 1)
+        self.assertEqual(stats["cold"], 1)
+
+    def test_health_check(self):
+        pool = ConsolePool(standby=2, max_idle=60)
+        try:
+            dev = Cobra(console_pool=pool)
+            dev.console = console_command()
+            dev.command = "stream"
+            key = pool.prestart(dev)
+            pool.idle[key][0].process.kill()
+            pool.idle[key][0].process.wait()
+
+            pool.check_idle()
+            self.assertEqual(pool.idle_count(key), 2)
+            self.assertTrue(all(console.is_alive()
+                                for console in pool.idle[key]))
+
+            # expired consoles are recycled
+            pool.max_idle = 0
+            pool.check_idle()
+            self.assertEqual(pool.idle_count(key), 2)
+            stats = pool.stats()
+        finally:
+            pool.shutdown()
+        self.assertEqual(stats["checks"], 2)
+        self.assertEqual(stats["discarded"], 3)
+        self.assertEqual(stats["started"], 5)
+
+    def test_shutdown(self):
+        dev = self.device()
+        key = self.pool.prestart(dev, 2)
+        processes = [console.process for console in self.pool.idle[key]]
+        self.assertTrue(dev.setup_pipe())
+        in_use = dev.pipe
+
+        self.pool.shutdown()
+        for process in processes[1:]:
+            self.assertEqual(process.returncode, 0)
+        self.assertEqual(self.pool.idle_count(), 0)
+
+        # released after shutdown, quit instead of kept
+        dev.close_pipe()
+        self.assertEqual(in_use.returncode, 0)
+        self.assertEqual(self.pool.idle_count(), 0)
+
+    def test_shutdown_during_start(self):
+        dev = self.device()
+        key = self.pool.register(dev)
+        started = []
+        start_process = self.pool.start_process
+
+        def slow_start(key):
+            console = start_process(key)
+            started.append(console.process)
+            # shutdown runs after the closed check, before the append
+            self.pool.shutdown()
+            return console
+
+        self.pool.start_process = slow_start
+        self.pool.replenish(key)
+        self.assertEqual(self.pool.idle_count(), 0)
+        self.assertEqual(started[0].returncode, 0)
+        self.assertEqual(self.pool.stats()["quit"], 1)
+
+    def test_quit_console(self):
+        dev = Cobra()
+        dev.console = console_command()
+        self.assertTrue(dev.setup_pipe())
+        self.assertTrue(quit_console(dev.pipe))
+        self.assertEqual(dev.pipe.returncode, 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+""" dark and flat correction tests
+"""
+
+import os
+import numpy
+import shutil
+import tempfile
+import unittest
+
+from wasatchcameralink import reference
+from wasatchcameralink import simulation
+from wasatchcameralink.DALSA import Cobra
+from wasatchcameralink.grabconsole import console_command
+from wasatchcameralink.correction import FrameCorrector, CalibrationError, \
+                                         device_state
+
+
+class TestSLEDCorrection(unittest.TestCase):
+
+    def setUp(self):
+        self.dev = simulation.SimulatedCobraSLED()
+        self.corrector = FrameCorrector(self.dev, frames=64)
+
+    def test_uncalibrated(self):
+        self.assertFalse(self.corrector.is_calibrated())
+        self.assertRaises(CalibrationError, self.corrector.correct,
+                          numpy.zeros(2048))
+        self.assertEqual(self.corrector.grab_pipe(), (0, "fail"))
+        self.assertEqual(self.corrector.grab_many(2), (0, "fail"))
+
+    def test_dark_subtraction(self):
+        self.corrector.calibrate_dark()
+        self.assertTrue(self.corrector.is_calibrated())
+
+        result, data = self.corrector.grab_pipe()
+        self.assertTrue(result)
+        self.assertEqual(data.dtype, numpy.float64)
+        # only the 0 to 10 count noise is left around the average
+        self.assertLess(abs(data.mean()), 1.0)
+        self.assertLess(numpy.abs(data).max(), 10.0)
+
+        # the single frame buffer is reused
+        self.assertIs(self.corrector.grab_pipe()[1], data)
+
+    def test_flat_field(self):
+        self.corrector.set_dark(numpy.zeros(2048))
+        self.corrector.calibrate_flat(256)
+        result, data = self.corrector.grab_many(16)
+        self.assertEqual(data.shape, (16, 2048))
+        level = self.dev.base_data.mean() + 5
+        # the sled shape is flattened to its mean level
+        self.assertLess(numpy.abs(data.mean(axis=0) - level).max(), 5.0)
+
+    def test_stored_dark(self):
+        self.corrector.set_dark(reference.dark_frame())
+        result, data = self.corrector.grab_pipe()
+        expected = numpy.asarray(self.dev.base_data) - \
+                   reference.dark_frame() + 5
+        self.assertLess(numpy.abs(data - expected).max(), 6.0)
+
+    def test_settings_change_invalidates(self):
+        self.corrector.calibrate_dark()
+        self.dev.set_gain(100)
+        self.assertFalse(self.corrector.is_calibrated())
+        self.assertEqual(self.corrector.grab_pipe(), (0, "fail"))
+
+        self.corrector.calibrate_dark()
+        result, data = self.corrector.grab_pipe()
+        self.assertLess(abs(data.mean()), 1.0)
+
+        # the calibration of the old state is kept
+        self.dev.set_gain(0)
+        self.assertTrue(self.corrector.is_calibrated())
+        self.assertEqual(len(self.corrector.calibrations), 2)
+
+        self.corrector.invalidate(all_states=False)
+        self.assertFalse(self.corrector.is_calibrated())
+        self.assertEqual(len(self.corrector.calibrations), 1)
+        self.corrector.invalidate()
+        self.assertEqual(self.corrector.calibrations, {})
+
+    def test_correct_block_in_place(self):
+        self.corrector.set_dark(numpy.full(2048, 10.0))
+        block = numpy.full((3, 2048), 15.0)
+        out = self.corrector.correct(block, block)
+        self.assertIs(out, block)
+        self.assertTrue((block == 5.0).all())
+
+
+class TestDeviceState(unittest.TestCase):
+
+    def test_cobra_settings(self):
+        dev = Cobra()
+        self.assertEqual(device_state(dev), ("cobra", None, None))
+        dev.update_settings("gain 100")
+        dev.update_settings("offset 5")
+        self.assertEqual(device_state(dev), ("cobra", "100", "5"))
+        dev.update_settings("init")
+        self.assertEqual(device_state(dev), ("cobra", None, None))
+
+    def test_cobra_console(self):
+        orig_dir = os.getcwd()
+        work_dir = tempfile.mkdtemp()
+        os.chdir(work_dir)
+        try:
+            dev = Cobra()
+            dev.console = console_command()
+            dev.command = "stream"
+            dev.setup_pipe()
+            corrector = FrameCorrector(dev, frames=4)
+            corrector.calibrate_dark()
+            result, data = corrector.grab_pipe()
+            dev.close_pipe()
+        finally:
+            os.chdir(orig_dir)
+            shutil.rmtree(work_dir)
+
+        # the stand-in ramp rises one count per frame
+        self.assertTrue(result)
+        self.assertTrue(numpy.allclose(data, 2.5))
+
+if __name__ == "__main__":
+    unittest.main()
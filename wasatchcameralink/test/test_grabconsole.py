@@ -0,0 +1,202 @@
+""" pipe protocol tests against the python stand-in grab console.
+"""
+
+import io
+import os
+import numpy
+import shutil
+import tempfile
+import unittest
+
+from wasatchcameralink import protocol
+from wasatchcameralink.ccf import activate_crop
+from wasatchcameralink.DALSA import CONSOLE_DIR, Cobra, OPTOCobra
+from wasatchcameralink.grabconsole import console_command
+
+
+class TestFrameRecords(unittest.TestCase):
+
+    def test_round_trip(self):
+        stream = io.BytesIO()
+        payload = numpy.arange(2048, dtype="<u2")
+        protocol.write_frame(stream, 7, payload)
+        protocol.write_frame(stream, 8, payload[::-1].copy())
+
+        stream.seek(0)
+        counter, data = protocol.read_frame(stream)
+        self.assertEqual(counter, 7)
+        self.assertEqual(data, payload.tobytes())
+
+        counter, data = protocol.read_frame(stream)
+        self.assertEqual(counter, 8)
+        self.assertEqual(len(data), 4096)
+
+    def test_bad_magic(self):
+        stream = io.BytesIO(b"XXXX" + b"\x00" * 8)
+        self.assertRaises(protocol.ProtocolError,
+                          protocol.read_frame, stream)
+
+    def test_truncated_payload(self):
+        stream = io.BytesIO()
+        protocol.write_frame(stream, 0, b"\x01\x02\x03\x04")
+        truncated = io.BytesIO(stream.getvalue()[:-1])
+        self.assertRaises(protocol.ProtocolError,
+                          protocol.read_frame, truncated)
+
+
+class TestStandInConsole(unittest.TestCase):
+
+    def setUp(self):
+        # grab mode saves test.raw in the working directory
+        self.orig_dir = os.getcwd()
+        self.work_dir = tempfile.mkdtemp()
+        os.chdir(self.work_dir)
+
+        self.dev = Cobra()
+        self.dev.console = console_command()
+
+    def tearDown(self):
+        os.chdir(self.orig_dir)
+        shutil.rmtree(self.work_dir)
+
+    def test_grab_cycle(self):
+        self.assertTrue(self.dev.setup_pipe())
+
+        for i in range(3):
+            result, data = self.dev.grab_pipe()
+            self.assertTrue(result)
+            self.assertEqual(len(data), 2048)
+            self.assertEqual(data[0], i)
+            self.assertEqual(data[10], i + 10)
+
+        self.assertTrue(self.dev.close_pipe())
+        self.assertEqual(self.dev.pipe.returncode, 0)
+
+    def test_stream_cycle(self):
+        self.dev.command = "stream"
+        self.assertTrue(self.dev.setup_pipe())
+
+        for i in range(3):
+            result, data = self.dev.grab_pipe()
+            self.assertTrue(result)
+            self.assertEqual(data.dtype, numpy.uint16)
+            self.assertEqual(len(data), 2048)
+            self.assertEqual(data[5], i + 5)
+            self.assertEqual(self.dev.frame_count, i)
+
+        self.assertTrue(self.dev.close_pipe())
+        self.assertEqual(self.dev.pipe.returncode, 0)
+        self.assertFalse(os.path.exists("test.raw"))
+
+    def test_grab_many(self):
+        for command in ("grab", "stream"):
+            self.dev.command = command
+            self.assertTrue(self.dev.setup_pipe())
+
+            out = numpy.zeros((5, 2048), dtype=numpy.uint16)
+            result, data = self.dev.grab_many(5, out)
+            self.assertTrue(result)
+            self.assertIs(data, out)
+            self.assertEqual(list(data[:, 7]), [7, 8, 9, 10, 11])
+
+            result, data = self.dev.grab_many(3)
+            self.assertEqual(data.shape, (3, 2048))
+            self.assertEqual(data[2][0], 7)
+
+            self.assertTrue(self.dev.close_pipe())
+
+    def test_stream_many_window(self):
+        self.dev.command = "stream"
+        self.dev.stream_depth = 3
+        self.assertTrue(self.dev.setup_pipe())
+        result, data = self.dev.grab_many(50)
+        self.assertTrue(result)
+        self.assertEqual(list(data[:, 0]), list(range(50)))
+
+        # no requests are left over for the next grab
+        result, data = self.dev.grab_pipe()
+        self.assertEqual(data[0], 50)
+        self.assertTrue(self.dev.close_pipe())
+
+    def test_stream_many_failure(self):
+        self.dev.command = "stream"
+        self.assertTrue(self.dev.setup_pipe())
+        self.dev.pixels = 4096
+        self.assertEqual(self.dev.grab_many(10), (0, "fail"))
+        # the out of step console is quit
+        self.assertIsNotNone(self.dev.pipe.returncode)
+
+
+class TestLineFrames(unittest.TestCase):
+    """ The opto ccf with its crop activated delivers 480 lines per snap,
+    each line is a spectrum.
+    """
+    def setUp(self):
+        self.orig_dir = os.getcwd()
+        self.work_dir = tempfile.mkdtemp()
+        os.chdir(self.work_dir)
+
+        path = activate_crop(os.path.join(CONSOLE_DIR, "opto.ccf"),
+                             os.path.join(self.work_dir, "opto.ccf"))
+        self.dev = OPTOCobra(ccf=path)
+        self.dev.console = console_command()
+        self.dev.line_frames = True
+
+    def tearDown(self):
+        os.chdir(self.orig_dir)
+        shutil.rmtree(self.work_dir)
+
+    def expected(self, start, count):
+        # line n of snap f starts at n + f
+        frames = numpy.arange(start, start + count)
+        return list(frames % 480 + frames // 480)
+
+    def test_grab_lines(self):
+        self.assertEqual(self.dev.frame_shape(), (2048,))
+        self.assertTrue(self.dev.setup_pipe())
+        firsts = []
+        for i in range(482):
+            result, data = self.dev.grab_pipe()
+            self.assertTrue(result)
+            self.assertEqual(data.shape, (2048,))
+            firsts.append(data[0])
+        self.assertTrue(self.dev.close_pipe())
+
+        self.assertEqual(firsts, self.expected(0, 482))
+        counters = self.dev.stats()["counters"]
+        self.assertEqual(counters["frames"], 2)
+        self.assertEqual(counters["lines"], 960)
+
+    def test_stream_grab_many(self):
+        self.dev.command = "stream"
+        self.assertTrue(self.dev.setup_pipe())
+        firsts = []
+        for count in (500, 3, 960, 1):
+            result, data = self.dev.grab_many(count)
+            self.assertTrue(result)
+            self.assertEqual(data.shape, (count, 2048))
+            firsts.extend(data[:, 0])
+
+        # single frames carry on from the partly used snap
+        result, data = self.dev.grab_pipe()
+        firsts.append(data[0])
+        self.assertTrue(self.dev.close_pipe())
+
+        self.assertEqual(firsts, self.expected(0, 1465))
+        self.assertEqual(self.dev.frame_count, 3)
+
+    def test_stream_frames(self):
+        self.dev.command = "stream"
+        self.assertTrue(self.dev.setup_pipe())
+        frames = []
+        self.dev.start_stream(frames.append)
+        self.assertIsNotNone(self.dev.next_frame(after=599, timeout=5))
+        self.assertTrue(self.dev.stop_stream())
+        self.assertTrue(self.dev.close_pipe())
+
+        self.assertEqual(frames[0].data.shape, (2048,))
+        firsts = [frame.data[0] for frame in frames[:600]]
+        self.assertEqual(firsts, self.expected(0, 600))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+""" stage timing and counter tests
+"""
+
+import os
+import numpy
+import shutil
+import logging
+import tempfile
+import unittest
+
+from wasatchcameralink import DALSA
+from wasatchcameralink import instrument
+from wasatchcameralink.DALSA import Cobra
+from wasatchcameralink.fakecobra import FakeCobraController
+from wasatchcameralink.grabconsole import console_command
+
+
+class TestLatencyWindow(unittest.TestCase):
+
+    def test_rolls_over(self):
+        window = instrument.LatencyWindow(4)
+        for value in range(1, 7):
+            window.add(value)
+        self.assertEqual(list(window.recent()), [3, 4, 5, 6])
+        self.assertEqual(window.count, 6)
+        self.assertEqual(window.total, 21)
+        self.assertEqual(window.maximum, 6)
+
+    def test_summary(self):
+        window = instrument.LatencyWindow(1000)
+        self.assertEqual(window.summary()["p50"], 0.0)
+        for value in numpy.linspace(0, 1, 101):
+            window.add(value)
+        summary = window.summary()
+        self.assertAlmostEqual(summary["p50"], 0.5)
+        self.assertAlmostEqual(summary["p99"], 0.99)
+        self.assertAlmostEqual(summary["mean"], 0.5)
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_record_and_count(self):
+        stats = instrument.Instrumentation(window=8)
+        start = 0.0
+        now = stats.record("snap", start)
+        self.assertGreater(now, start)
+        stats.record("snap", now)
+        stats.count("frames")
+        stats.count("frames", 2)
+
+        result = stats.stats()
+        self.assertEqual(result["stages"]["snap"]["count"], 2)
+        self.assertEqual(result["counters"], {"frames": 3})
+
+        counts, edges = stats.histogram("snap", 4)
+        self.assertEqual(counts.sum(), 2)
+        self.assertEqual(stats.histogram("decode")[0].sum(), 0)
+
+    def test_hook(self):
+        samples = []
+        stats = instrument.Instrumentation(
+            hook=lambda stage, seconds: samples.append((stage, seconds)))
+        stats.record("decode", stats.record("decode", 0.0))
+        self.assertEqual([stage for stage, seconds in samples],
+                         ["decode", "decode"])
+
+    def test_hook_failure_contained(self):
+        def hook(stage, seconds):
+            raise RuntimeError("exporter down")
+
+        stats = instrument.Instrumentation(hook=hook)
+        logging.disable(logging.CRITICAL)
+        try:
+            stats.record("decode", 0.0)
+        finally:
+            logging.disable(logging.NOTSET)
+        self.assertEqual(stats.stats()["stages"]["decode"]["count"], 1)
+
+    def test_disabled(self):
+        stats = instrument.Instrumentation()
+        stats.enabled = False
+        stats.record("snap", 0.0)
+        stats.count("frames")
+        self.assertEqual(stats.stats(), {"stages": {}, "counters": {}})
+
+
+class TestDeviceStages(unittest.TestCase):
+
+    def setUp(self):
+        self.orig_dir = os.getcwd()
+        self.work_dir = tempfile.mkdtemp()
+        os.chdir(self.work_dir)
+
+        self.dev = Cobra()
+        self.dev.console = console_command()
+
+    def tearDown(self):
+        os.chdir(self.orig_dir)
+        shutil.rmtree(self.work_dir)
+
+    def test_grab_stages(self):
+        self.assertTrue(self.dev.setup_pipe())
+        for i in range(5):
+            self.assertTrue(self.dev.grab_pipe()[0])
+        self.dev.close_pipe()
+
+        stats = self.dev.stats()
+        for stage in ("snap", "save", "file_read", "decode", "repeat",
+                      "frame"):
+            self.assertEqual(stats["stages"][stage]["count"], 5, stage)
+        self.assertEqual(stats["counters"]["frames"], 5)
+        frame = stats["stages"]["frame"]
+        self.assertGreaterEqual(frame["p99"], frame["p50"])
+        self.assertGreater(frame["p50"], 0)
+
+    def test_stream_stages(self):
+        self.dev.command = "stream"
+        self.assertTrue(self.dev.setup_pipe())
+        for i in range(3):
+            self.assertTrue(self.dev.grab_pipe()[0])
+        self.assertTrue(self.dev.grab_many(4)[0])
+        self.dev.close_pipe()
+
+        stats = self.dev.stats()
+        self.assertEqual(stats["stages"]["snap"]["count"], 3)
+        self.assertEqual(stats["stages"]["decode"]["count"], 3)
+        self.assertEqual(stats["counters"]["frames"], 7)
+
+    def test_lazy_read_logging(self):
+        messages = []
+
+        class Capture(logging.Handler):
+            def emit(self, record):
+                messages.append(record)
+
+        handler = Capture()
+        DALSA.log.addHandler(handler)
+        DALSA.log.setLevel(logging.DEBUG)
+        try:
+            self.assertTrue(self.dev.setup_pipe())
+            self.dev.grab_pipe()
+            self.dev.close_pipe()
+        finally:
+            DALSA.log.removeHandler(handler)
+            DALSA.log.setLevel(logging.NOTSET)
+
+        reads = [record for record in messages
+                 if record.msg == "READ %s"]
+        self.assertEqual(len(reads), 4)
+        self.assertIn(b"snap", reads[0].args[0])
+
+    def test_serial_stages(self):
+        fake = FakeCobraController().start()
+        dev = Cobra(com_port=fake.port_name)
+        try:
+            self.assertTrue(dev.start_scan())
+            self.assertTrue(dev.set_gain(10))
+        finally:
+            dev.close_port()
+            fake.stop()
+
+        stats = dev.stats()
+        self.assertEqual(stats["stages"]["serial_write"]["count"], 2)
+        self.assertEqual(stats["stages"]["serial_ack"]["count"], 4)
+        self.assertEqual(stats["counters"]["serial_commands"], 4)
+
+if __name__ == "__main__":
+    unittest.main()
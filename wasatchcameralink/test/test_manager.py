@@ -0,0 +1,91 @@
+""" multi device acquisition manager tests.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from wasatchcameralink import simulation
+from wasatchcameralink.DALSA import Cobra, BaslerSprint4K
+from wasatchcameralink.grabconsole import console_command
+from wasatchcameralink.manager import AcquisitionManager
+
+
+class TestManager(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_consoles_isolated(self):
+        cobra = Cobra()
+        basler = BaslerSprint4K(card="Xcelera-CL_PX4_1")
+        for device in (cobra, basler):
+            device.console = console_command()
+
+        manager = AcquisitionManager({"cobra": cobra, "basler": basler},
+                                     output_dir=self.work_dir, isolate=True)
+        self.assertNotEqual(cobra.raw_filename, basler.raw_filename)
+        self.assertTrue(manager.setup_pipes())
+
+        for frame_set in manager.frame_sets(3):
+            self.assertTrue(all(frame_set.results.values()))
+            self.assertEqual(len(frame_set.data["cobra"]), 2048)
+            self.assertEqual(len(frame_set.data["basler"]), 4096)
+            self.assertEqual(frame_set.data["basler"][4000],
+                             (4000 + frame_set.sequence) & 0xFFF)
+
+        self.assertTrue(os.path.exists(basler.raw_filename))
+        self.assertTrue(manager.close_pipes())
+        manager.shutdown()
+
+        stats = manager.throughput()
+        self.assertEqual(stats["frames"], 6)
+        self.assertEqual(stats["frame_sets"], 3)
+        self.assertGreater(stats["frames_per_sec"], 0)
+
+    def test_isolate_off_by_default(self):
+        cobra = Cobra()
+        manager = AcquisitionManager([cobra])
+        manager.shutdown()
+        self.assertEqual(cobra.raw_filename, "test.raw")
+        self.assertEqual(cobra.console_args()[-1][-9:], "cobra.ccf")
+
+    def test_shared_output_reported(self):
+        cobra, basler = Cobra(), BaslerSprint4K()
+        with self.assertLogs("wasatchcameralink.manager", "CRITICAL"):
+            manager = AcquisitionManager([cobra, basler])
+        self.assertEqual(manager.shared_outputs(), ["device0", "device1"])
+        manager.shutdown()
+
+        # stream mode consoles do not write the file
+        basler.command = "stream"
+        manager = AcquisitionManager([cobra, basler])
+        self.assertEqual(manager.shared_outputs(), [])
+        manager.shutdown()
+
+    def test_temp_dir_removed(self):
+        cobra = Cobra()
+        manager = AcquisitionManager([cobra], isolate=True)
+        output_dir = os.path.dirname(cobra.raw_filename)
+        self.assertTrue(os.path.isdir(output_dir))
+        manager.shutdown()
+        self.assertFalse(os.path.exists(output_dir))
+
+    def test_simulated_list(self):
+        devices = [simulation.SimulatedPipeDevice(),
+                   simulation.SimulatedCobraSLED()]
+        manager = AcquisitionManager(devices)
+        self.assertTrue(manager.setup_pipes())
+
+        frame_set = manager.grab_all()
+        self.assertEqual(list(frame_set.data), ["device0", "device1"])
+        self.assertEqual(len(frame_set.data["device1"]), 2048)
+        self.assertEqual(set(frame_set.timestamps), set(frame_set.data))
+        manager.shutdown()
+
+if __name__ == "__main__":
+    unittest.main()
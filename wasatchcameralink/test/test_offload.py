@@ -0,0 +1,127 @@
+""" process pool offload tests
+"""
+
+import time
+import queue
+import numpy
+import unittest
+
+from wasatchcameralink import simulation
+from wasatchcameralink.offload import ProcessOffload
+from wasatchcameralink.peaks import PeakEngine
+
+
+def frame_sum(frame):
+    return float(frame.sum())
+
+
+def slow_first_pixel(frame):
+    # later frames finish first, results must still come back in order
+    time.sleep(0.05 if frame[0] == 0 else 0.001)
+    return int(frame[0])
+
+
+def fail_on_odd(frame):
+    if int(frame[0]) % 2:
+        raise ValueError("odd frame")
+    return int(frame[0])
+
+
+def count_peaks(frame):
+    return len(PeakEngine(len(frame)).process(frame))
+
+
+class TestProcessOffload(unittest.TestCase):
+
+    def test_results_in_order(self):
+        offload = ProcessOffload(slow_first_pixel, 16, workers=3, slots=12)
+        try:
+            for i in range(12):
+                self.assertEqual(offload.submit(numpy.full(16, i)), i)
+            results = list(offload.results())
+        finally:
+            offload.close()
+
+        self.assertEqual(results, [(i, i) for i in range(12)])
+        stats = offload.stats()
+        self.assertEqual(stats["completed"], 12)
+        self.assertEqual(stats["in_flight"], 0)
+        self.assertGreaterEqual(len(stats["workers"]), 1)
+        for worker in stats["workers"].values():
+            self.assertGreater(worker["utilization"], 0)
+            self.assertLessEqual(worker["utilization"], 1)
+
+    def test_callback(self):
+        received = []
+        offload = ProcessOffload(frame_sum, 100, workers=2,
+                                 callback=lambda sequence, result:
+                                 received.append((sequence, result)))
+        for i in range(20):
+            offload.submit(numpy.full(100, float(i)))
+        offload.close()
+        self.assertEqual(received, [(i, 100.0 * i) for i in range(20)])
+        self.assertRaises(queue.Empty, offload.next_result)
+
+    def test_back_pressure(self):
+        offload = ProcessOffload(slow_first_pixel, 4, slots=2, workers=1)
+        try:
+            self.assertEqual(offload.submit(numpy.zeros(4)), 0)
+            self.assertEqual(offload.submit(numpy.zeros(4)), 1)
+            # both slots busy for 50ms each
+            self.assertIsNone(offload.submit(numpy.zeros(4), block=False))
+            self.assertEqual(offload.next_result(), (0, 0))
+            self.assertEqual(offload.submit(numpy.ones(4)), 2)
+            list(offload.results())
+        finally:
+            offload.close()
+
+        stats = offload.stats()
+        self.assertEqual(stats["rejected"], 1)
+
+    def test_uncollected_results_hold_slots(self):
+        offload = ProcessOffload(frame_sum, 4, slots=3, workers=1)
+        try:
+            sequences = [offload.submit(numpy.ones(4), block=False)
+                         for i in range(10)]
+            # finished but uncollected results keep their slots
+            time.sleep(0.2)
+            self.assertIsNone(offload.submit(numpy.ones(4), timeout=0.05))
+            self.assertEqual(sequences[:3], [0, 1, 2])
+            self.assertEqual(sequences[3:], [None] * 7)
+            self.assertEqual(len(offload.pending), 3)
+            self.assertEqual(offload.stats()["in_flight"], 3)
+
+            self.assertEqual(offload.next_result(), (0, 4.0))
+            self.assertEqual(offload.submit(numpy.ones(4), block=False), 3)
+        finally:
+            offload.close()
+
+    def test_task_failure(self):
+        offload = ProcessOffload(fail_on_odd, 4, workers=2)
+        try:
+            for i in range(4):
+                offload.submit(numpy.full(4, i))
+            results = list(offload.results())
+        finally:
+            offload.close()
+        self.assertEqual(results, [(0, 0), (1, None), (2, 2), (3, None)])
+        self.assertEqual(offload.stats()["failed"], 2)
+
+    def test_stream_peaks(self):
+        dev = simulation.SimulatedSpectraDevice(rng=1)
+        received = []
+        offload = ProcessOffload(count_peaks, 2048, workers=2, slots=4,
+                                 callback=lambda sequence, result:
+                                 received.append(result))
+        dev.start_stream(offload.put_frame)
+        time.sleep(0.3)
+        dev.stop_stream()
+        offload.close()
+
+        stats = offload.stats()
+        self.assertGreater(len(received), 0)
+        self.assertEqual(len(received), stats["completed"])
+        self.assertTrue(all(5 <= peaks <= 12 for peaks in received))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+""" raman peak engine tests
+"""
+
+import numpy
+import unittest
+
+from wasatchcameralink import simulation
+from wasatchcameralink.peaks import PeakEngine
+
+
+def gaussian_frames(count, positions, rng, pixels=2048):
+    """ Gaussian peaks at the given float positions on a sloped baseline
+    with normal noise.
+    """
+    axis = numpy.arange(pixels)
+    frames = 300 + 0.2 * axis + rng.normal(0, 10, (count, pixels))
+    for position in positions:
+        frames += 800 * numpy.exp(-0.5 * ((axis - position) / 3.0) ** 2)
+    return frames
+
+
+class TestPeakEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = numpy.random.default_rng(11)
+        self.positions = [150.3, 600.75, 1024.5, 1700.1, 1990.6]
+
+    def test_centroids(self):
+        engine = PeakEngine(2048)
+        frames = gaussian_frames(8, self.positions, self.rng)
+        peaks = engine.process(frames)
+
+        self.assertEqual(list(numpy.bincount(peaks["frame"])), [5] * 8)
+        found = peaks["position"].reshape(8, 5)
+        error = numpy.abs(found - self.positions)
+        self.assertLess(error.max(), 0.3)
+        # heights are of the smoothed peak, sigma 3 widened by 1.5
+        smoothed = 800 * 3.0 / numpy.hypot(3.0, 1.5)
+        self.assertTrue((numpy.abs(peaks["height"] - smoothed) < 30).all())
+
+    def test_single_frame_matches_batch(self):
+        engine = PeakEngine(2048)
+        frames = gaussian_frames(3, self.positions, self.rng)
+        batch = engine.process(frames)
+        single = engine.process(frames[2])
+        self.assertTrue((single["frame"] == 0).all())
+        self.assertTrue(numpy.allclose(single["position"],
+                                       batch[batch["frame"] == 2]["position"]))
+
+    def test_flat_frame_has_no_peaks(self):
+        engine = PeakEngine(2048)
+        frames = gaussian_frames(20, [], self.rng)
+        self.assertEqual(len(engine.process(frames)), 0)
+
+    def test_corrected_removes_baseline(self):
+        engine = PeakEngine(2048)
+        frame = gaussian_frames(1, [], self.rng)[0]
+        corrected = engine.corrected(frame)
+        self.assertEqual(corrected.shape, (2048,))
+        self.assertLess(abs(numpy.median(corrected)), 5.0)
+
+    def test_axis(self):
+        axis = numpy.linspace(200.0, 2200.0, 2048)
+        engine = PeakEngine(2048, axis=axis)
+        frames = gaussian_frames(1, [1024.5], self.rng)
+        peaks = engine.process(frames)
+        self.assertEqual(len(peaks), 1)
+        expected = numpy.interp(1024.5, numpy.arange(2048), axis)
+        self.assertLess(abs(peaks["position"][0] - expected), 0.5)
+        self.assertRaises(ValueError, PeakEngine, 2048, axis=axis[:10])
+
+    def test_odd_sizes(self):
+        for pixels, block in ((1000, 64), (50, 64), (130, 64)):
+            engine = PeakEngine(pixels, block=block)
+            frames = gaussian_frames(2, [pixels / 2.0], self.rng, pixels)
+            peaks = engine.process(frames)
+            self.assertEqual(len(peaks), 2, pixels)
+
+    def test_simulated_raman(self):
+        dev = simulation.SimulatedSpectraDevice(rng=3)
+        result, frames = dev.grab_many(50)
+        peaks = PeakEngine(2048).process(frames)
+        counts = numpy.bincount(peaks["frame"], minlength=50)
+        # overlapping peaks can merge
+        self.assertTrue((counts >= 7).all())
+        self.assertTrue((counts <= 10).all())
+
+    def test_stream_callback(self):
+        results = []
+        dev = simulation.SimulatedSpectraDevice(rng=5)
+        engine = PeakEngine(2048, callback=lambda frame, peaks:
+                            results.append((frame.sequence, len(peaks))))
+        dev.start_stream(engine.put_frame)
+        frame = dev.next_frame(timeout=1.0)
+        while frame is not None and frame.sequence < 5:
+            frame = dev.next_frame(timeout=1.0)
+        dev.stop_stream()
+
+        self.assertGreaterEqual(len(results), 5)
+        self.assertEqual(results[0][0], 0)
+        self.assertGreater(len(engine.last_peaks), 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+""" pixel format decoder tests.
+"""
+
+import io
+import os
+import numpy
+import shutil
+import tempfile
+import unittest
+
+from wasatchcameralink import ccf
+from wasatchcameralink import pixelformat
+from wasatchcameralink.pixelformat import BIG, LITTLE, get_decoder
+from wasatchcameralink.protocol import read_frame
+from wasatchcameralink.grabconsole import GrabConsole
+from wasatchcameralink.DALSA import CONSOLE_DIR, Cobra, decode_pixels
+
+
+class TestDecoders(unittest.TestCase):
+
+    def test_round_trip(self):
+        rng = numpy.random.default_rng(0)
+        for name in ("mono8", "mono10", "mono12", "mono16", "mono10p",
+                     "mono12p"):
+            decoder = get_decoder(name)
+            top = 1 << min(decoder.bits, 16)
+            for endian in (LITTLE, BIG):
+                # partly used last packing groups included
+                for count in (1, 2, 3, 5, 2048):
+                    values = rng.integers(0, top, count)
+                    raw = decoder.encode(values, endian)
+                    self.assertEqual(len(raw), decoder.frame_bytes(count))
+
+                    data = decoder.decode(raw, count, endian)
+                    self.assertEqual(data.dtype, numpy.uint16)
+                    self.assertEqual(list(data), list(values))
+
+    def test_mono12p_layout(self):
+        decoder = get_decoder("mono12p")
+        self.assertEqual(decoder.encode([0xABC, 0x123], LITTLE),
+                         b"\xbc\x3a\x12")
+        self.assertEqual(decoder.encode([0xABC, 0x123], BIG),
+                         b"\xab\xc1\x23")
+        self.assertEqual(list(decoder.decode(b"\xbc\x3a\x12", 2)),
+                         [0xABC, 0x123])
+
+    def test_mono10p_layout(self):
+        decoder = get_decoder("mono10p")
+        self.assertEqual((decoder.group_pixels, decoder.group_bytes), (4, 5))
+        raw = decoder.encode([0x3FF, 0, 0, 0x3FF], LITTLE)
+        self.assertEqual(raw, b"\xff\x03\x00\xc0\xff")
+
+    def test_mono16_byte_order(self):
+        raw = b"\x01\x02\x03\x04"
+        little = pixelformat.decode(raw, 2, "mono16", LITTLE)
+        big = pixelformat.decode(raw, 2, "mono16", BIG)
+        self.assertEqual(list(little), [0x0201, 0x0403])
+        self.assertEqual(list(big), [0x0102, 0x0304])
+        self.assertEqual(big.dtype, numpy.uint16)
+        self.assertFalse(little.flags.writeable)
+
+    def test_short_buffer(self):
+        decoder = get_decoder("mono12p")
+        self.assertRaises(ValueError, decoder.decode, b"\x00\x00", 2)
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, get_decoder, "rgb8")
+        self.assertRaises(ValueError, pixelformat.decode, b"\x00\x00", 1,
+                          "mono16", "middle")
+
+    def test_register(self):
+        decoder = pixelformat.PackedDecoder("mono14p", 14)
+        pixelformat.register_decoder(decoder)
+        try:
+            self.assertEqual(decoder.group_bytes, 7)
+            values = numpy.arange(0, 1 << 14, 37)
+            raw = decoder.encode(values, BIG)
+            data = decode_pixels(raw, len(values), pixel_format="mono14p",
+                                 endian=BIG)
+            self.assertEqual(list(data), list(values))
+        finally:
+            del pixelformat.DECODERS["mono14p"]
+
+
+class TestCCFFormat(unittest.TestCase):
+
+    def setUp(self):
+        ccf.clear_cache()
+        self.work_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.work_dir, "packed.ccf")
+        with open(os.path.join(CONSOLE_DIR, "cobra.ccf")) as in_file:
+            text = in_file.read()
+        with open(self.path, "w") as out_file:
+            out_file.write(text.replace("[Output]\n",
+                                        "[Output]\nPixel Packing=1\n"))
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_packed_ccf(self):
+        config = ccf.parse_ccf(self.path)
+        self.assertEqual(config.pixel_format, "mono12p")
+        self.assertEqual(config.frame_bytes, 3072)
+
+    def test_packed_console(self):
+        requests = io.BytesIO(b"\n\n")
+        stdout = io.BytesIO()
+        console = GrabConsole.from_ccf(self.path, stdin=requests,
+                                       stdout=stdout)
+        console.run_stream()
+
+        dev = Cobra()
+        dev.pixel_format = ccf.parse_ccf(self.path).pixel_format
+        stdout.seek(0)
+        for i in range(2):
+            counter, payload = read_frame(stdout)
+            self.assertEqual(len(payload), 3072)
+            data = dev.decode(payload)
+            self.assertEqual(data.shape, (2048,))
+            self.assertEqual(data[7], i + 7)
+            self.assertEqual(data[2047], (i + 2047) & 0xFFF)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,209 @@
+""" frame archive and background recorder tests
+"""
+
+import os
+import time
+import numpy
+import shutil
+import tempfile
+import unittest
+
+from wasatchcameralink import recorder
+from wasatchcameralink import simulation
+from wasatchcameralink.ccf import activate_crop
+from wasatchcameralink.DALSA import CONSOLE_DIR, Cobra, OPTOCobra
+from wasatchcameralink.streaming import Frame
+from wasatchcameralink.grabconsole import console_command
+
+
+class TestFrameArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.work_dir, "test.wpa")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_round_trip(self):
+        writer = recorder.FrameArchiveWriter(self.path, 16)
+        frames = numpy.arange(80, dtype=numpy.uint16).reshape(5, 16)
+        writer.append(frames, range(5), numpy.linspace(0, 1, 5))
+        writer.close()
+
+        archive = recorder.FrameArchive(self.path)
+        self.assertEqual(len(archive), 5)
+        self.assertEqual(archive.frames.shape, (5, 16))
+        self.assertIsInstance(archive.frames, numpy.memmap)
+        self.assertTrue(numpy.array_equal(archive.frames, frames))
+        self.assertEqual(list(archive.sequences), [0, 1, 2, 3, 4])
+        self.assertEqual(archive.timestamps[-1], 1.0)
+
+    def test_multi_line_and_dtype(self):
+        writer = recorder.FrameArchiveWriter(self.path, 8, lines=2,
+                                             dtype=numpy.uint8)
+        writer.append(numpy.ones((3, 2, 8)), [7, 8, 9], [0, 0, 0])
+        writer.close()
+
+        archive = recorder.FrameArchive(self.path)
+        self.assertEqual(archive.dtype, numpy.uint8)
+        self.assertEqual(archive.frames.shape, (3, 2, 8))
+
+    def test_bad_shape(self):
+        writer = recorder.FrameArchiveWriter(self.path, 16)
+        self.assertRaises(ValueError, writer.append, numpy.zeros(15),
+                          [0], [0])
+        writer.close()
+
+    def test_empty_and_partial(self):
+        writer = recorder.FrameArchiveWriter(self.path, 4)
+        writer.flush()
+        archive = recorder.FrameArchive(self.path)
+        self.assertEqual(archive.frames.shape, (0, 4))
+
+        # A frame without its index entry is not visible yet
+        writer.append(numpy.zeros((2, 4)), [0, 1], [0, 0])
+        writer.data_file.write(b"\x01" * 8)
+        writer.flush()
+        archive.refresh()
+        self.assertEqual(len(archive), 2)
+        writer.close()
+
+    def test_not_an_archive(self):
+        with open(self.path, "wb") as out_file:
+            out_file.write(b"\x00" * 64)
+        open(recorder.index_path(self.path), "wb").close()
+        self.assertRaises(recorder.ArchiveError, recorder.FrameArchive,
+                          self.path)
+
+
+class TestFrameRecorder(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.work_dir, "run.wpa")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_record_frames(self):
+        rec = recorder.FrameRecorder(self.path, 32, batch_size=4)
+        for i in range(50):
+            self.assertTrue(rec.record(numpy.full(32, i)))
+        self.assertTrue(rec.close())
+
+        stats = rec.stats()
+        self.assertEqual(stats["written"], 50)
+        self.assertEqual(stats["dropped"], 0)
+        self.assertEqual(stats["bytes_written"], 50 * 64)
+        self.assertEqual(stats["queue_depth"], 0)
+        self.assertGreater(stats["write_bytes_per_sec"], 0)
+
+        archive = recorder.FrameArchive(self.path)
+        self.assertEqual(list(archive.frames[:, 0]), list(range(50)))
+        self.assertEqual(list(archive.sequences), list(range(50)))
+
+    def test_wrong_shape_drops(self):
+        rec = recorder.FrameRecorder(self.path, 4)
+        self.assertTrue(rec.record(numpy.arange(4)))
+        self.assertFalse(rec.record(numpy.arange(5)))
+        rec.close()
+
+        stats = rec.stats()
+        self.assertEqual(stats["received"], 2)
+        self.assertEqual((stats["written"], stats["dropped"]), (1, 1))
+
+    def test_full_queue_drops(self):
+        rec = recorder.FrameRecorder(self.path, 4, queue_size=2)
+        # Hold the writer inside its first batch
+        original = rec.writer.append
+        release = []
+
+        def slow_append(*args):
+            while not release:
+                time.sleep(0.001)
+            return original(*args)
+
+        rec.writer.append = slow_append
+        results = [rec.record(numpy.zeros(4)) for i in range(20)]
+        self.assertIn(False, results)
+        release.append(True)
+        rec.close()
+
+        stats = rec.stats()
+        self.assertEqual(stats["received"], 20)
+        self.assertEqual(stats["written"] + stats["dropped"], 20)
+        self.assertLessEqual(stats["max_queue_depth"], 2)
+        self.assertEqual(len(recorder.FrameArchive(self.path)),
+                         stats["written"])
+
+    def test_record_stream(self):
+        dev = simulation.SimulatedCobraSLED()
+        rec = recorder.FrameRecorder.for_device(dev, self.path)
+        dev.start_stream(rec.put_frame)
+        frame = dev.next_frame(timeout=1.0)
+        while frame is not None and frame.sequence < 20:
+            frame = dev.next_frame(timeout=1.0)
+        dev.stop_stream()
+        rec.close()
+
+        archive = recorder.FrameArchive(self.path)
+        self.assertEqual(archive.frames.shape[1], 2048)
+        self.assertGreater(len(archive), 20)
+        sequences = archive.sequences
+        self.assertTrue((numpy.diff(sequences.astype(int)) > 0).all())
+        self.assertGreater(archive.frames[0].mean(), 2000)
+
+    def test_for_cobra(self):
+        rec = recorder.FrameRecorder.for_device(Cobra(), self.path)
+        rec.put_frame(Frame(3, 1.5, numpy.arange(2048)))
+        rec.close()
+        archive = recorder.FrameArchive(self.path)
+        self.assertEqual(archive.dtype, numpy.uint16)
+        self.assertEqual(archive.frames[0][100], 100)
+        self.assertEqual(archive.sequences[0], 3)
+
+    def opto(self, line_frames):
+        path = activate_crop(os.path.join(CONSOLE_DIR, "opto.ccf"),
+                             os.path.join(self.work_dir, "opto.ccf"))
+        dev = OPTOCobra(ccf=path)
+        dev.console = console_command()
+        dev.command = "stream"
+        dev.line_frames = line_frames
+        return dev
+
+    def test_record_line_frames(self):
+        dev = self.opto(line_frames=True)
+        rec = recorder.FrameRecorder.for_device(dev, self.path)
+        self.assertTrue(dev.setup_pipe())
+        dev.start_stream(rec.put_frame)
+        self.assertIsNotNone(dev.next_frame(after=499, timeout=5))
+        dev.stop_stream()
+        dev.close_pipe()
+        rec.close()
+
+        stats = rec.stats()
+        self.assertGreater(stats["written"], 0)
+        self.assertEqual(stats["written"] + stats["dropped"],
+                         stats["received"])
+        archive = recorder.FrameArchive(self.path)
+        self.assertEqual(archive.frame_shape(), (2048,))
+        # line n of snap f starts at n + f
+        sequences = archive.sequences.astype(int)
+        self.assertTrue((archive.frames[:, 0] ==
+                         sequences % 480 + sequences // 480).all())
+
+    def test_record_snaps(self):
+        dev = self.opto(line_frames=False)
+        rec = recorder.FrameRecorder.for_device(dev, self.path)
+        self.assertTrue(dev.setup_pipe())
+        result, data = dev.grab_pipe()
+        dev.close_pipe()
+        self.assertTrue(rec.record(data))
+        rec.close()
+        archive = recorder.FrameArchive(self.path)
+        self.assertEqual(archive.frame_shape(), (480, 2048))
+        self.assertEqual(archive.frames[0][479][0], 479)
+
+if __name__ == "__main__":
+    unittest.main()
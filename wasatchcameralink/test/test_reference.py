@@ -0,0 +1,121 @@
+""" reference spectra cache tests
+"""
+
+import os
+import time
+import numpy
+import shutil
+import tempfile
+import unittest
+
+from wasatchcameralink import reference
+from wasatchcameralink import simulation
+
+
+class TestReferenceCache(unittest.TestCase):
+
+    def setUp(self):
+        self.orig_cache = os.environ.get("WASATCH_CACHE_DIR")
+        self.work_dir = tempfile.mkdtemp()
+        os.environ["WASATCH_CACHE_DIR"] = os.path.join(self.work_dir,
+                                                       "cache")
+        reference.clear_cache()
+
+    def tearDown(self):
+        if self.orig_cache is None:
+            del os.environ["WASATCH_CACHE_DIR"]
+        else:
+            os.environ["WASATCH_CACHE_DIR"] = self.orig_cache
+        reference.clear_cache()
+        shutil.rmtree(self.work_dir)
+
+    def write_source(self, values, mtime):
+        path = os.path.join(self.work_dir, "spectrum.txt")
+        with open(path, "w") as out_file:
+            out_file.write(", ".join(str(value) for value in values))
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_package_references(self):
+        sled = reference.single_sled()
+        dark = reference.dark_frame()
+        self.assertEqual(sled.shape, (2048,))
+        self.assertEqual(dark.shape, (2048,))
+
+        expected = numpy.loadtxt(reference.package_path(
+            reference.SINGLE_SLED), delimiter=",")
+        self.assertTrue(numpy.array_equal(sled, expected))
+        self.assertGreater(sled.mean(), dark.mean())
+
+    def test_shared_read_only(self):
+        first = reference.single_sled()
+        second = reference.single_sled()
+        self.assertIs(first, second)
+        self.assertFalse(first.flags.writeable)
+        with self.assertRaises(ValueError):
+            first[0] = 0
+
+    def test_sidecar_reused(self):
+        path = self.write_source([1, 2, 3], time.time() - 100)
+        data = reference.load_reference(path)
+        sidecar = reference.sidecar_path(path)
+        self.assertTrue(os.path.exists(sidecar))
+        self.assertIsInstance(data, numpy.memmap)
+
+        # A new process only sees the sidecar
+        reference.clear_cache()
+        with open(path, "w") as out_file:
+            out_file.write("not, numbers")
+        os.utime(path, (time.time() - 100, time.time() - 100))
+        self.assertEqual(list(reference.load_reference(path)), [1, 2, 3])
+
+    def test_mtime_invalidates(self):
+        path = self.write_source([1, 2, 3], time.time() - 100)
+        self.assertEqual(list(reference.load_reference(path)), [1, 2, 3])
+
+        self.write_source([4, 5, 6], time.time() + 100)
+        self.assertEqual(list(reference.load_reference(path)), [4, 5, 6])
+
+    def test_unwritable_cache(self):
+        blocker = os.path.join(self.work_dir, "blocked")
+        open(blocker, "w").close()
+        os.environ["WASATCH_CACHE_DIR"] = os.path.join(blocker, "cache")
+
+        path = self.write_source([7, 8], time.time())
+        data = reference.load_reference(path)
+        self.assertEqual(list(data), [7, 8])
+        self.assertFalse(data.flags.writeable)
+
+
+class TestSharedSLED(unittest.TestCase):
+
+    def test_instances_share_base(self):
+        first = simulation.SimulatedCobraSLED()
+        second = simulation.SimulatedCobraSLED()
+        self.assertIs(first.base_data, second.base_data)
+
+        # Settings change one instance only
+        start = numpy.array(first.base_data)
+        first.set_gain(100)
+        first.set_offset(50)
+        self.assertEqual(first.level, 150)
+        self.assertEqual(second.level, 0)
+        self.assertTrue(numpy.array_equal(second.base_data, start))
+
+        result, data = first.grab_pipe()
+        self.assertTrue(numpy.all(data >= start + 150))
+        result, data = second.grab_many(5)
+        self.assertTrue(numpy.all(data < start + 10))
+
+    def test_gain_is_absolute(self):
+        dev = simulation.SimulatedCobraSLED()
+        dev.set_gain(100)
+        dev.set_gain(100)
+        self.assertEqual(dev.level, 100)
+
+    def test_dark(self):
+        dev = simulation.SimulatedCobraSLED()
+        self.assertEqual(len(dev.load_dark()), 2048)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+""" frame ring buffer tests.
+"""
+
+import os
+import numpy
+import shutil
+import tempfile
+import threading
+import unittest
+
+from wasatchcameralink import simulation
+from wasatchcameralink.ccf import activate_crop
+from wasatchcameralink.DALSA import CONSOLE_DIR, OPTOCobra
+from wasatchcameralink.ringbuffer import FrameRingBuffer, BLOCK
+
+
+class TestRingBuffer(unittest.TestCase):
+
+    def test_fifo_order(self):
+        ring = FrameRingBuffer(4, 16)
+        for i in range(3):
+            self.assertTrue(ring.put(numpy.full(16, i), timestamp=i))
+
+        self.assertEqual(len(ring), 3)
+        for i in range(3):
+            frame = ring.get(timeout=1)
+            self.assertEqual(frame.sequence, i)
+            self.assertEqual(frame.timestamp, i)
+            self.assertEqual(frame.data[0], i)
+        self.assertIsNone(ring.get(timeout=0.01))
+
+    def test_zero_copy_view(self):
+        ring = FrameRingBuffer(4, 16)
+        ring.put(numpy.arange(16))
+        frame = ring.get()
+        self.assertEqual(frame.data.dtype, numpy.uint16)
+        self.assertTrue(numpy.shares_memory(frame.data, ring.frames))
+
+    def test_drop_oldest(self):
+        ring = FrameRingBuffer(4, 16)
+        for i in range(10):
+            self.assertTrue(ring.put(numpy.full(16, i)))
+
+        counters = ring.counters()
+        self.assertEqual(counters["produced"], 10)
+        self.assertEqual(counters["dropped"], 6)
+        self.assertEqual(counters["depth"], 4)
+
+        sequences = [ring.get().sequence for i in range(4)]
+        self.assertEqual(sequences, [6, 7, 8, 9])
+        self.assertEqual(ring.counters()["consumed"], 4)
+
+    def test_held_frame_not_overwritten(self):
+        ring = FrameRingBuffer(2, 16)
+        ring.put(numpy.full(16, 1))
+        frame = ring.get()
+        for i in range(20):
+            ring.put(numpy.full(16, 100 + i))
+
+        self.assertTrue(numpy.all(frame.data == 1))
+        self.assertEqual(ring.get().data[0], 118)
+        self.assertEqual(ring.get().data[0], 119)
+
+    def test_block_policy(self):
+        ring = FrameRingBuffer(2, 16, policy=BLOCK)
+        self.assertTrue(ring.put(numpy.zeros(16)))
+        self.assertTrue(ring.put(numpy.zeros(16)))
+        self.assertFalse(ring.put(numpy.zeros(16), timeout=0.01))
+
+        consumer = threading.Timer(0.05, ring.get)
+        consumer.start()
+        self.assertTrue(ring.put(numpy.zeros(16), timeout=5))
+        consumer.join()
+        self.assertEqual(ring.counters()["dropped"], 0)
+
+    def test_close_wakes_consumer(self):
+        ring = FrameRingBuffer(2, 16)
+        threading.Timer(0.05, ring.close).start()
+        self.assertIsNone(ring.get(timeout=5))
+        self.assertFalse(ring.put(numpy.zeros(16)))
+
+
+class TestDeviceFeed(unittest.TestCase):
+
+    def test_simulated_stream_feeds_ring(self):
+        dev = simulation.SimulatedCobraSLED()
+        ring = FrameRingBuffer.for_device(dev, capacity=8)
+        self.assertEqual(ring.frames.shape[1], 2048)
+
+        dev.setup_pipe()
+        dev.start_stream(ring.put_frame)
+        frames = [ring.get(timeout=5) for i in range(5)]
+        dev.stop_stream()
+
+        self.assertTrue(all(frame is not None for frame in frames))
+        self.assertGreater(frames[-1].data[1024], 2000)
+        self.assertGreaterEqual(ring.counters()["produced"], 5)
+
+    def test_multi_line_device(self):
+        work_dir = tempfile.mkdtemp()
+        try:
+            path = activate_crop(os.path.join(CONSOLE_DIR, "opto.ccf"),
+                                 os.path.join(work_dir, "opto.ccf"))
+            dev = OPTOCobra(ccf=path)
+        finally:
+            shutil.rmtree(work_dir)
+
+        ring = FrameRingBuffer.for_device(dev, capacity=2)
+        self.assertEqual(ring.frames.shape, (3, 480, 2048))
+        snap = numpy.ones((480, 2048))
+        self.assertTrue(ring.put(snap))
+        self.assertEqual(ring.get().data.shape, (480, 2048))
+
+        dev.line_frames = True
+        ring = FrameRingBuffer.for_device(dev, capacity=2)
+        self.assertEqual(ring.frames.shape, (3, 2048))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,256 @@
+""" serial command engine tests against the pty fake Cobra controller.
+"""
+
+import time
+import serial
+import threading
+import asyncio
+import unittest
+
+from wasatchcameralink.DALSA import Cobra
+from wasatchcameralink.aio import AsyncSaperaCMD
+from wasatchcameralink.fakecobra import FakeCobraController
+from wasatchcameralink.serialengine import SerialCommandEngine
+from wasatchcameralink.serialengine import SerialSession
+
+
+class TestSerialEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeCobraController().start()
+        self.port = serial.Serial(self.fake.port_name, 9600, timeout=0.1)
+        self.engine = SerialCommandEngine(self.port, timeout=0.5)
+
+    def tearDown(self):
+        self.port.close()
+        self.fake.stop()
+
+    def test_single_command(self):
+        ok, reply = self.engine.command("gain 100")
+        self.assertTrue(ok)
+        self.assertTrue(reply.endswith(b"<ok>"))
+        self.assertEqual(self.fake.settings["gain"], 100)
+
+    def test_batch_in_order(self):
+        results = self.engine.batch(["init", "ats 0", "bogus", "lsc 1"])
+        self.assertEqual([ok for ok, reply in results],
+                         [True, True, False, True])
+        self.assertEqual(self.fake.commands,
+                         ["init", "ats 0", "bogus", "lsc 1"])
+
+    def test_short_reply_is_fast(self):
+        start = time.time()
+        for i in range(20):
+            ok, reply = self.engine.command("offset %s" % i)
+            self.assertTrue(ok)
+        self.assertLess(time.time() - start, 1.0)
+
+    def test_timeout(self):
+        self.fake.running = False
+        self.fake.thread.join()
+        results = self.engine.batch(["gain 1", "gain 2"])
+        self.assertEqual(results, [(False, None), (False, None)])
+
+
+class TestCobraSerial(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeCobraController().start()
+        self.dev = Cobra(com_port=self.fake.port_name)
+        self.assertEqual(self.dev.open_port(), 1)
+
+    def tearDown(self):
+        self.dev.close_port()
+        self.fake.stop()
+
+    def test_start_scan(self):
+        self.assertEqual(self.dev.start_scan(), 1)
+        self.assertEqual(self.fake.commands, ["init", "ats 0", "lsc 1"])
+        self.assertEqual(self.fake.settings, {"ats": 0, "lsc": 1})
+
+    def test_gain_offset(self):
+        self.assertEqual(self.dev.set_gain(100), 1)
+        self.assertEqual(self.dev.set_offset(20), 1)
+        self.assertEqual(self.fake.settings["gain"], 100)
+        self.assertEqual(self.fake.settings["offset"], 20)
+
+    def test_command_failure(self):
+        self.assertEqual(self.dev.write_command("gain x"), 0)
+
+    def test_open_write_close_keeps_port(self):
+        self.assertTrue(self.dev.open_write_close("gain 187"))
+        self.assertTrue(self.dev.open_write_close("gain 100"))
+        self.assertEqual(self.dev.session.connects, 1)
+
+    def test_reopen_invalidates(self):
+        self.dev.set_gain(100)
+        self.dev.close_port()
+        self.assertEqual(self.dev.open_port(), 1)
+        self.dev.set_gain(100)
+        self.assertEqual(self.fake.commands, ["gain 100", "gain 100"])
+
+    def test_connect_retry(self):
+        self.dev.close_port()
+        session = self.dev.serial_session()
+        session.backoff = 0.01
+        connect = session.connect
+        attempts = []
+
+        def busy_once():
+            attempts.append(1)
+            if len(attempts) == 1:
+                return False
+            return connect()
+
+        # a port that is briefly unavailable is retried with backoff
+        session.connect = busy_once
+        self.assertEqual(self.dev.set_gain(12), 1)
+        self.assertGreater(len(attempts), 1)
+        self.assertEqual(self.fake.settings["gain"], 12)
+        self.assertEqual(self.dev.instrument.counters["serial_reconnects"],
+                         1)
+
+    def test_cache_matches_device(self):
+        def sweep(gain):
+            for i in range(30):
+                self.assertEqual(self.dev.set_gain(gain), 1)
+
+        # a GUI thread and a sweep thread writing different gains
+        threads = [threading.Thread(target=sweep, args=(gain,))
+                   for gain in (5, 6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.dev.settings["gain"],
+                         str(self.fake.settings["gain"]))
+
+    def test_async_gain(self):
+        dev = AsyncSaperaCMD(self.dev)
+
+        async def run():
+            return [await dev.set_gain(55), await dev.set_offset(3),
+                    await dev.write_command("bogus")]
+
+        self.assertEqual(asyncio.run(run()), [1, 1, 0])
+        self.assertEqual(self.fake.settings["gain"], 55)
+
+    def test_async_shares_session(self):
+        dev = AsyncSaperaCMD(self.dev)
+
+        async def run():
+            # concurrent writes serialize on the session lock
+            return await asyncio.gather(*[dev.set_gain(gain)
+                                          for gain in (10, 20, 30)] +
+                                        [dev.set_offset(4)])
+
+        self.assertEqual(asyncio.run(run()), [1, 1, 1, 1])
+        self.assertEqual(sorted(self.fake.commands),
+                         ["gain 10", "gain 20", "gain 30", "offset 4"])
+        self.assertEqual(self.dev.set_offset(4), 1)
+        stats = self.dev.cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 4))
+        self.assertGreater(stats["serial_time"], 0)
+
+class TestSerialSession(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeCobraController().start()
+        self.session = SerialSession(self.fake.port_name, backoff=0.01)
+
+    def tearDown(self):
+        self.session.close()
+        self.fake.stop()
+
+    def test_stays_open(self):
+        for i in range(10):
+            ok, reply = self.session.command("gain %s" % i)
+            self.assertTrue(ok)
+        self.assertEqual(self.session.connects, 1)
+
+    def test_threads_do_not_interleave(self):
+        def sweep(name):
+            for i in range(20):
+                results = self.session.batch(["%s %s" % (name, i)] * 3)
+                self.assertTrue(all(ok for ok, reply in results))
+
+        threads = [threading.Thread(target=sweep, args=(name,))
+                   for name in ("gain", "offset")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # each batch of three arrives together
+        commands = self.fake.commands
+        self.assertEqual(len(commands), 120)
+        for i in range(0, 120, 3):
+            self.assertEqual(len(set(commands[i:i + 3])), 1)
+
+    def test_reconnect_after_error(self):
+        self.assertTrue(self.session.connect())
+        reconnects = []
+        self.session.on_connect = lambda: reconnects.append(1)
+
+        def broken(data):
+            raise serial.SerialException("cable pulled")
+        self.session.port.write = broken
+
+        ok, reply = self.session.command("gain 42")
+        self.assertTrue(ok)
+        self.assertEqual(self.session.connects, 2)
+        self.assertEqual(reconnects, [1])
+        self.assertEqual(self.fake.settings["gain"], 42)
+
+    def test_bad_port(self):
+        session = SerialSession("/dev/does-not-exist", retries=1,
+                                backoff=0.01)
+        self.assertRaises(serial.SerialException, session.command, "init")
+
+
+class TestSettingsCache(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeCobraController().start()
+        self.dev = Cobra(com_port=self.fake.port_name)
+        self.assertEqual(self.dev.open_port(), 1)
+
+    def tearDown(self):
+        self.dev.close_port()
+        self.fake.stop()
+
+    def test_repeated_gain_skipped(self):
+        for i in range(255):
+            self.assertEqual(self.dev.set_gain(100), 1)
+
+        self.assertEqual(self.fake.commands, ["gain 100"])
+        stats = self.dev.cache_stats()
+        self.assertEqual(stats["hits"], 254)
+        self.assertEqual(stats["misses"], 1)
+
+    def test_force(self):
+        self.dev.set_offset(5)
+        self.dev.set_offset(5, force=True)
+        self.assertEqual(self.fake.commands, ["offset 5", "offset 5"])
+
+    def test_init_invalidates(self):
+        self.dev.set_gain(100)
+        self.assertEqual(self.dev.start_scan(), 1)
+        self.assertEqual(self.dev.start_scan(), 1)
+        self.dev.set_gain(100)
+        self.assertEqual(self.fake.commands,
+                         ["gain 100", "init", "ats 0", "lsc 1", "gain 100"])
+
+    def test_failure_invalidates(self):
+        self.dev.set_gain(100)
+        self.assertEqual(self.dev.write_command("bogus"), 0)
+        self.dev.set_gain(100)
+        self.assertEqual(self.fake.commands.count("gain 100"), 2)
+
+    def test_raw_command_updates_cache(self):
+        self.dev.write_command("gain 187")
+        self.dev.set_gain(187)
+        self.assertEqual(self.fake.commands, ["gain 187"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -76,6 +76,14 @@ class TestSimulatedSLED(unittest.TestCase):
         self.assertTrue(self.dev.start_scan())
         self.assertTrue(self.dev.close_port())
 
+    def test_grab_many(self):
+        out = numpy.zeros((50, 2048), dtype=numpy.uint16)
+        result, data = self.dev.grab_many(50, out)
+        self.assertTrue(result)
+        self.assertIs(data, out)
+        self.assertGreater(data[:, 1024].min(), 2000)
+        self.assertFalse(numpy.array_equal(data[0], data[1]))
+
     def get_baseline(self, device, iterations=100):
         """ Helper function to get the average value of acquisitions.
         """
@@ -91,7 +99,8 @@ class TestSimulatedSLED(unittest.TestCase):
 class TestSimulatedSpectra(unittest.TestCase):
 
     def setUp(self):
-        self.dev = simulation.SimulatedSpectraDevice()
+        # Seeded so the pixel comparisons below cannot collide by chance
+        self.dev = simulation.SimulatedSpectraDevice(rng=7)
 
     def test_pipe_cycle(self):
         self.assertTrue(self.dev.setup_pipe())
@@ -122,6 +131,38 @@ class TestSimulatedSpectra(unittest.TestCase):
             self.assertNotEqual(data[100], data[-100])
 
 
+    def test_seeded_repeatable(self):
+        first = simulation.SimulatedSpectraDevice(rng=3)
+        second = simulation.SimulatedSpectraDevice(rng=3)
+        self.assertTrue(numpy.array_equal(first.base_data,
+                                          second.base_data))
+        self.assertTrue(numpy.array_equal(first.grab_pipe()[1],
+                                          second.grab_pipe()[1]))
+
+    def test_raman_peaks(self):
+        dev = simulation.SimulatedSpectraDevice(pixels=4096, raman_peaks=5,
+                                                peak_width=20, rng=1)
+        self.assertEqual(len(dev.base_data), 4096)
+        self.assertEqual(len(dev.grab_pipe()[1]), 4096)
+        # baseline is 100-200 counts, peaks climb above 500
+        self.assertGreater(dev.base_data.max(), 600)
+        self.assertGreater(numpy.sum(dev.base_data > 500), 20)
+
+    def test_grab_many(self):
+        result, data = self.dev.grab_many(100)
+        self.assertTrue(result)
+        self.assertEqual(data.shape, (100, 2048))
+        noise = data - self.dev.base_data.astype(int)
+        self.assertGreaterEqual(noise.min(), 49)
+        self.assertLess(noise.max(), 151)
+
+    def test_library(self):
+        library = self.dev.generate_library(500)
+        self.assertEqual(library.shape, (500, 2048))
+        self.assertFalse(numpy.array_equal(library[0], library[1]))
+        self.assertGreaterEqual(library.min(), 100)
+
+
 class TestSimulatedPipe(unittest.TestCase):
     
     def setUp(self):
@@ -159,5 +200,17 @@ class TestSimulatedPipe(unittest.TestCase):
         self.assertEqual(data[0], 0)
         self.assertEqual(data[1023], 1000)
 
+    def test_grab_many_matches_grab_pipe(self):
+        other = simulation.SimulatedPipeDevice()
+        for count in (10, 995, 2500):
+            result, data = self.dev.grab_many(count)
+            self.assertTrue(result)
+            self.assertEqual(data.shape, (count, 1024))
+            for i in range(count):
+                result, single = other.grab_pipe()
+                self.assertEqual(data[i][0], single[0])
+                self.assertEqual(data[i][1023], single[1023])
+        self.assertEqual(self.dev.pattern_position, other.pattern_position)
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,112 @@
+""" free running acquisition tests on the simulated devices and the
+stand-in grab console.
+"""
+
+import time
+import unittest
+
+from wasatchcameralink import simulation
+from wasatchcameralink.streaming import StreamBusyError
+from wasatchcameralink.DALSA import Cobra
+from wasatchcameralink.grabconsole import console_command
+
+
+class TestSimulatedStream(unittest.TestCase):
+
+    def setUp(self):
+        self.dev = simulation.SimulatedPipeDevice()
+        self.assertTrue(self.dev.setup_pipe())
+
+    def tearDown(self):
+        self.dev.stop_stream()
+
+    def test_start_stop(self):
+        self.assertFalse(self.dev.is_streaming())
+        self.assertTrue(self.dev.start_stream())
+        self.assertTrue(self.dev.is_streaming())
+        self.assertFalse(self.dev.start_stream())
+
+        self.assertTrue(self.dev.stop_stream())
+        self.assertFalse(self.dev.is_streaming())
+
+    def test_next_frame_sequence(self):
+        self.dev.start_stream()
+        first = self.dev.next_frame(timeout=5)
+        second = self.dev.next_frame(first.sequence, timeout=5)
+        self.assertGreater(second.sequence, first.sequence)
+        self.assertGreaterEqual(second.timestamp, first.timestamp)
+        self.assertEqual(len(second.data), 1024)
+
+        newest = self.dev.latest_frame()
+        self.assertGreaterEqual(newest.sequence, second.sequence)
+
+    def test_frames_iterator(self):
+        self.dev.start_stream()
+        sequences = []
+        for frame in self.dev.frames(timeout=5):
+            sequences.append(frame.sequence)
+            if len(sequences) == 10:
+                break
+
+        self.assertEqual(len(sequences), 10)
+        self.assertEqual(sequences, sorted(set(sequences)))
+
+    def test_callback(self):
+        received = []
+        self.dev.start_stream(received.append)
+        start = time.time()
+        while len(received) < 5 and time.time() - start < 5:
+            time.sleep(0.01)
+        self.dev.stop_stream()
+
+        self.assertGreaterEqual(len(received), 5)
+        self.assertEqual(received[0].sequence, 0)
+        self.assertEqual(received[4].sequence, 4)
+
+    def test_next_frame_after_stop(self):
+        self.dev.start_stream()
+        self.dev.stop_stream()
+        self.assertIsNone(self.dev.next_frame(timeout=5))
+
+
+class TestConsoleStream(unittest.TestCase):
+
+    def setUp(self):
+        self.dev = Cobra()
+        self.dev.console = console_command()
+        self.dev.command = "stream"
+        self.assertTrue(self.dev.setup_pipe())
+
+    def test_stream_then_grab(self):
+        self.dev.start_stream()
+        frames = []
+        for frame in self.dev.frames(timeout=5):
+            frames.append(frame)
+            if len(frames) == 20:
+                break
+        self.assertTrue(self.dev.stop_stream())
+        self.assertEqual(len(frames[-1].data), 2048)
+
+        # Pipe is back in lockstep after the stream drains
+        counter = self.dev.frame_count
+        result, data = self.dev.grab_pipe()
+        self.assertTrue(result)
+        self.assertEqual(self.dev.frame_count, counter + 1)
+
+        self.assertTrue(self.dev.close_pipe())
+
+    def test_direct_grab_while_streaming(self):
+        self.dev.start_stream()
+        self.assertIsNotNone(self.dev.next_frame(timeout=5))
+        self.assertRaises(StreamBusyError, self.dev.grab_pipe)
+        self.assertRaises(StreamBusyError, self.dev.grab_many, 2)
+        self.assertTrue(self.dev.stop_stream())
+
+        # the producer is gone and the pipe is back in lockstep
+        counter = self.dev.frame_count
+        self.assertTrue(self.dev.grab_pipe()[0])
+        self.assertEqual(self.dev.frame_count, counter + 1)
+        self.assertTrue(self.dev.close_pipe())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+""" simulated device timing model tests
+"""
+
+import time
+import asyncio
+import unittest
+
+from wasatchcameralink import aio
+from wasatchcameralink import simulation
+from wasatchcameralink.ringbuffer import FrameRingBuffer, DROP_OLDEST
+from wasatchcameralink.timing import TimingModel, MAX_SPEED, REAL_TIME
+
+
+class FakeClock(object):
+    """ Monotonic clock that only moves when slept on or advanced.
+    """
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestTimingModel(unittest.TestCase):
+
+    def real_time(self, **kwargs):
+        self.clock = FakeClock()
+        return TimingModel(mode=REAL_TIME, clock=self.clock,
+                           sleep=self.clock.sleep, **kwargs)
+
+    def test_period(self):
+        self.assertEqual(TimingModel().frame_period(), 0.0)
+        self.assertEqual(TimingModel(line_rate=1000).frame_period(), 0.001)
+        timing = TimingModel(line_rate=1000, lines=4, exposure=0.002)
+        self.assertEqual(timing.frame_period(), 0.004)
+        timing.exposure = 0.01
+        self.assertEqual(timing.frame_period(), 0.01)
+
+    def test_bad_mode(self):
+        self.assertRaises(ValueError, TimingModel, mode="slow")
+
+    def test_max_speed_never_sleeps(self):
+        slept = []
+        timing = TimingModel(line_rate=100, serial_latency=0.05,
+                             sleep=slept.append)
+        self.assertEqual(timing.mode, MAX_SPEED)
+        timing.wait_frames(10)
+        timing.wait_command(2)
+        self.assertEqual(slept, [])
+
+        stats = timing.stats()
+        self.assertEqual(stats["frames"], 10)
+        self.assertEqual(stats["commands"], 2)
+        self.assertAlmostEqual(stats["simulated_time"], 0.2)
+
+    def test_real_time_paces(self):
+        timing = self.real_time(line_rate=100)
+        timing.wait_frames()
+        timing.wait_frames(2)
+        self.assertEqual(len(self.clock.sleeps), 2)
+        self.assertAlmostEqual(self.clock.sleeps[0], 0.01)
+        self.assertAlmostEqual(self.clock.sleeps[1], 0.02)
+        self.assertAlmostEqual(timing.stats()["sleep_time"], 0.03)
+
+    def test_slow_consumer_not_refunded(self):
+        timing = self.real_time(line_rate=100)
+        timing.wait_frames()
+
+        # consumer busy for longer than a frame, the next frame still
+        # takes a full period from the trigger
+        self.clock.now += 0.05
+        timing.wait_frames()
+        self.assertAlmostEqual(self.clock.sleeps[-1], 0.01)
+        self.assertEqual(timing.stats()["idle_starts"], 2)
+
+    def test_jitter_and_stalls(self):
+        timing = TimingModel(line_rate=1000, jitter=0.0002,
+                             stall_probability=0.1, stall_time=0.5, rng=3)
+        durations, stalls = timing.frame_durations(1000)
+        self.assertTrue((durations >= 0).all())
+        self.assertGreater(stalls, 50)
+        self.assertLess(stalls, 150)
+        self.assertEqual((durations > 0.4).sum(), stalls)
+
+        timing.wait_frames(1000)
+        self.assertGreater(timing.stats()["stalls"], 50)
+
+    def test_seeded(self):
+        first = TimingModel(line_rate=1000, jitter=0.0002, rng=5)
+        second = TimingModel(line_rate=1000, jitter=0.0002, rng=5)
+        self.assertEqual(list(first.frame_durations(10)[0]),
+                         list(second.frame_durations(10)[0]))
+
+
+class TestPacedDevices(unittest.TestCase):
+
+    def test_devices_report_frames(self):
+        for dev_class in (simulation.SimulatedPipeDevice,
+                          simulation.SimulatedSpectraDevice,
+                          simulation.SimulatedCobraSLED):
+            timing = TimingModel(line_rate=1000, serial_latency=0.01)
+            dev = dev_class(timing=timing)
+            dev.setup_pipe()
+            self.assertTrue(dev.grab_pipe()[0])
+            self.assertTrue(dev.grab_many(4)[0])
+            dev.set_gain(10)
+            self.assertEqual(timing.stats()["frames"], 5)
+            self.assertEqual(timing.stats()["commands"], 1)
+
+    def test_sled_start_scan(self):
+        timing = TimingModel(serial_latency=0.01)
+        dev = simulation.SimulatedCobraSLED(timing=timing)
+        self.assertTrue(dev.start_scan())
+        self.assertAlmostEqual(timing.stats()["simulated_time"], 0.03)
+
+    def test_real_time_stream_backpressure(self):
+        timing = TimingModel(line_rate=500, mode=REAL_TIME)
+        dev = simulation.SimulatedCobraSLED(timing=timing)
+        ring = FrameRingBuffer.for_device(dev, 4, DROP_OLDEST)
+
+        start = time.monotonic()
+        dev.start_stream(ring.put_frame)
+        time.sleep(0.1)
+        dev.stop_stream()
+        elapsed = time.monotonic() - start
+
+        produced = ring.counters()["produced"]
+        self.assertLessEqual(produced, elapsed * 500 + 2)
+        self.assertGreater(produced, 10)
+        self.assertGreater(ring.counters()["dropped"], 0)
+
+    def test_async_real_time(self):
+        timing = TimingModel(line_rate=200, mode=REAL_TIME)
+        dev = aio.AsyncSimulatedDevice(
+            simulation.SimulatedCobraSLED(timing=timing))
+
+        async def run():
+            ticks = []
+
+            async def ticker():
+                for i in range(5):
+                    ticks.append(i)
+                    await asyncio.sleep(0.001)
+
+            task = asyncio.ensure_future(ticker())
+            result, data = await dev.grab()
+            await task
+            return result, ticks
+
+        result, ticks = asyncio.run(run())
+        self.assertTrue(result)
+        self.assertEqual(len(ticks), 5)
+        self.assertEqual(timing.stats()["frames"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+""" Acquisition timing model for the simulated devices. Each frame takes
+the longer of the exposure and the line readout, plus random jitter and
+an occasional stall. Serial commands take a fixed latency.
+
+In real time mode the calling thread sleeps on a monotonic clock until
+the frame would be ready, so consumers see hardware like pacing and
+back pressure. In max speed mode nothing sleeps and only the simulated
+clock advances.
+
+    timing = TimingModel(line_rate=5000, exposure=0.001, jitter=0.0001,
+                         mode=REAL_TIME)
+    dev = SimulatedCobraSLED(timing=timing)
+"""
+
+import time
+import numpy
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+MAX_SPEED = "max_speed"
+REAL_TIME = "real_time"
+
+
+class TimingModel(object):
+    """ Frame and serial command durations for one simulated device.
+    line_rate is in lines per second, all times are in seconds. rng is
+    a numpy Generator or a seed for a new one.
+    """
+    def __init__(self, line_rate=None, exposure=0.0, lines=1, jitter=0.0,
+                 stall_probability=0.0, stall_time=0.0, serial_latency=0.0,
+                 mode=MAX_SPEED, rng=None, clock=time.monotonic,
+                 sleep=time.sleep):
+        super(TimingModel, self).__init__()
+        if mode not in (MAX_SPEED, REAL_TIME):
+            raise ValueError("Unknown timing mode: %s" % mode)
+
+        self.line_rate = line_rate
+        self.exposure = exposure
+        self.lines = lines
+        self.jitter = jitter
+        self.stall_probability = stall_probability
+        self.stall_time = stall_time
+        self.serial_latency = serial_latency
+        self.mode = mode
+        self.clock = clock
+        self.sleep = sleep
+
+        if not isinstance(rng, numpy.random.Generator):
+            rng = numpy.random.default_rng(rng)
+        self.rng = rng
+
+        self.lock = threading.Lock()
+        self.deadline = None
+        self.reset()
+
+    def reset(self):
+        """ Clear the counters and the simulated clock.
+        """
+        with self.lock:
+            self.deadline = None
+            self.simulated_time = 0.0
+            self.frames = 0
+            self.commands = 0
+            self.stalls = 0
+            self.sleep_time = 0.0
+            # triggers that found the device already finished, the
+            # consumer was the bottleneck
+            self.idle_starts = 0
+
+    def frame_period(self):
+        """ Nominal frame time without jitter or stalls.
+        """
+        readout = 0.0
+        if self.line_rate:
+            readout = float(self.lines) / self.line_rate
+        return max(self.exposure, readout)
+
+    def frame_durations(self, count):
+        """ Return an array of count randomized frame times and the
+        number of stalls among them.
+        """
+        durations = numpy.full(count, self.frame_period())
+        if self.jitter:
+            durations += self.rng.normal(0.0, self.jitter, count)
+            numpy.maximum(durations, 0.0, out=durations)
+
+        stalls = 0
+        if self.stall_probability:
+            stalled = self.rng.random(count) < self.stall_probability
+            stalls = int(numpy.count_nonzero(stalled))
+            durations[stalled] += self.stall_time
+        return durations, stalls
+
+    def advance(self, duration):
+        """ Account for duration seconds of device time. In real time
+        mode wait until the device would be done. The device starts when
+        it is triggered or when its previous work finishes, whichever is
+        later, so time spent by a slow consumer is not handed back.
+        """
+        with self.lock:
+            self.simulated_time += duration
+            if self.mode != REAL_TIME:
+                return
+
+            now = self.clock()
+            if self.deadline is None or self.deadline < now:
+                self.idle_starts += 1
+                self.deadline = now
+            self.deadline += duration
+            deadline = self.deadline
+
+        remaining = deadline - self.clock()
+        if remaining > 0:
+            self.sleep(remaining)
+            with self.lock:
+                self.sleep_time += remaining
+
+    def wait_frames(self, count=1):
+        """ Block or advance the simulated clock for count frames.
+        Return the total frame time.
+        """
+        if count <= 0:
+            return 0.0
+        durations, stalls = self.frame_durations(count)
+        total = float(durations.sum())
+        with self.lock:
+            self.frames += count
+            self.stalls += stalls
+        if stalls:
+            log.debug("%s stalled frames", stalls)
+        self.advance(total)
+        return total
+
+    def wait_command(self, count=1):
+        """ Block or advance the simulated clock for count serial
+        commands.
+        """
+        total = self.serial_latency * count
+        with self.lock:
+            self.commands += count
+        self.advance(total)
+        return total
+
+    def stats(self):
+        with self.lock:
+            return {"mode": self.mode,
+                    "frames": self.frames,
+                    "commands": self.commands,
+                    "stalls": self.stalls,
+                    "simulated_time": self.simulated_time,
+                    "sleep_time": self.sleep_time,
+                    "idle_starts": self.idle_starts}